@@ -1,14 +1,14 @@
+import asyncio
+from typing import Optional, Union, Sequence
 
-from typing import Any, Optional, Union, Sequence
-
-from loguru import logger
-
-
-from agentscope.exception import ResponseParsingError, FunctionCallError
 from agentscope.agents import AgentBase
 from agentscope.message import Msg
+from agentscope.models import ModelWrapperBase
 
 from parsers import JsonParser, QueryParser
+from instrumentation import tracer, record_model_io
+from structure.QueryMemory import QueryResultStore, query_store as default_query_store
+from structure.MemoryCompactor import chat_compactor
 
 class ChatAgent(AgentBase):
     """A simple agent used to perform a dialogue. You can set its role via
@@ -22,6 +22,9 @@ class ChatAgent(AgentBase):
         model_config_name: str,
         use_memory: bool = True,
         memory_config: Optional[dict] = None,
+        query_store: Optional[QueryResultStore] = None,
+        token_budget: Optional[int] = None,
+        model: Optional[ModelWrapperBase] = None,
     ) -> None:
         """Initialize the dialog agent.
 
@@ -38,14 +41,29 @@ class ChatAgent(AgentBase):
                 Whether the agent has memory.
             memory_config (`Optional[dict]`):
                 The config of memory.
+            query_store (`Optional[QueryResultStore]`):
+                Results of earlier planning rounds, used to resolve
+                placeholders the current query result does not contain.
+                Defaults to the process-wide store.
+            token_budget (`Optional[int]`):
+                Token budget of each prompt. Older tool results are
+                compacted to `query_id` references and the oldest messages
+                dropped to stay within it. Defaults to `CHAT_TOKEN_BUDGET`.
+            model (`Optional[ModelWrapperBase]`):
+                An already loaded model to use instead of loading one from
+                `model_config_name`, e.g. one shared by many sessions.
         """
         super().__init__(
             name=name,
             sys_prompt=sys_prompt,
-            model_config_name=model_config_name,
+            model_config_name=model_config_name if model is None else None,
             use_memory=use_memory,
             memory_config=memory_config,
         )
+        if model is not None:
+            self.model = model
+        self.query_store = query_store if query_store is not None else default_query_store
+        self.compactor = chat_compactor(token_budget)
 
 
     def reply(self, x: Optional[Union[Msg, Sequence[Msg]]] = None, query: Optional[Union[Msg, Sequence[Msg]]] = None) -> Msg:
@@ -62,6 +80,29 @@ class ChatAgent(AgentBase):
         Returns:
             `Msg`: The output message generated by the agent.
         """
+        with tracer.span("chat.reply", agent=self.name):
+            prompt, query_json = self._prepare_prompt(x, query)
+
+            # call llm and generate response
+            with tracer.span("model", agent=self.name) as span:
+                response = self.model(prompt)
+                record_model_io(span, prompt, response)
+
+            return self._handle_response(response.text, query_json)
+
+    async def areply(self, x: Optional[Union[Msg, Sequence[Msg]]] = None, query: Optional[Union[Msg, Sequence[Msg]]] = None) -> Msg:
+        """Asynchronous counterpart of `reply`. The blocking model call runs
+        in a worker thread so other coroutines keep making progress."""
+        with tracer.span("chat.reply", agent=self.name):
+            prompt, query_json = self._prepare_prompt(x, query)
+
+            with tracer.span("model", agent=self.name) as span:
+                response = await asyncio.to_thread(self.model, prompt)
+                record_model_io(span, prompt, response)
+
+            return self._handle_response(response.text, query_json)
+
+    def _prepare_prompt(self, x, query):
         # record the input if needed
 
         query_json = ""
@@ -70,21 +111,38 @@ class ChatAgent(AgentBase):
             self.memory.add(x)
 
         if query is not None:
-            query_result = query.content
-            query_json = QueryParser.extract_results(query_result)
+            query_json = self._query_results(query)
 
         # prepare prompt
-        prompt = self.model.format(
-            Msg("system", self.sys_prompt, role="system"),
-            self.memory
-            and self.memory.get_memory()
-            or x,  # type: ignore[arg-type]
-        )
-
-        # call llm and generate response
-        response = self.model(prompt).text
-
-        response = JsonParser.parse_json(query_json, response)
+        system = Msg("system", self.sys_prompt, role="system")
+        if self.memory:
+            prompt = self.model.format(self.compactor.compact([system] + self.memory.get_memory()))
+        else:
+            prompt = self.model.format(system, x)  # type: ignore[arg-type]
+        return prompt, query_json
+
+    @staticmethod
+    def _query_results(query):
+        # QueryAgent attaches the decoded tool results to its message
+        metadata = getattr(query, "metadata", None)
+        if isinstance(metadata, dict) and "results" in metadata:
+            return metadata["results"]
+
+        # Fall back to parsing the "[RESULT]: ..." text of other messages
+        with tracer.span("parser.extract_results"):
+            return QueryParser.extract_results(query.content)
+
+    def _handle_response(self, response, query_json):
+        # Placeholders from earlier rounds resolve from the result store
+        known = {data.get("query_id") for data in query_json} if query_json else set()
+        earlier = self.query_store.resolve(response, exclude=known)
+        if earlier:
+            query_json = list(query_json or []) + earlier
+
+        with tracer.span("parser.parse_json") as span:
+            response = JsonParser.parse_json(query_json, response)
+            if span:
+                span.set(output_chars=len(response))
 
         msg = Msg(self.name, response, role="assistant")
 
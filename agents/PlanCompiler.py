@@ -0,0 +1,353 @@
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from parsers.JsonParser import PLACEHOLDER
+from structure.QueryMemory import QueryResultStore
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# The date the agents treat as today (see QUERY_PROMPT)
+TODAY = "2024-05-27"
+
+STEP = re.compile(r"^\s*(\d+)[.)]\s+(.+)$")
+TIMESTAMP = re.compile(r"\b(\d{4}-\d{2}-\d{2})[ T](\d{1,2}:\d{2}(?::\d{2})?)\b")
+DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+CLOCK_RANGE = re.compile(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\s*(?:-|–|~|to|until)\s*(\d{1,2}:\d{2}(?::\d{2})?)\b")
+SEGMENTS = re.compile(r"\b(\d+)\s*(?:segments?|intervals?|parts?|buckets?|periods?)\b")
+# An explicit id list ("ids: [4801, 4806]", "event ids 4801 and 4806"); a
+# number running into "-" or ":" is part of a date or time, not an id
+_ID = r"\d{3,}(?![\d:\-])"
+EVENT_IDS = re.compile(
+    rf"\b(?:event[ _])?ids?\s*[:=#]?\s*\[?\s*({_ID}(?:\s*(?:,|and|,\s*and)\s*{_ID})*)",
+    re.IGNORECASE,
+)
+DAY = re.compile(r"\b(\d{4}-\d{2}-\d{2}|today|yesterday)\b", re.IGNORECASE)
+# A bracketed reference to earlier results ("[query_id]", "[leave_records_id]")
+REFERENCE = re.compile(r"\[[^\]]*\]")
+STEP_REF = re.compile(r"\b(?:step|query|item)\s*(\d+)\b", re.IGNORECASE)
+# Time phrases the compiler does not resolve: relative ranges, 12-hour
+# clocks, weekdays and month names. A step using one is left to the model.
+UNPARSED_TIME = re.compile(
+    r"\b(?:last|past|previous|recent|ago|since|onwards?|before|after|earlier|later|until|till|"
+    r"tomorrow|tonight|noon|midnight|now|week|weekend|month|year|minutes?|seconds?|"
+    r"a\.?m\.?|p\.?m\.?|"
+    r"mon(?:day)?|tue(?:s|sday)?|wed(?:nesday)?|thu(?:rs|rsday)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?|"
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+    r"sep(?:t|tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b",
+    re.IGNORECASE,
+)
+
+PERIODS = {
+    "morning": ("06:00:00", "11:59:59"),
+    "afternoon": ("12:00:00", "17:59:59"),
+    "evening": ("18:00:00", "23:59:59"),
+}
+
+# Words that name each kind of data
+IMAGE_WORDS = ("image", "picture", "photo", "snapshot")
+FLOW_WORDS = ("passenger", "flow", "visitor", "customer", "footfall", "traffic")
+DISTRIBUTION_WORDS = ("distribution", "distributed", "breakdown")
+INTRUSION_WORDS = ("intrusion", "alarm", "event")
+LEAVE_WORDS = ("leave-post", "leave post", "leave record", "left the post", "left post", "off-post", "off post", "absence", "absent")
+
+# Numbered lines that need no query of their own, unless they also name
+# data or a time
+ANALYSIS_WORDS = ("analy", "compar", "correlat", "summar", "report", "present", "explain", "conclu")
+
+
+class PlanStep:
+    """One numbered step of a Planner message.
+
+    Args:
+        number (int): the step's number in the plan
+        text (str): the step's text, without the number
+        call (dict): the tool call `{"name": ..., "arguments": {...}}`, or
+            None when the step needs no query (e.g. "analyze ...")
+        after (int): number of the intrusion-events step whose event ids
+            complete `call`'s `ids`, or None
+    """
+
+    __slots__ = ("number", "text", "call", "after")
+
+    def __init__(self, number: int, text: str, call: Optional[Dict[str, Any]], after: Optional[int] = None) -> None:
+        self.number = number
+        self.text = text
+        self.call = call
+        self.after = after
+
+    def __repr__(self) -> str:
+        return f"PlanStep({self.number}, {self.call!r}, after={self.after})"
+
+
+def _day(word: str, today: str) -> str:
+    word = word.lower()
+    if word == "yesterday":
+        return (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    return today if word == "today" else word
+
+
+def _clock(value: str) -> str:
+    parts = value.split(":")
+    hour, minute = int(parts[0]), int(parts[1])
+    second = int(parts[2]) if len(parts) > 2 else 0
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError(value)
+    return f"{hour:02d}:{minute:02d}:{second:02d}"
+
+
+def _check_understood(text: str) -> None:
+    """Raise ValueError when `text` says more about time than full
+    timestamps, ISO dates, "today"/"yesterday", HH:MM ranges and
+    morning/afternoon/evening, which is all `time_ranges` resolves."""
+    match = UNPARSED_TIME.search(text)
+    if match:
+        raise ValueError(f"unsupported time phrase {match.group(0)!r}")
+    # Any number left besides dates, clock ranges, segment counts and step
+    # references is a time the compiler cannot place (e.g. "from 9 to 11")
+    rest = text
+    for pattern in (DATE, CLOCK_RANGE, SEGMENTS, STEP_REF):
+        rest = pattern.sub(" ", rest)
+    if re.search(r"\d", rest):
+        raise ValueError(f"unsupported time in {text!r}")
+
+
+def _names_time(text: str) -> bool:
+    return bool(
+        DATE.search(text) or re.search(r"\d{1,2}:\d{2}", text) or UNPARSED_TIME.search(text)
+        or re.search(r"\b(?:today|yesterday|%s)\b" % "|".join(PERIODS), text, re.IGNORECASE)
+    )
+
+
+def _names_data(text: str) -> bool:
+    return any(mentions(text, words) for words in (IMAGE_WORDS, FLOW_WORDS, INTRUSION_WORDS, LEAVE_WORDS)) or _names_time(text)
+
+
+def time_ranges(text: str, today: str = TODAY) -> List[Tuple[str, str]]:
+    """Time ranges named in a plan step, as ("YYYY-MM-DD hh:mm:ss", ...)
+    pairs; the whole of `today` when the step names no time at all.
+
+    A step naming several days gets each clock range on the day written
+    next to it ("on 2024-05-27 from 08:00 to 10:00 and on 2024-05-26 from
+    09:00 to 11:00"), or each whole day (or period) when it names no clock
+    ranges ("today and yesterday").
+
+    Raises:
+        ValueError: the times are malformed, unpaired or out of order, the
+            clock ranges cannot be paired with the days, or the step names
+            a time the compiler does not understand
+    """
+    lowered = text.lower()
+    stamps = TIMESTAMP.findall(text)
+    if stamps:
+        if len(stamps) % 2:
+            raise ValueError(f"unpaired timestamp in {text!r}")
+        rest = TIMESTAMP.sub(" ", text)
+        if DAY.search(rest) or CLOCK_RANGE.search(rest):
+            raise ValueError(f"timestamps mixed with other times in {text!r}")
+        points = [f"{date} {_clock(clock)}" for date, clock in stamps]
+        ranges = list(zip(points[::2], points[1::2]))
+    else:
+        _check_understood(text)
+        days = [(match.start(), _day(match.group(1), today)) for match in DAY.finditer(text)]
+        clocks = [(match.start(), (_clock(match.group(1)), _clock(match.group(2)))) for match in CLOCK_RANGE.finditer(text)]
+        periods = [span for name, span in PERIODS.items() if name in lowered]
+        if len(periods) > 1:
+            raise ValueError(f"several periods of the day in {text!r}")
+        if len({day for _, day in days}) <= 1:
+            day = days[0][1] if days else today
+            spans = [span for _, span in clocks] or periods or [("00:00:00", "23:59:59")]
+            ranges = [(f"{day} {start}", f"{day} {end}") for start, end in spans]
+        elif clocks:
+            ranges = [(f"{day} {start}", f"{day} {end}") for day, (start, end) in _paired(days, clocks)]
+        else:
+            start, end = periods[0] if periods else ("00:00:00", "23:59:59")
+            ranges = [(f"{day} {start}", f"{day} {end}") for day in dict.fromkeys(day for _, day in days)]
+    for start, end in ranges:
+        if datetime.strptime(start, TIME_FORMAT) > datetime.strptime(end, TIME_FORMAT):
+            raise ValueError(f"range ends before it starts: {start} - {end}")
+    return ranges
+
+
+def _paired(days: List[Tuple[int, str]], clocks: List[Tuple[int, Any]]) -> List[Tuple[str, Any]]:
+    """Each clock range with its day, when days and clock ranges alternate
+    one to one in the text (either may come first)."""
+    if len(days) != len(clocks):
+        raise ValueError("clock ranges cannot be paired with the days")
+    kinds = [kind for _, kind in sorted([(pos, "day") for pos, _ in days] + [(pos, "clock") for pos, _ in clocks])]
+    if any(a == b for a, b in zip(kinds, kinds[1:])):
+        raise ValueError("clock ranges cannot be paired with the days")
+    return [(day, clock) for (_, day), (_, clock) in zip(days, clocks)]
+
+
+def hourly_ranges(start: str, end: str) -> List[Tuple[str, str]]:
+    """Split a range into whole hours; the last one may be shorter."""
+    begin, finish = datetime.strptime(start, TIME_FORMAT), datetime.strptime(end, TIME_FORMAT)
+    ranges = []
+    while begin <= finish:
+        stop = min(begin + timedelta(hours=1) - timedelta(seconds=1), finish)
+        ranges.append((begin.strftime(TIME_FORMAT), stop.strftime(TIME_FORMAT)))
+        begin = stop + timedelta(seconds=1)
+    return ranges
+
+
+def is_hourly(text: str) -> bool:
+    return any(word in text for word in ("hourly", "per hour", "each hour", "by hour", "every hour"))
+
+
+def mentions(text: str, words: Sequence[str]) -> bool:
+    return any(word in text for word in words)
+
+
+def _event_ids(text: str, store: Optional[QueryResultStore]) -> List[int]:
+    ids = []
+    for group in EVENT_IDS.findall(text):
+        ids.extend(int(value) for value in re.findall(r"\d{3,}", group))
+    if store is not None:
+        # Events of an earlier round referenced as [query_id]
+        for match in PLACEHOLDER.finditer(text):
+            record = store.get(match.group(1))
+            if record is not None and record.query_type == "intrusion_events_in_time_range":
+                ids.extend(int(event["id"]) for event in record.data.get("events", ()))
+    return list(dict.fromkeys(ids))
+
+
+def compile_step(
+    number: int,
+    text: str,
+    events_step: Optional[int] = None,
+    today: str = TODAY,
+    store: Optional[QueryResultStore] = None,
+    events_ranges: Optional[Dict[int, Tuple[str, str]]] = None,
+) -> PlanStep:
+    """Compile one plan step into a tool call.
+
+    Args:
+        events_step (int): number of an earlier intrusion-events step, used
+            by image steps that name no event ids
+        events_ranges (dict): time range of each earlier intrusion-events
+            step, by step number; an image step naming a time must name
+            the range of the step it takes the events of
+
+    Raises:
+        ValueError: the step asks for data but is ambiguous or incomplete
+    """
+    lowered = text.lower()
+    image = mentions(lowered, IMAGE_WORDS)
+    flow = mentions(lowered, FLOW_WORDS)
+    distribution = mentions(lowered, DISTRIBUTION_WORDS)
+    intrusion = mentions(lowered, INTRUSION_WORDS)
+    leave = mentions(lowered, LEAVE_WORDS)
+    if mentions(lowered, ANALYSIS_WORDS) and not _names_data(REFERENCE.sub(" ", lowered)):
+        # "Summarize the results", "analyze [leave_id] and [events_id]":
+        # nothing to fetch. A step that also names data or a time ("compare
+        # the flow of today and yesterday") may need a query and is
+        # compiled like any other.
+        return PlanStep(number, text, None)
+
+    if image:
+        if flow or leave:
+            raise ValueError("image step also names other data")
+        ids = _event_ids(text, store)
+        if ids:
+            if len(ids) == 1:
+                return PlanStep(number, text, {"name": "InvaseAlarmPictureQuery", "arguments": {"id": str(ids[0])}})
+            return PlanStep(number, text, {"name": "MultiInvaseAlarmPictureQuery", "arguments": {"ids": ids}})
+        reference = STEP_REF.search(text)
+        after = int(reference.group(1)) if reference else events_step
+        if after is None:
+            raise ValueError("image step without event ids")
+        if after >= number:
+            raise ValueError("image step refers to a later step")
+        if _names_time(text):
+            # Images of only some of the events (e.g. "from 10:00 onwards")
+            # are left to the model; restating the events' range is fine
+            if time_ranges(text, today) != [(events_ranges or {}).get(after)]:
+                raise ValueError("image step selects events by time")
+        return PlanStep(number, text, {"name": "MultiInvaseAlarmPictureQuery", "arguments": {"ids": []}}, after=after)
+
+    kinds = [kind for kind, named in (("flow", flow), ("intrusion", intrusion), ("leave", leave)) if named]
+    if not kinds:
+        raise ValueError("no known query type")
+    if len(kinds) > 1:
+        raise ValueError(f"step names several query types: {kinds}")
+
+    if STEP_REF.search(text):
+        # E.g. "analyze the events of step 1": works on another step's data
+        raise ValueError("step refers to another step")
+    ranges = time_ranges(text, today)
+    kind = kinds[0]
+    if kind == "flow" and distribution:
+        if len(ranges) != 1:
+            raise ValueError("distribution over several ranges")
+        start, end = ranges[0]
+        segments = SEGMENTS.search(lowered)
+        if segments:
+            count = int(segments.group(1))
+        elif is_hourly(lowered):
+            count = len(hourly_ranges(start, end))
+        else:
+            raise ValueError("distribution without a segment count")
+        if count < 1:
+            raise ValueError("segment count must be positive")
+        return PlanStep(number, text, {
+            "name": "FlowDistribution",
+            "arguments": {"time_range": f"{start} - {end}", "num_segments": str(count)},
+        })
+    if kind == "flow":
+        if is_hourly(lowered) and len(ranges) == 1:
+            ranges = hourly_ranges(*ranges[0])
+        return PlanStep(number, text, {
+            "name": "FlowQuery",
+            "arguments": {"time_ranges": ",".join(f"{start} - {end}" for start, end in ranges)},
+        })
+    if len(ranges) != 1:
+        raise ValueError("several ranges for a single-range query")
+    start, end = ranges[0]
+    name = "InvaseAlarmEventsQuery" if kind == "intrusion" else "LeaveRecordsQuery"
+    return PlanStep(number, text, {"name": name, "arguments": {"start_time": start, "end_time": end}})
+
+
+def compile_plan(
+    text: str,
+    today: str = TODAY,
+    store: Optional[QueryResultStore] = None,
+) -> Tuple[List[PlanStep], List[str]]:
+    """Compile the numbered steps of a Planner message.
+
+    Lines after an "Appendix" heading are not steps. Steps that need no
+    query are compiled with `call=None`.
+
+    Returns:
+        tuple: `(compiled, left)`, the compiled steps and the original lines
+            of the steps that could not be compiled
+    """
+    compiled: List[PlanStep] = []
+    left: List[str] = []
+    events_step = None
+    events_ranges: Dict[int, Tuple[str, str]] = {}
+    for line in text.splitlines():
+        if "appendix" in line.lower():
+            break
+        match = STEP.match(line)
+        if match is None:
+            continue
+        number, body = int(match.group(1)), match.group(2)
+        try:
+            step = compile_step(number, body, events_step, today, store, events_ranges)
+        except ValueError:
+            left.append(line.strip())
+            continue
+        if step.call is not None and step.call["name"] == "InvaseAlarmEventsQuery":
+            events_step = number
+            arguments = step.call["arguments"]
+            events_ranges[number] = (arguments["start_time"], arguments["end_time"])
+        compiled.append(step)
+
+    # An image step whose events step was not compiled cannot run either
+    numbers = {step.number for step in compiled if step.call is not None}
+    for step in list(compiled):
+        if step.after is not None and step.after not in numbers:
+            compiled.remove(step)
+            left.append(f"{step.number}. {step.text}")
+    return compiled, left
@@ -0,0 +1,216 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Set
+
+from loguru import logger
+
+from agentscope.service import ServiceExecStatus, ServiceToolkit
+
+from agents.PlanCompiler import (
+    DISTRIBUTION_WORDS,
+    FLOW_WORDS,
+    IMAGE_WORDS,
+    INTRUSION_WORDS,
+    LEAVE_WORDS,
+    SEGMENTS,
+    TODAY,
+    hourly_ranges,
+    is_hourly,
+    mentions,
+    time_ranges,
+)
+from agents.ToolExecutor import decode_result
+from instrumentation import tracer
+from tools.ToolCache import ToolCache, tool_cache
+
+
+class Prefetcher:
+    """Runs the tool queries a plan is likely to need while the Planner and
+    QueryAgent models are still thinking.
+
+    Calls are predicted from the newest user question that names any data:
+    passenger flow, intrusion events (with their images when asked for) or
+    leave-post records, over the time range the question names or today.
+    A question naming nothing predicts today's flow, leave-post records and
+    intrusion events. Results are registered with the tool cache as
+    speculative: a tool call with the same arguments takes them over, and
+    `discard` gives up the rest this prefetcher owns once the plan has run.
+    A call another session's prefetcher already started is shared rather
+    than run twice, and stays until both have discarded it.
+
+    Args:
+        service_toolkit (ServiceToolkit): toolkit holding the cached tools
+        cache (ToolCache): cache the tools read from
+        max_workers (int): background threads; defaults to `PREFETCH_WORKERS` or 2
+        ttl (float): seconds a speculative result stays usable; defaults to
+            `PREFETCH_TTL` or 30
+        enabled (bool): defaults to `PREFETCH`, on unless set to 0
+        executor (ThreadPoolExecutor): pool to run the calls in, e.g. one
+            shared by the prefetchers of several sessions; a private one
+            with `max_workers` threads is created if omitted
+    """
+
+    def __init__(
+        self,
+        service_toolkit: ServiceToolkit,
+        cache: ToolCache = tool_cache,
+        max_workers: Optional[int] = None,
+        ttl: Optional[float] = None,
+        enabled: Optional[bool] = None,
+        today: str = TODAY,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> None:
+        self.service_toolkit = service_toolkit
+        self.cache = cache
+        self.ttl = ttl if ttl is not None else float(os.getenv("PREFETCH_TTL", "30"))
+        self.enabled = enabled if enabled is not None else os.getenv("PREFETCH", "1") == "1"
+        self.today = today
+        self._owns_pool = executor is None
+        self._pool = executor or ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("PREFETCH_WORKERS", "2")),
+            thread_name_prefix="prefetch",
+        )
+        # Keys of the speculative calls this prefetcher owns; `discard`
+        # gives up only these, and a call another session's prefetcher
+        # also owns stays until that one discards it too
+        self._keys: Set[Hashable] = set()
+        self._lock = threading.Lock()
+
+    def predict(self, questions: Sequence[str]) -> List[Dict[str, Any]]:
+        """Tool calls for the newest question in `questions` naming any data.
+        An intrusion-events call with `then_images` set is followed by a
+        call for the images of the events it finds."""
+        for question in reversed(questions):
+            calls = self._calls_for(question)
+            if calls:
+                return calls
+        day = (f"{self.today} 00:00:00", f"{self.today} 23:59:59")
+        return [
+            {"name": "FlowQuery", "arguments": {"time_ranges": f"{day[0]} - {day[1]}"}},
+            {"name": "LeaveRecordsQuery", "arguments": {"start_time": day[0], "end_time": day[1]}},
+            {"name": "InvaseAlarmEventsQuery", "arguments": {"start_time": day[0], "end_time": day[1]}},
+        ]
+
+    def start(self, questions: Sequence[str]) -> List[Dict[str, Any]]:
+        """Start the predicted calls in the background. Returns the calls
+        started; those already cached or in flight are skipped."""
+        if not self.enabled or not self.cache.enabled:
+            return []
+        started = []
+        for call in self.predict(questions):
+            if self._submit(call) is not None:
+                started.append(call)
+        if started:
+            logger.info(f"Prefetching {[call['name'] for call in started]}")
+        return started
+
+    def discard(self) -> int:
+        """Give up the speculative results this prefetcher owns that no
+        tool call has taken over; those no other prefetcher owns are
+        dropped."""
+        with self._lock:
+            keys, self._keys = self._keys, set()
+        dropped = self.cache.discard_speculative(keys, owner=self)
+        if dropped:
+            logger.info(f"Discarded {dropped} unused prefetched result(s)")
+        return dropped
+
+    def shutdown(self) -> None:
+        self.discard()
+        if self._owns_pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _calls_for(self, question: str) -> List[Dict[str, Any]]:
+        text = question.lower()
+        images = mentions(text, IMAGE_WORDS)
+        flow = mentions(text, FLOW_WORDS)
+        events = images or mentions(text, INTRUSION_WORDS)
+        leave = mentions(text, LEAVE_WORDS)
+        if not (flow or events or leave):
+            return []
+        try:
+            ranges = time_ranges(question, self.today)
+        except ValueError:
+            ranges = [(f"{self.today} 00:00:00", f"{self.today} 23:59:59")]
+        start, end = ranges[0]
+
+        calls = []
+        if flow and mentions(text, DISTRIBUTION_WORDS):
+            segments = SEGMENTS.search(text)
+            if segments:
+                count = int(segments.group(1))
+            else:
+                count = len(hourly_ranges(start, end)) if is_hourly(text) else None
+            if count:
+                calls.append({
+                    "name": "FlowDistribution",
+                    "arguments": {"time_range": f"{start} - {end}", "num_segments": str(count)},
+                })
+        elif flow:
+            if is_hourly(text) and len(ranges) == 1:
+                ranges = hourly_ranges(start, end)
+            calls.append({
+                "name": "FlowQuery",
+                "arguments": {"time_ranges": ",".join(f"{a} - {b}" for a, b in ranges)},
+            })
+        if leave:
+            calls.append({"name": "LeaveRecordsQuery", "arguments": {"start_time": start, "end_time": end}})
+        if events:
+            calls.append({
+                "name": "InvaseAlarmEventsQuery",
+                "arguments": {"start_time": start, "end_time": end},
+                "then_images": images,
+            })
+        return calls
+
+    def _submit(self, call: Dict[str, Any]) -> Optional[Future]:
+        service_func = self.service_toolkit.service_funcs.get(call["name"])
+        func = getattr(service_func, "original_func", None)
+        if func is None or not hasattr(func, "key_of"):
+            return None
+        try:
+            key = func.key_of(**call["arguments"])
+        except Exception:
+            return None
+        if self.cache.get(key) is not None:
+            return None
+
+        context = contextvars.copy_context()
+        try:
+            future, started = self.cache.speculate(
+                key,
+                lambda: self._pool.submit(context.run, self._run, call["name"], func.__wrapped__, call["arguments"]),
+                self.ttl,
+                owner=self,
+            )
+        except RuntimeError:  # shut down
+            return None
+        with self._lock:
+            self._keys.add(key)
+        if call.get("then_images"):
+            future.add_done_callback(self._images_after)
+        # Not started when already in flight, e.g. for another session
+        return future if started else None
+
+    def _images_after(self, future: Future) -> None:
+        # The images of the events just found are the likely next query
+        if future.cancelled() or future.exception() is not None:
+            return
+        response = future.result()
+        if response.status != ServiceExecStatus.SUCCESS:
+            return
+        try:
+            ids = [event["id"] for event in decode_result(response.content).get("events", ())]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return
+        if ids:
+            self._submit({"name": "MultiInvaseAlarmPictureQuery", "arguments": {"ids": ids}})
+
+    @staticmethod
+    def _run(name: str, func: Callable, arguments: Dict[str, Any]) -> Any:
+        with tracer.span("prefetch", tool=name) as span:
+            response = func(**arguments)
+            span.set(status=str(response.status))
+            return response
@@ -1,20 +1,24 @@
-
-from typing import Any, Optional, Union, Sequence
+import asyncio
+import json
+import os
+from typing import Any, List, Optional, Tuple, Union, Sequence
 
 from loguru import logger
 
-
 from agentscope.exception import ResponseParsingError, FunctionCallError
 from agentscope.agents import AgentBase
 from agentscope.message import Msg
+from agentscope.models import ModelWrapperBase
 from agentscope.parsers import MarkdownJsonDictParser
 from agentscope.service import ServiceToolkit
-from agentscope.service.service_toolkit import ServiceFunction
-
 
-
-
-import json
+from connection import db
+from agents.ToolExecutor import ConcurrentToolExecutor, order_tool_arguments
+from agents.PlanCompiler import PlanStep, compile_plan
+from structure.QueryMemory import QueryResultStore, query_store as default_query_store
+from structure.MemoryCompactor import estimate_tokens, query_compactor
+from tools.ResultCodec import format_note
+from instrumentation import tracer, record_model_io
 
 INSTRUCTION_PROMPT = """## What You Should Do:
 1. First, analyze the current situation, and determine your goal.
@@ -72,6 +76,10 @@ class QueryAgent(AgentBase):
         sys_prompt: str = "You're a helpful assistant. Your name is {name}.",
         max_iters: int = 10,
         verbose: bool = True,
+        tool_executor: Optional[ConcurrentToolExecutor] = None,
+        query_store: Optional[QueryResultStore] = None,
+        token_budget: Optional[int] = None,
+        model: Optional[ModelWrapperBase] = None,
         **kwargs: Any,
     ) -> None:
         """Initialize the ReAct agent with the given name, model config name
@@ -93,18 +101,41 @@ class QueryAgent(AgentBase):
                 Whether to print the detailed information during reasoning and
                 acting steps. If `False`, only the content in speak field will
                 be print out.
+            tool_executor (`Optional[ConcurrentToolExecutor]`):
+                Executor that runs the tool calls of one iteration
+                concurrently. Share one across agents to bound the total
+                number of tool threads; a private one is created if omitted.
+            query_store (`Optional[QueryResultStore]`):
+                Where tool results are kept for later rounds. Defaults to
+                the process-wide store.
+            token_budget (`Optional[int]`):
+                Token budget of each prompt. Results of earlier iterations
+                are compacted to `query_id` references (keeping record ids)
+                and old messages dropped to stay within it. Defaults to
+                `QUERY_TOKEN_BUDGET`.
+            model (`Optional[ModelWrapperBase]`):
+                An already loaded model to use instead of loading one from
+                `model_config_name`, e.g. one shared by many sessions.
         """
         super().__init__(
             name=name,
             sys_prompt=sys_prompt,
-            model_config_name=model_config_name,
+            model_config_name=model_config_name if model is None else None,
         )
+        if model is not None:
+            self.model = model
 
         self.service_toolkit = service_toolkit
+        self.tool_executor = tool_executor or ConcurrentToolExecutor(service_toolkit)
+        self.query_store = query_store if query_store is not None else default_query_store
+        self.compactor = query_compactor(token_budget)
+        self.compile_plans = os.getenv("PLAN_COMPILER", "1") == "1"
         self.verbose = verbose
         self.max_iters = max_iters
 
-        # Write system prompt
+        # Write system prompt; a stable tool description keeps identical
+        # prompts identical across runs (see models/ModelCache.py)
+        order_tool_arguments(self.service_toolkit)
         if not sys_prompt.endswith("\n"):
             sys_prompt = sys_prompt + "\n"
 
@@ -118,6 +149,8 @@ class QueryAgent(AgentBase):
                 QUERY_PROMPT,
             ],
         )
+        # How to read compact tool results, when the tools return them
+        self.sys_prompt += format_note()
 
         # Save system prompt to memory
         self.memory.add(Msg("system", self.sys_prompt, role="system"))
@@ -151,111 +184,49 @@ class QueryAgent(AgentBase):
         self.memory.add(x)  # record input
 
         query_results = ""
+        query_data = []  # decoded tool results, handed on via Msg.metadata
 
         for _ in range(self.max_iters):
-            # Step 1: Think
-            if self.verbose:
-                self.speak(f" ITER {_+1}, thinking... ".center(70, "#"))
-
-            # Prepare a hint message to constrain model output
-            hint_msg = Msg(
-                "system",
-                self.parser.format_instruction,
-                role="system",
-                echo=self.verbose,
-            )
-
-            # Prepare prompt
-            prompt = self.model.format(self.memory.get_memory(), hint_msg)
-            
-            # Generate current step and parse
-            try:
-                res = self.model(
-                    prompt,
-                    parse_func=self.parser.parse,
-                    max_retries=1,
-                )
-
-
-                # Remember the chosen function call
-                self.memory.add(
-                    Msg(
-                        name=self.name,
-                        content="Prepared to execute functions: " + str(res.parsed["function"]) + ".",
-                        role="assistant",
-                    ),
-                )
-
-                # Show information
-                msg_returned = Msg(
-                    self.name,
-                    self.parser.to_content(res.parsed),
-                    "assistant",
-                )
-                self.speak(msg_returned)
-
-                # If the function field is empty, we are done
-                arg_function = res.parsed["function"]
-                if (
-                    isinstance(arg_function, str)
-                    and arg_function in ["[]", ""]
-                    or isinstance(arg_function, list)
-                    and len(arg_function) == 0
-                ):
+            with tracer.span("query.iteration", iteration=_ + 1):
+                # Step 1: Think
+                prompt = self._prepare_prompt(_)
+
+                # Generate current step and parse
+                try:
+                    with tracer.span("model", agent=self.name) as span:
+                        res = self.model(
+                            prompt,
+                            parse_func=self.parser.parse,
+                            max_retries=1,
+                        )
+                        record_model_io(span, prompt, res)
+                except ResponseParsingError as e:
+                    self._record_parsing_error(e)
+                    # Skip execution and think again
+                    continue
+
+                if self._record_plan(res):
                     # Only the speak field is exposed to users or other agents
                     self.speak("Query results:" + query_results)
-                    #self.memory.clear()
-                    return Msg(self.name, query_results, "assistant")
-
-            # Error handling and recording
-            except ResponseParsingError as e:
-                # Print out raw response from models for developers to debug
-                response_msg = Msg(self.name, e.raw_response, "assistant")
-                self.speak(response_msg)
-
-                # Re-correct by model itself
-                error_msg = Msg("system", str(e), "system")
-                self.speak(error_msg)
-
-                # Remember error
-                self.memory.add([response_msg, error_msg])
-
-                # Skip execution and think again
-                continue
-            
-            # Step 2: Act
-            if self.verbose:
-                self.speak(f" ITER {_+1}, calling tools... ".center(70, "#"))
-
-            # Parse the "function" field and call tools accordingly
-            try:
-                execute_results = self.service_toolkit.parse_and_call_func(
-                    json.dumps(res.parsed["function"]),
-                )
-
-                # Note: Observing the execution results and generate response
-                # are finished in the next reasoning step. We just put the
-                # execution results into memory, and wait for the next loop
-                # to generate response.
+                    return self._results_msg(query_results, query_data)
 
-                # Record execution results into memory as system message
+                # Step 2: Act
+                if self.verbose:
+                    self.speak(f" ITER {_+1}, calling tools... ".center(70, "#"))
 
-                # Inform success
-                msg_res = Msg("system", "Executed functions successfully: " + str(res.parsed["function"]) + ".", "system")
-                self.speak(msg_res)
-                self.memory.add(msg_res)
+                # Parse the "function" field and call tools accordingly;
+                # independent calls of one iteration run concurrently
+                try:
+                    execute_results, results_data = self.tool_executor.run(
+                        json.dumps(res.parsed["function"]),
+                    )
+                except FunctionCallError as e:
+                    self._record_call_error(e)
+                    continue
 
-                query_results += execute_results
-
-                # Record execution results
-                self.memory.add(Msg("system", "Obtained results:" + execute_results, "system"))
-
-
-            except FunctionCallError as e:
-                # Error during tool call
-                error_msg = Msg("system", str(e), "system")
-                self.speak(error_msg)
-                self.memory.add(error_msg)
+                query_results += self._record_results(res.parsed["function"], execute_results)
+                query_data.extend(results_data)
+                self.query_store.add_many(results_data)
 
 
         # Outside the loop: if no reply generated within max iterations, return
@@ -273,7 +244,274 @@ class QueryAgent(AgentBase):
         #res = self.model(prompt)
         
         # Return current results
-        res_msg = Msg(self.name, query_results, "assistant")
+        res_msg = self._results_msg(query_results, query_data)
         self.speak(res_msg)
         #self.memory.clear()
         return res_msg
+
+    async def areply(self, x: Optional[Union[Msg, Sequence[Msg]]] = None) -> Msg:
+        """Asynchronous counterpart of `reply`. Model calls run in a worker
+        thread and the tool calls of an iteration are awaited together."""
+
+        self.memory.add(x)  # record input
+
+        query_results = ""
+        query_data = []  # decoded tool results, handed on via Msg.metadata
+
+        for _ in range(self.max_iters):
+            with tracer.span("query.iteration", iteration=_ + 1):
+                prompt = self._prepare_prompt(_)
+
+                try:
+                    with tracer.span("model", agent=self.name) as span:
+                        res = await asyncio.to_thread(
+                            self.model,
+                            prompt,
+                            parse_func=self.parser.parse,
+                            max_retries=1,
+                        )
+                        record_model_io(span, prompt, res)
+                except ResponseParsingError as e:
+                    self._record_parsing_error(e)
+                    continue
+
+                if self._record_plan(res):
+                    self.speak("Query results:" + query_results)
+                    return self._results_msg(query_results, query_data)
+
+                if self.verbose:
+                    self.speak(f" ITER {_+1}, calling tools... ".center(70, "#"))
+
+                try:
+                    execute_results, results_data = await self.tool_executor.arun(
+                        json.dumps(res.parsed["function"]),
+                    )
+                except FunctionCallError as e:
+                    self._record_call_error(e)
+                    continue
+
+                query_results += self._record_results(res.parsed["function"], execute_results)
+                query_data.extend(results_data)
+                self.query_store.add_many(results_data)
+
+        res_msg = self._results_msg(query_results, query_data)
+        self.speak(res_msg)
+        return res_msg
+
+    def reply_plan(self, x: Msg) -> Msg:
+        """Reply to a Planner message, running the steps the plan compiler
+        understands directly. Only the remaining steps go through the ReAct
+        loop of `reply`, which is skipped when there are none.
+
+        The compiled steps read one consistent snapshot of the database
+        (`db.read_session`); the session ends before any model call."""
+        compiled, left = self._compile(x)
+        if compiled is None:
+            return self.reply(x)
+
+        self.memory.add(x)
+        query_results, query_data = "", []
+        calls = self._independent_calls(compiled)
+        with db.read_session():
+            for batch in (calls, None):
+                if batch is None:
+                    batch = self._dependent_calls(compiled, query_data)
+                if not batch:
+                    continue
+                try:
+                    execute_results, results_data = self.tool_executor.run(batch)
+                except FunctionCallError as e:
+                    left.extend(self._uncompiled(compiled, batch, e))
+                    continue
+                query_results += self._record_results(batch, execute_results)
+                query_data.extend(results_data)
+                self.query_store.add_many(results_data)
+
+        if left:
+            res = self.reply(self._left_msg(left))
+            return self._merged_msg(query_results, query_data, res)
+        self.speak("Query results:" + query_results)
+        return self._results_msg(query_results, query_data)
+
+    async def areply_plan(self, x: Msg) -> Msg:
+        """Asynchronous counterpart of `reply_plan`."""
+        compiled, left = self._compile(x)
+        if compiled is None:
+            return await self.areply(x)
+
+        self.memory.add(x)
+        query_results, query_data = "", []
+        calls = self._independent_calls(compiled)
+        async with db.aread_session():
+            for batch in (calls, None):
+                if batch is None:
+                    batch = self._dependent_calls(compiled, query_data)
+                if not batch:
+                    continue
+                try:
+                    execute_results, results_data = await self.tool_executor.arun(batch)
+                except FunctionCallError as e:
+                    left.extend(self._uncompiled(compiled, batch, e))
+                    continue
+                query_results += self._record_results(batch, execute_results)
+                query_data.extend(results_data)
+                self.query_store.add_many(results_data)
+
+        if left:
+            res = await self.areply(self._left_msg(left))
+            return self._merged_msg(query_results, query_data, res)
+        self.speak("Query results:" + query_results)
+        return self._results_msg(query_results, query_data)
+
+    def _compile(self, x: Msg) -> Tuple[Optional[List[PlanStep]], List[str]]:
+        """Compiled steps and the lines left for the model, or `(None, [])`
+        when the whole plan should go through the ReAct loop."""
+        if not self.compile_plans or not isinstance(getattr(x, "content", None), str):
+            return None, []
+        with tracer.span("plan.compile") as span:
+            compiled, left = compile_plan(x.content, store=self.query_store)
+            if span:
+                span.set(compiled=sum(step.call is not None for step in compiled), left=len(left))
+        if not any(step.call is not None for step in compiled):
+            # Nothing to run directly (or no numbered steps at all): the
+            # ReAct loop takes the whole plan, as before the compiler existed
+            return None, []
+        if self.verbose:
+            self.speak(f" compiled {len(compiled)} plan step(s), {len(left)} left for the model ".center(70, "#"))
+        return compiled, left
+
+    @staticmethod
+    def _independent_calls(compiled: List[PlanStep]) -> List[dict]:
+        calls = []
+        for step in compiled:
+            if step.call is not None and step.after is None and step.call not in calls:
+                calls.append(step.call)
+        return calls
+
+    @staticmethod
+    def _dependent_calls(compiled: List[PlanStep], query_data: List[dict]) -> List[dict]:
+        # Image steps take the ids of the intrusion events found in this plan
+        ids = [
+            event["id"]
+            for data in query_data
+            if data.get("query_type") == "intrusion_events_in_time_range"
+            for event in data.get("events", ())
+        ]
+        ids = list(dict.fromkeys(ids))
+        calls = []
+        for step in compiled:
+            if step.after is None or not ids:
+                continue
+            call = {"name": step.call["name"], "arguments": {**step.call["arguments"], "ids": ids}}
+            if call not in calls:
+                calls.append(call)
+        return calls
+
+    @staticmethod
+    def _uncompiled(compiled: List[PlanStep], batch: List[dict], error: FunctionCallError) -> List[str]:
+        logger.warning(f"Compiled plan steps were rejected, leaving them to the model: {error}")
+        names = {call["name"] for call in batch}
+        return [
+            f"{step.number}. {step.text}"
+            for step in compiled
+            if step.call is not None and step.call["name"] in names
+        ]
+
+    @staticmethod
+    def _left_msg(left: List[str]) -> Msg:
+        return Msg(
+            "system",
+            "The other steps of the plan were executed and their results are above. "
+            "Complete only these steps:\n" + "\n".join(left),
+            "system",
+        )
+
+    def _merged_msg(self, query_results: str, query_data: list, res: Msg) -> Msg:
+        return self._results_msg(query_results + res.content, query_data + list(res.metadata["results"]))
+
+    def _results_msg(self, query_results: str, query_data: list) -> Msg:
+        # The text keeps the "[RESULT]: ..." format for the model prompts;
+        # the decoded results ride along so readers need not parse it again
+        return Msg(self.name, query_results, "assistant", metadata={"results": query_data})
+
+    def _prepare_prompt(self, iteration: int) -> Any:
+        if self.verbose:
+            self.speak(f" ITER {iteration+1}, thinking... ".center(70, "#"))
+
+        # Prepare a hint message to constrain model output
+        hint_msg = Msg(
+            "system",
+            self.parser.format_instruction,
+            role="system",
+            echo=self.verbose,
+        )
+
+        # Prepare prompt; the system prompt and the plan are never dropped
+        history = self.compactor.compact(
+            self.memory.get_memory(),
+            pinned=2,
+            reserved=estimate_tokens(hint_msg.content),
+        )
+        return self.model.format(history, hint_msg)
+
+    def _record_plan(self, res: Any) -> bool:
+        """Remember and show the chosen function calls. Returns `True` when
+        the model reports that no more calls are needed."""
+        self.memory.add(
+            Msg(
+                name=self.name,
+                content="Prepared to execute functions: " + str(res.parsed["function"]) + ".",
+                role="assistant",
+            ),
+        )
+
+        # Show information
+        msg_returned = Msg(
+            self.name,
+            self.parser.to_content(res.parsed),
+            "assistant",
+        )
+        self.speak(msg_returned)
+
+        # If the function field is empty, we are done
+        arg_function = res.parsed["function"]
+        return (
+            isinstance(arg_function, str)
+            and arg_function in ["[]", ""]
+            or isinstance(arg_function, list)
+            and len(arg_function) == 0
+        )
+
+    def _record_parsing_error(self, e: ResponseParsingError) -> None:
+        # Print out raw response from models for developers to debug
+        response_msg = Msg(self.name, e.raw_response, "assistant")
+        self.speak(response_msg)
+
+        # Re-correct by model itself
+        error_msg = Msg("system", str(e), "system")
+        self.speak(error_msg)
+
+        # Remember error
+        self.memory.add([response_msg, error_msg])
+
+    def _record_call_error(self, e: FunctionCallError) -> None:
+        # Error during tool call
+        error_msg = Msg("system", str(e), "system")
+        self.speak(error_msg)
+        self.memory.add(error_msg)
+
+    def _record_results(self, calls: Any, execute_results: str) -> str:
+        # Note: Observing the execution results and generate response
+        # are finished in the next reasoning step. We just put the
+        # execution results into memory, and wait for the next loop
+        # to generate response.
+
+        # Inform success
+        msg_res = Msg("system", "Executed functions successfully: " + str(calls) + ".", "system")
+        self.speak(msg_res)
+        self.memory.add(msg_res)
+
+        # Record execution results
+        self.memory.add(Msg("system", "Obtained results:" + execute_results, "system"))
+
+        return execute_results
@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from agentscope.service import ServiceToolkit, ServiceResponse, ServiceExecStatus
+
+from instrumentation import tracer
+from tools.ResultCodec import decode
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library decoder is used instead
+    orjson = None
+
+
+def decode_result(content: Any) -> Optional[dict]:
+    """Decode a tool's JSON output, compact or not, to its full form.
+    Returns `None` for content that is not a JSON object (e.g. a timeout
+    message)."""
+    if isinstance(content, dict):
+        return content
+    try:
+        data = orjson.loads(content) if orjson is not None else json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    return decode(data) if isinstance(data, dict) else None
+
+
+class _Started:
+    """Set by a tool call when a worker picks it up, so its timeout is
+    measured from then rather than from when it was queued."""
+
+    __slots__ = ("at", "event", "_loop", "_aevent")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.at: Optional[float] = None
+        self.event = threading.Event()
+        self._loop = loop
+        self._aevent = asyncio.Event() if loop is not None else None
+
+    def mark(self) -> None:
+        self.at = time.monotonic()
+        self.event.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._aevent.set)
+
+    async def wait(self) -> None:
+        await self._aevent.wait()
+
+
+def order_tool_arguments(service_toolkit: ServiceToolkit) -> None:
+    """List each tool's arguments in signature order in the toolkit's JSON
+    schemas. The toolkit collects them in a set, so otherwise the tool
+    instructions, and every QueryAgent prompt, change from process to
+    process."""
+    for func in service_toolkit.service_funcs.values():
+        properties = func.json_schema["function"]["parameters"]["properties"]
+        order = list(inspect.signature(func.original_func).parameters)
+        ordered = {name: properties[name] for name in order if name in properties}
+        ordered.update((name, value) for name, value in properties.items() if name not in ordered)
+        func.json_schema["function"]["parameters"]["properties"] = ordered
+
+
+class ConcurrentToolExecutor:
+    """Executes the tool calls of one ReAct iteration concurrently.
+
+    A drop-in replacement for `ServiceToolkit.parse_and_call_func`: the calls
+    are validated by the toolkit, run on a bounded thread pool and their
+    results are formatted in the original call order, so the latency of an
+    iteration is that of its slowest call rather than the sum of all calls.
+    """
+
+    def __init__(
+        self,
+        service_toolkit: ServiceToolkit,
+        max_workers: Optional[int] = None,
+        timeout: Optional[float] = None,
+        queue_timeout: Optional[float] = None,
+    ) -> None:
+        """Initialize the executor.
+
+        Args:
+            service_toolkit (`ServiceToolkit`):
+                The toolkit holding the tool functions.
+            max_workers (`Optional[int]`):
+                Size of the thread pool. Defaults to `TOOL_MAX_WORKERS` or 4.
+                Keep it at or below the DB pool size.
+            timeout (`Optional[float]`):
+                Seconds each call may run, from when a worker picks it up,
+                before it is reported as failed. Defaults to `TOOL_TIMEOUT`
+                or 30.
+            queue_timeout (`Optional[float]`):
+                Seconds a call may wait for a worker (e.g. while the pool is
+                busy with other conversations' calls) before it is cancelled
+                and reported as failed. Defaults to `TOOL_QUEUE_TIMEOUT` or
+                120.
+        """
+        self.service_toolkit = service_toolkit
+        self.max_workers = max_workers or int(os.getenv("TOOL_MAX_WORKERS", "4"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("TOOL_TIMEOUT", "30"))
+        self.queue_timeout = (
+            queue_timeout if queue_timeout is not None else float(os.getenv("TOOL_QUEUE_TIMEOUT", "120"))
+        )
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+
+    def parse_and_call_func(self, text_cmd: Union[List[dict], str]) -> str:
+        """Parse, check the text and call the functions concurrently."""
+        return self.run(text_cmd)[0]
+
+    async def aparse_and_call_func(self, text_cmd: Union[List[dict], str]) -> str:
+        """Asynchronous counterpart of `parse_and_call_func`."""
+        return (await self.arun(text_cmd))[0]
+
+    def run(self, text_cmd: Union[List[dict], str]) -> Tuple[str, List[dict]]:
+        """Like `parse_and_call_func`, but also return the decoded results
+        of the successful calls so callers never re-parse the text."""
+        cmds = self.service_toolkit._parse_and_check_text(text_cmd)
+        with tracer.span("tools", calls=len(cmds)):
+            responses = self.call(cmds)
+        return self.format_results(cmds, responses), self.decode_results(responses)
+
+    async def arun(self, text_cmd: Union[List[dict], str]) -> Tuple[str, List[dict]]:
+        """Asynchronous counterpart of `run`."""
+        cmds = self.service_toolkit._parse_and_check_text(text_cmd)
+        with tracer.span("tools", calls=len(cmds)):
+            responses = list(await asyncio.gather(*(self._acall_one(cmd) for cmd in cmds)))
+        return self.format_results(cmds, responses), self.decode_results(responses)
+
+    def call(self, cmds: List[dict]) -> List[ServiceResponse]:
+        """Run already-validated calls and return their responses in order."""
+        started = [_Started() for _ in cmds]
+        futures = [self._submit(cmd, start) for cmd, start in zip(cmds, started)]
+        queue_deadline = time.monotonic() + self.queue_timeout
+
+        responses = []
+        for cmd, future, start in zip(cmds, futures, started):
+            if not start.event.wait(max(0.0, queue_deadline - time.monotonic())):
+                if future.cancel():
+                    logger.warning(f"Tool call {cmd['name']} did not start within {self.queue_timeout}s")
+                    responses.append(self._timeout_response(self.queue_timeout))
+                    continue
+                start.event.wait()  # picked up just now
+            # A call that overruns keeps its worker until it returns, but its
+            # result is no longer waited for.
+            try:
+                responses.append(future.result(timeout=max(0.0, start.at + self.timeout - time.monotonic())))
+            except FutureTimeoutError:
+                logger.warning(f"Tool call {cmd['name']} timed out after {self.timeout}s")
+                responses.append(self._timeout_response())
+        return responses
+
+    def format_results(self, cmds: List[dict], responses: List[ServiceResponse]) -> str:
+        """Format responses the same way `ServiceToolkit` does."""
+        execute_results = []
+        for i, (cmd, func_res) in enumerate(zip(cmds, responses)):
+            status = "SUCCESS" if func_res.status == ServiceExecStatus.SUCCESS else "FAILED"
+            arguments = [f"{k}: {v}" for k, v in cmd.get("arguments", {}).items()]
+            execute_results.append(
+                self.service_toolkit._tools_execution_format.format_map(
+                    {
+                        "index": i + 1,
+                        "function_name": cmd["name"],
+                        "arguments": "\n\t\t".join(arguments),
+                        "status": status,
+                        "result": func_res.content,
+                    },
+                )
+            )
+        return "\n".join(execute_results)
+
+    def decode_results(self, responses: List[ServiceResponse]) -> List[dict]:
+        """Decode each successful response once, in call order."""
+        results = []
+        for func_res in responses:
+            if func_res.status != ServiceExecStatus.SUCCESS:
+                continue
+            data = decode_result(func_res.content)
+            if data is not None:
+                results.append(data)
+        return results
+
+    async def _acall_one(self, cmd: dict) -> ServiceResponse:
+        start = _Started(asyncio.get_running_loop())
+        future = self._submit(cmd, start)
+        try:
+            await asyncio.wait_for(start.wait(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.cancel():
+                logger.warning(f"Tool call {cmd['name']} did not start within {self.queue_timeout}s")
+                return self._timeout_response(self.queue_timeout)
+            await start.wait()  # picked up just now
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), max(0.0, start.at + self.timeout - time.monotonic()),
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool call {cmd['name']} timed out after {self.timeout}s")
+            return self._timeout_response()
+
+    def _submit(self, cmd: dict, start: _Started) -> Future:
+        # Each call runs in a copy of the caller's context so its spans
+        # nest under the current iteration
+        return self._pool.submit(
+            contextvars.copy_context().run, self._started_call, start, cmd["name"], cmd.get("arguments", {}),
+        )
+
+    def _started_call(self, start: _Started, name: str, kwargs: dict) -> Any:
+        start.mark()
+        return self._call_one(name, kwargs)
+
+    def _timeout_response(self, seconds: Optional[float] = None) -> ServiceResponse:
+        return ServiceResponse(
+            status=ServiceExecStatus.ERROR,
+            content=f"Timed out after {self.timeout if seconds is None else seconds} seconds.",
+        )
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _call_one(self, name: str, kwargs: dict) -> Any:
+        service_func = self.service_toolkit.service_funcs[name]
+        logger.debug(f"Executing function {name} with arguments: {kwargs}")
+        with tracer.span("tool", tool=name) as span:
+            try:
+                response = service_func.processed_func(**kwargs)
+            except Exception as e:
+                response = ServiceResponse(status=ServiceExecStatus.ERROR, content=str(e))
+            if span:
+                span.set(status=response.status.name, result_chars=len(str(response.content)))
+            return response
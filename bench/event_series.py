@@ -0,0 +1,98 @@
+"""Compare the per-row Python loops the alarm tools used to run with the
+vectorized versions in `tools.EventSeries`.
+
+    python -m bench.event_series --rows 1000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+
+from tools.EventSeries import debounce, sample_indices, split_runs, to_seconds
+
+DEBOUNCE = timedelta(minutes=2)
+MAX_GAP = timedelta(minutes=2)
+
+
+def _timestamps(rows: int, seed: int) -> List[datetime]:
+    """Alarm times of a busy camera: while someone lingers in the area the
+    camera fires every few seconds, with quiet periods in between."""
+    rng = random.Random(seed)
+    t = datetime(2024, 1, 1)
+    times = []
+    while len(times) < rows:
+        burst_end = t + timedelta(seconds=rng.expovariate(1 / 900))
+        while t < burst_end and len(times) < rows:
+            times.append(t)
+            t += timedelta(seconds=rng.randint(1, 10))
+        t += timedelta(seconds=rng.randrange(300, 3600))
+    return times
+
+
+def loop_debounce(times: List[datetime]) -> List[int]:
+    kept = []
+    last_time = None
+    for i, current_time in enumerate(times):
+        if last_time is None or (current_time - last_time) >= DEBOUNCE:
+            kept.append(i)
+            last_time = current_time
+    return kept
+
+
+def loop_runs(times: List[datetime]) -> List[int]:
+    starts = [0]
+    for i in range(1, len(times)):
+        if times[i] - times[i - 1] > MAX_GAP:
+            starts.append(i)
+    return starts
+
+
+def loop_sample(times: List[datetime]) -> List[int]:
+    n = len(times)
+    return [0, n // 4, n // 2, (3 * n) // 4, n - 1]
+
+
+def _best(func: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark vectorized alarm debouncing and sampling.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    times = _timestamps(args.rows, args.seed)
+    ts = to_seconds(times)
+
+    # Both implementations must agree before their timings mean anything
+    assert loop_debounce(times) == debounce(ts, DEBOUNCE).tolist()
+    assert loop_runs(times) == split_runs(ts, MAX_GAP)[0].tolist()
+    assert loop_sample(times) == sample_indices(len(ts)).tolist()
+
+    cases = [
+        ("debounce", lambda: loop_debounce(times), lambda: debounce(ts, DEBOUNCE)),
+        ("run segmentation", lambda: loop_runs(times), lambda: split_runs(ts, MAX_GAP)),
+        ("five-point sampling", lambda: loop_sample(times), lambda: sample_indices(len(ts))),
+    ]
+    print(
+        f"{args.rows:,} timestamps, {len(debounce(ts, DEBOUNCE)):,} debounced events; "
+        f"to_seconds() conversion: {_best(lambda: to_seconds(times), args.repeat) * 1000:.1f} ms"
+    )
+    print(f"{'operation':<22} {'loop ms':>10} {'numpy ms':>10} {'speedup':>9}")
+    for name, loop, vectorized in cases:
+        loop_time = _best(loop, args.repeat)
+        vector_time = _best(vectorized, args.repeat)
+        print(f"{name:<22} {loop_time * 1000:>10.2f} {vector_time * 1000:>10.3f} {loop_time / vector_time:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark `parsers.JsonParser.parse_json` on large query results.
+
+    python -m bench.json_parser
+    python -m bench.json_parser --against HEAD~1   # compare with an older revision
+
+`--against` loads `parsers/JsonParser.py` from the given git revision,
+checks that it renders the same text and reports the speedup.
+"""
+import argparse
+import random
+import subprocess
+import time
+import types
+from typing import Callable, List, Optional, Tuple
+
+from parsers import JsonParser
+
+QUERY_TYPES = (
+    "leave_post_records",
+    "multiple_intrusion_event_images",
+    "intrusion_event_images_by_id",
+    "intrusion_events_in_time_range",
+    "passenger_flow_statistics",
+    "passenger_flow_distribution",
+)
+
+
+def _hhmmss(rng: random.Random) -> str:
+    return f"{rng.randrange(24):02d}{rng.randrange(60):02d}{rng.randrange(60):02d}"
+
+
+def _result(rng: random.Random, query_id: str, query_type: str, size: int) -> dict:
+    stamp = lambda i: f"2024-05-27 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+    data = {"query_id": query_id, "query_type": query_type}
+    if query_type == "leave_post_records":
+        data.update(total_records=size, leave_post_records=[
+            {"time_slot_start": _hhmmss(rng), "time_slot_end": _hhmmss(rng), "interval_time": 20} for _ in range(size)
+        ])
+    elif query_type in ("multiple_intrusion_event_images", "intrusion_event_images_by_id"):
+        data.update(events=[
+            {"id": 60000 + i, "alarm_time": stamp(i * 7), "url": f"http://example.com/alarm/{60000 + i}.jpg"}
+            for i in range(size)
+        ])
+    elif query_type == "intrusion_events_in_time_range":
+        data.update(total_events=size, events=[{"alarm_time": stamp(i * 7), "id": 60000 + i} for i in range(size)])
+    elif query_type == "passenger_flow_statistics":
+        data.update(total_periods=size, periods=[
+            {"start_time": stamp(i), "end_time": stamp(i + 59), "passenger_flow": rng.randrange(100)} for i in range(size)
+        ])
+    else:
+        data.update(total_segments=size, segments=[
+            {"start_time": stamp(i), "end_time": stamp(i + 59), "passenger_flow": rng.randrange(100)} for i in range(size)
+        ])
+    return data
+
+
+def scenarios(seed: int, events: int) -> List[Tuple[str, list, str]]:
+    rng = random.Random(seed)
+    results = [_result(rng, f"q{i:07d}", query_type, events) for i, query_type in enumerate(QUERY_TYPES * 2)]
+    ids = [data["query_id"] for data in results]
+    prose = "The store was quiet in the morning and busier after lunch. " * 20
+    return [
+        ("no placeholders", results, prose),
+        ("1 of 12 referenced", results, prose + f"Details: [{ids[3]}]"),
+        ("all 12 referenced", results, prose + " ".join(f"[{qid}]" for qid in ids)),
+        ("1 referenced 3 times", results, f"[{ids[3]}] " + prose + f"[{ids[3]}] and again [{ids[3]}]"),
+        ("unknown ids only", results, prose + "[abc123] [def456]"),
+    ]
+
+
+def _load_revision(revision: str) -> types.ModuleType:
+    source = subprocess.run(
+        ["git", "show", f"{revision}:parsers/JsonParser.py"], check=True, capture_output=True, text=True,
+    ).stdout
+    module = types.ModuleType(f"JsonParser_{revision}")
+    exec(compile(source, f"{revision}:parsers/JsonParser.py", "exec"), module.__dict__)
+    return module
+
+
+def _best(func: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the report renderer.")
+    parser.add_argument("--events", type=int, default=2000, help="records per query result")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--against", default=None, help="git revision of parsers/JsonParser.py to compare with")
+    args = parser.parse_args(argv)
+
+    reference = _load_revision(args.against) if args.against else None
+
+    print(f"{'scenario':<24} {'output chars':>12} {'ms':>9}" + (f" {'ref ms':>9} {'speedup':>8}" if reference else ""))
+    for name, results, text in scenarios(args.seed, args.events):
+        output = JsonParser.parse_json(results, text)
+        elapsed = _best(lambda: JsonParser.parse_json(results, text), args.repeat)
+        line = f"{name:<24} {len(output):>12,} {elapsed * 1000:>9.3f}"
+        if reference:
+            assert reference.parse_json(results, text) == output, f"{name}: output differs from {args.against}"
+            ref_elapsed = _best(lambda: reference.parse_json(results, text), args.repeat)
+            line += f" {ref_elapsed * 1000:>9.3f} {ref_elapsed / elapsed:>7.0f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Sessions per second of `server.py` on one node, offline.
+
+    python -m bench.load --sessions 200 --users 50 --latency-ms 200
+
+Starts the server in-process with the scripted stand-in model
+(`configs/scripted_model_configs.json`, `latency_ms` per model call) and the
+mock DB, then runs `--users` simulated store managers at once. Each one
+opens a session, asks the questions of a short script (two planning rounds
+and two answers from memory), closes the session and starts over until
+`--sessions` sessions are done. Rejected messages (429/503) are retried
+after their `Retry-After` and counted.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+SCRIPTS = [
+    ["How many visitors did we have today?", "And the visitors?", "Show me intrusion events with pictures this afternoon", "thanks"],
+    ["Any leave-post records this morning?", "Who was absent this morning?", "What was the passenger flow distribution yesterday?", "thanks"],
+    ["Intrusion alarms today?", "And the alarms today?", "Visitor traffic this evening", "ok"],
+]
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, payload: Any = None) -> Tuple[int, Dict[str, str], Any]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(headers.get("content-length", "0")))
+        if headers.get("connection") == "close":
+            self.writer.close()
+            self.writer = None
+        return status, headers, json.loads(data) if data else None
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def _user(client: Client, budget: List[int], script_offset: int, stats: Dict[str, Any]) -> None:
+    index = script_offset
+    while budget[0] > 0:
+        budget[0] -= 1
+        script = SCRIPTS[index % len(SCRIPTS)]
+        index += 1
+        _, _, data = await _retrying(client, "POST", "/sessions", None, stats)
+        session_id = data["session_id"]
+        for text in script:
+            started = time.perf_counter()
+            status, _, data = await _retrying(client, "POST", f"/sessions/{session_id}/messages", {"text": text}, stats)
+            if status != 200:
+                stats["errors"] += 1
+                continue
+            stats["turn_ms"].append((time.perf_counter() - started) * 1000)
+        await client.request("DELETE", f"/sessions/{session_id}")
+        stats["sessions"] += 1
+
+
+async def _retrying(client: Client, method: str, path: str, payload: Any, stats: Dict[str, Any]):
+    while True:
+        status, headers, data = await client.request(method, path, payload)
+        if status not in (429, 503):
+            return status, headers, data
+        stats[f"rejected_{status}"] += 1
+        await asyncio.sleep(float(headers.get("retry-after", "1")))
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import server  # after the environment is set up
+
+    shared = server.setup(args.model_configs)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=args.threads, thread_name_prefix="turn")
+    )
+    manager = server.SessionManager(shared, max_active=args.max_active, max_pending=args.max_pending)
+    http = server.Server(manager)
+    listener = await http.start("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+
+    stats: Dict[str, Any] = {"sessions": 0, "errors": 0, "rejected_429": 0, "rejected_503": 0, "turn_ms": []}
+    budget = [args.sessions]
+    clients = [Client("127.0.0.1", port) for _ in range(args.users)]
+    started = time.perf_counter()
+    await asyncio.gather(*(_user(client, budget, i, stats) for i, client in enumerate(clients)))
+    elapsed = time.perf_counter() - started
+
+    for client in clients:
+        client.close()
+    await http.close()
+    server_stats = manager.stats()
+    manager.shutdown()
+    shared.shutdown()
+
+    turns = sorted(stats["turn_ms"])
+    return {
+        "users": args.users,
+        "sessions": stats["sessions"],
+        "turns": len(turns),
+        "seconds": round(elapsed, 3),
+        "sessions_per_s": round(stats["sessions"] / elapsed, 2),
+        "turns_per_s": round(len(turns) / elapsed, 2),
+        "turn_p50_ms": round(turns[int(0.50 * (len(turns) - 1))], 1) if turns else None,
+        "turn_p95_ms": round(turns[int(0.95 * (len(turns) - 1))], 1) if turns else None,
+        "rejected_429": stats["rejected_429"],
+        "rejected_503": stats["rejected_503"],
+        "errors": stats["errors"],
+        "tool_cache_hits": server_stats["tool_cache"]["hits"],
+        "tool_cache_misses": server_stats["tool_cache"]["misses"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the conversation server offline.")
+    parser.add_argument("--sessions", type=int, default=200, help="sessions to run in total")
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--latency-ms", type=float, default=200, help="simulated latency of each model call")
+    parser.add_argument("--db-latency-ms", type=float, default=5, help="simulated latency of each DB query")
+    parser.add_argument("--max-active", type=int, default=32, help="turns running at once (SERVER_MAX_ACTIVE)")
+    parser.add_argument("--max-pending", type=int, default=256, help="turns accepted at once (SERVER_MAX_PENDING)")
+    parser.add_argument("--threads", type=int, default=64, help="worker threads (SERVER_THREADS)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open("configs/scripted_model_configs.json", encoding="utf-8") as f:
+            configs = json.load(f)
+        for config in configs:
+            config["latency_ms"] = args.latency_ms
+        args.model_configs = os.path.join(tmp, "model_configs.json")
+        with open(args.model_configs, "w", encoding="utf-8") as f:
+            json.dump(configs, f)
+        os.environ["USE_MOCK_DB"] = "1"
+        os.environ["MOCK_DB_LATENCY_MS"] = str(args.db_latency_ms)
+        os.environ["MODEL_CACHE_DIR"] = os.path.join(tmp, "model_cache")
+        os.environ.setdefault("SERVER_LOG_LEVEL", "ERROR")
+
+        print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Prompt sizes of a simulated session with and without memory compaction.
+
+    python -m bench.memory --rounds 5 --iterations 3 --events 500
+
+Each round mimics `app.py`: the QueryAgent runs a few iterations that each
+obtain tool results, then the ChatAssistant answers a question about them
+and a follow-up. Without compaction every prompt carries all the results in
+memory; with it, older results become `query_id` references. The run fails
+if a compacted ChatAssistant prompt loses the `query_id` of any round.
+"""
+import argparse
+import json
+import random
+from typing import List, Optional
+
+from agentscope.message import Msg
+
+from bench.json_parser import QUERY_TYPES, _result
+from structure.MemoryCompactor import MemoryCompactor, estimate_tokens
+
+
+def _tool_output(data: dict) -> str:
+    return (
+        "1. Execute function Tool\n   [ARGUMENTS]:\n       start_time: 2024-05-27 00:00:00\n"
+        f"   [STATUS]: SUCCESS\n   [RESULT]: {json.dumps(data, ensure_ascii=True)}\n"
+    )
+
+
+def _tokens(msgs: List[Msg]) -> int:
+    return sum(estimate_tokens(msg.content) + 4 for msg in msgs)
+
+
+def simulate(compactor: MemoryCompactor, rounds: int, iterations: int, events: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    query_prompts, chat_prompts = [], []
+    chat_memory = [Msg("system", "ChatAssistant system prompt " * 60, "system")]
+    ids = []
+    for round_index in range(rounds):
+        # QueryAgent: a fresh memory per round, growing per iteration
+        memory = [Msg("system", "QueryAgent system prompt and tool list " * 150, "system"),
+                  Msg("Planner", f"Plan {round_index}: query the store", "assistant")]
+        results = ""
+        for iteration in range(iterations):
+            query_prompts.append(_tokens(compactor.compact(memory, pinned=2)))
+            query_type = QUERY_TYPES[(round_index + iteration) % len(QUERY_TYPES)]
+            data = _result(rng, f"r{round_index}i{iteration}", query_type, events)
+            ids.append(data["query_id"])
+            output = _tool_output(data)
+            memory.append(Msg("QueryAgent", "Prepared to execute functions: [...].", "assistant"))
+            memory.append(Msg("system", "Executed functions successfully: [...].", "system"))
+            memory.append(Msg("system", "Obtained results:" + output, "system"))
+            results += output
+
+        # ChatAssistant: the round's results and summary, then a follow-up
+        chat_memory.append(Msg("QueryAgent", results, "assistant"))
+        chat_memory.append(Msg("Summarizer", "Summary of the results " * 20, "assistant"))
+        for question in ("What happened?", "And compared to before?"):
+            chat_memory.append(Msg("User", question, "user"))
+            prompt = compactor.compact(chat_memory)
+            chat_prompts.append(_tokens(prompt))
+            text = " ".join(str(msg.content) for msg in prompt)
+            missing = [query_id for query_id in ids if query_id not in text]
+            if missing:
+                raise AssertionError(f"round {round_index}: prompt lost {missing}")
+            chat_memory.append(Msg("ChatAssistant", "An answer that cites results " * 10, "assistant"))
+    return {"query": query_prompts, "chat": chat_prompts}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare prompt sizes with and without memory compaction.")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=3, help="QueryAgent iterations per round")
+    parser.add_argument("--events", type=int, default=500, help="records per tool result")
+    parser.add_argument("--budget", type=int, default=12000)
+    parser.add_argument("--window", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    runs = {
+        "full memory": simulate(MemoryCompactor(enabled=False), args.rounds, args.iterations, args.events, args.seed),
+        "compacted": simulate(
+            MemoryCompactor(budget=args.budget, window=args.window), args.rounds, args.iterations, args.events, args.seed,
+        ),
+    }
+    print(f"{'':<12} {'agent':<6} {'calls':>6} {'mean tokens':>12} {'max tokens':>11} {'total tokens':>13}")
+    for name, sizes in runs.items():
+        for agent, prompts in sizes.items():
+            print(
+                f"{name:<12} {agent:<6} {len(prompts):>6} {sum(prompts) / len(prompts):>12,.0f} "
+                f"{max(prompts):>11,} {sum(prompts):>13,}"
+            )
+    before = sum(map(sum, runs["full memory"].values()))
+    after = sum(map(sum, runs["compacted"].values()))
+    print(f"total prompt tokens: {before:,} -> {after:,} ({after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Prompt size of tool results in the JSON and the compact format.
+
+    python -m bench.result_format --scale 100k
+    python -m bench.result_format --scale 100k --tokenizer tiktoken --ms-per-prompt-token 0.2
+
+First every `bench.run` case is called once on the benchmark database and
+its result measured in both formats (`tools/ResultCodec.py`): characters,
+prompt tokens, the time to encode it and to decode it back, and a check
+that decoding restores the result exactly.
+
+Then the conversations of `bench.load` run through `Conversation` once per
+format, with the scripted model charging `--ms-per-prompt-token` for every
+prompt token, and the prompt tokens of all model calls and the turn
+latencies are compared.
+
+Tokens are counted with `estimate_tokens` (about four characters per
+token), or with tiktoken's `cl100k_base` when `--tokenizer tiktoken` is
+given and the encoding can be loaded (e.g. from `TIKTOKEN_CACHE_DIR`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from database.MockData import SCALES, generate
+from database.SQLiteEngine import SQLiteConnection
+from connection import db
+from structure.MemoryCompactor import estimate_tokens
+from tools.ResultCodec import compact, decode, encode_result
+from tools.ToolCache import tool_cache
+
+from bench.load import SCRIPTS
+from bench.run import DATA_DIR, cases
+
+
+def tokenizer(name: str) -> Callable[[str], int]:
+    if name == "tiktoken":
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens
+
+
+def _timed(func: Callable[[], Any], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) * 1e6 / repeat
+
+
+def measure_results(count: Callable[[str], int], seed: int, repeat: int) -> List[Dict[str, Any]]:
+    rows = []
+    for name, tool, build in cases():
+        kwargs, _ = build(random.Random(f"{seed}:{name}"))
+        data = decode(json.loads(tool(**kwargs).content))
+        if not data.get("query_id"):
+            continue  # "no records" message, the same in both formats
+        full = encode_result(data, "json")
+        packed = encode_result(data, "compact")
+        if decode(json.loads(packed)) != data:
+            raise AssertionError(f"{name}: the compact result does not decode to the original")
+        rows.append({
+            "case": name,
+            "json_chars": len(full),
+            "compact_chars": len(packed),
+            "json_tokens": count(full),
+            "compact_tokens": count(packed),
+            "encode_us": round(_timed(lambda: json.dumps(compact(data), ensure_ascii=True), repeat), 1),
+            "decode_us": round(_timed(lambda: decode(json.loads(packed)), repeat), 1),
+        })
+    return rows
+
+
+class _CountingModel:
+    """Counts the prompt tokens of every call of a model."""
+
+    def __init__(self, model: Any, count: Callable[[str], int], totals: Dict[str, int]) -> None:
+        self._model = model
+        self._count = count
+        self._totals = totals
+
+    def __call__(self, messages: Any, *args: Any, **kwargs: Any) -> Any:
+        self._totals["calls"] += 1
+        self._totals["prompt_tokens"] += sum(self._count(message["content"]) for message in messages)
+        return self._model(messages, *args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._model, name)
+
+
+async def _conversations(shared: Any, sessions: int) -> List[float]:
+    from conversation import Conversation
+
+    turns = []
+    for index in range(sessions):
+        conversation = Conversation(shared, verbose=False)
+        for text in SCRIPTS[index % len(SCRIPTS)]:
+            started = time.perf_counter()
+            await conversation.respond(text)
+            turns.append((time.perf_counter() - started) * 1000)
+        conversation.close()
+    return turns
+
+
+def measure_conversations(count: Callable[[str], int], sessions: int, ms_per_prompt_token: float) -> Dict[str, Any]:
+    import agentscope
+    from conversation import SharedResources
+    import models.ScriptedModel  # noqa: F401  (registers the scripted_chat model type)
+
+    with open("configs/scripted_model_configs.json", encoding="utf-8") as f:
+        configs = json.load(f)
+    for config in configs:
+        config["ms_per_prompt_token"] = ms_per_prompt_token
+    agentscope.init(model_configs=configs, logger_level="ERROR", save_log=False)
+    logger.disable("agentscope")  # the agents' messages
+
+    results = {}
+    for fmt in ("json", "compact"):
+        os.environ["TOOL_RESULT_FORMAT"] = fmt
+        totals = {"calls": 0, "prompt_tokens": 0}
+        shared = SharedResources()
+        for name in ("qwen", "qwen_zero_temp"):
+            shared._models[name] = _CountingModel(shared.model(name), count, totals)
+        try:
+            turns = sorted(asyncio.run(_conversations(shared, sessions)))
+        finally:
+            shared.shutdown()
+        results[fmt] = {
+            "model_calls": totals["calls"],
+            "prompt_tokens": totals["prompt_tokens"],
+            "turn_p50_ms": round(turns[len(turns) // 2], 1),
+            "turn_total_ms": round(sum(turns), 1),
+        }
+    return results
+
+
+def _print_results(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'case':<42} {'json tok':>9} {'compact':>9} {'saved':>7} {'enc us':>8} {'dec us':>8}")
+    for row in rows:
+        saved = 1 - row["compact_tokens"] / row["json_tokens"]
+        print(
+            f"{row['case']:<42} {row['json_tokens']:>9} {row['compact_tokens']:>9} {saved:>7.0%} "
+            f"{row['encode_us']:>8.1f} {row['decode_us']:>8.1f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare the JSON and compact tool result formats.")
+    parser.add_argument("--scale", choices=sorted(SCALES, key=SCALES.get), default="100k",
+                        help="passenger-flow rows of the benchmark database")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the data and the call arguments")
+    parser.add_argument("--repeat", type=int, default=200, help="timed encode/decode runs per result")
+    parser.add_argument("--tokenizer", choices=("estimate", "tiktoken"), default="estimate")
+    parser.add_argument("--sessions", type=int, default=6, help="scripted conversations per format")
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.2,
+                        help="simulated prompt processing time of the scripted model")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(DATA_DIR, f"{args.scale}-{args.seed}.sqlite")
+    if not os.path.exists(path):
+        generate(path, SCALES[args.scale], seed=args.seed)
+    db.connect(min_size=1, max_size=4, factory=lambda: SQLiteConnection(path))
+    tool_cache.enabled = False
+    count = tokenizer(args.tokenizer)
+    try:
+        rows = measure_results(count, args.seed, args.repeat)
+        conversations = measure_conversations(count, args.sessions, args.ms_per_prompt_token)
+    finally:
+        db.close_connection()
+
+    _print_results(rows)
+    json_tokens = sum(row["json_tokens"] for row in rows)
+    compact_tokens = sum(row["compact_tokens"] for row in rows)
+    print(f"\nAll results: {json_tokens} -> {compact_tokens} tokens ({1 - compact_tokens / json_tokens:.0%} fewer)")
+    print(json.dumps(conversations, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Benchmark the query tools against a generated SQLite database.
+
+    python -m bench.run --scale 100k --repeat 30
+    python -m bench.run --scale 100k --save-baseline bench/baseline.json
+    python -m bench.run --scale 100k --baseline bench/baseline.json
+
+Every case is timed end to end through the tool function (SQL, Python
+post-processing and JSON encoding) with the tool cache disabled. With
+`--baseline`, the p50 of each case is compared against the saved run and
+the process exits with status 1 if any case is slower than the tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from database.SQLiteEngine import SQLiteConnection
+from database.MockData import SCALES, DAYS, LAST_DAY, first_day, generate
+from connection import db
+from tools.ToolCache import tool_cache, TIME_FORMAT
+from tools.FlowQuery import FlowQuery
+from tools.FlowDistributeQuery import FlowDistribution
+from tools.InvaseAlarmEventsQuery import InvaseAlarmEventsQuery
+from tools.InvaseAlarmIndexQuery import InvaseAlarmPictureQuery
+from tools.MultiInvaseAlarmIndexQuery import MultiInvaseAlarmPictureQuery
+from tools.LeaveRecordsQuery import LeaveRecordsQuery
+
+from agentscope.service import ServiceExecStatus
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+WIDTHS = {
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+    "7d": timedelta(days=7),
+    "28d": timedelta(days=DAYS),
+}
+PERIOD_COUNTS = (1, 5, 20)
+SEGMENT_COUNTS = (6, 24, 144, 1440)
+ID_COUNTS = (1, 10, 100)
+
+# A case builds the keyword arguments of one call and the number of rows
+# that call covers (counted outside the timed section)
+Case = Tuple[str, Callable, Callable[[random.Random], Tuple[dict, int]]]
+
+
+def _fmt(t: datetime) -> str:
+    return t.strftime(TIME_FORMAT)
+
+
+def _scalar(query: str, params: tuple):
+    with db.checkout() as conn, conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchone()["n"]
+
+
+def _random_window(rng: random.Random, width: timedelta) -> Tuple[datetime, datetime]:
+    span = (LAST_DAY + timedelta(days=1) - first_day()) - width
+    start = first_day() + timedelta(seconds=rng.randrange(max(int(span.total_seconds()), 1)))
+    return start, start + width - timedelta(seconds=1)
+
+
+def _count_range(table: str, column: str, start: datetime, end: datetime) -> int:
+    return _scalar(f"SELECT COUNT(*) AS n FROM {table} WHERE {column} BETWEEN %s AND %s", (start, end))
+
+
+def _flow_case(width: timedelta, periods: int):
+    def build(rng):
+        windows = sorted(_random_window(rng, width) for _ in range(periods))
+        rows = sum(_count_range("t_kltj_alarm_msg", "create_time", s, e) for s, e in windows)
+        return {"time_ranges": ",".join(f"{_fmt(s)} - {_fmt(e)}" for s, e in windows)}, rows
+    return build
+
+
+def _distribution_case(width: timedelta, segments: int):
+    def build(rng):
+        start, end = _random_window(rng, width)
+        rows = _count_range("t_kltj_alarm_msg", "create_time", start, end)
+        return {"time_range": f"{_fmt(start)} - {_fmt(end)}", "num_segments": str(segments)}, rows
+    return build
+
+
+def _range_case(table: str, width: timedelta):
+    def build(rng):
+        start, end = _random_window(rng, width)
+        rows = _count_range(table, "alarm_time", start, end)
+        return {"start_time": _fmt(start), "end_time": _fmt(end)}, rows
+    return build
+
+
+def _id_bounds() -> Tuple[int, int]:
+    with db.checkout() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT MIN(id) AS lo, MAX(id) AS hi FROM t_qyrq_alarm_msg")
+        row = cursor.fetchone()
+    return row["lo"], row["hi"]
+
+
+def _picture_case(lo: int, hi: int):
+    def build(rng):
+        event_id = rng.randint(lo, hi)
+        anchor = _scalar("SELECT alarm_time AS n FROM t_qyrq_alarm_msg WHERE id = %s", (event_id,))
+        rows = _count_range("t_qyrq_alarm_msg", "alarm_time", anchor, anchor + timedelta(minutes=10))
+        return {"id": str(event_id)}, rows
+    return build
+
+
+def _multi_picture_case(lo: int, hi: int, count: int):
+    def build(rng):
+        ids = rng.sample(range(lo, hi + 1), min(count, hi - lo + 1))
+        return {"ids": [str(i) for i in ids]}, len(ids)
+    return build
+
+
+def cases() -> List[Case]:
+    lo, hi = _id_bounds()
+    result: List[Case] = []
+    for width_name, width in WIDTHS.items():
+        for periods in PERIOD_COUNTS:
+            result.append((f"FlowQuery/{width_name}/x{periods}", FlowQuery, _flow_case(width, periods)))
+    for width_name in ("1d", "7d"):
+        for segments in SEGMENT_COUNTS:
+            result.append(
+                (f"FlowDistribution/{width_name}/{segments}seg", FlowDistribution,
+                 _distribution_case(WIDTHS[width_name], segments))
+            )
+    for width_name, width in WIDTHS.items():
+        result.append(
+            (f"InvaseAlarmEventsQuery/{width_name}", InvaseAlarmEventsQuery,
+             _range_case("t_qyrq_alarm_msg", width))
+        )
+        result.append(
+            (f"LeaveRecordsQuery/{width_name}", LeaveRecordsQuery,
+             _range_case("t_lgsb_alarm_record", width))
+        )
+    result.append(("InvaseAlarmPictureQuery", InvaseAlarmPictureQuery, _picture_case(lo, hi)))
+    for count in ID_COUNTS:
+        result.append(
+            (f"MultiInvaseAlarmPictureQuery/{count}ids", MultiInvaseAlarmPictureQuery,
+             _multi_picture_case(lo, hi, count))
+        )
+    return result
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = q * (len(sorted_values) - 1)
+    low = int(index)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (index - low)
+
+
+def run_case(tool: Callable, build: Callable, repeat: int, warmup: int, rng: random.Random) -> Dict[str, float]:
+    calls = [build(rng) for _ in range(repeat + warmup)]
+    latencies = []
+    total_rows = 0
+    for i, (kwargs, rows) in enumerate(calls):
+        started = time.perf_counter()
+        response = tool(**kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status != ServiceExecStatus.SUCCESS:
+            raise RuntimeError(f"{tool.__name__}({kwargs}) failed: {response.content}")
+        if i >= warmup:
+            latencies.append(elapsed)
+            total_rows += rows
+
+    latencies.sort()
+    total_time = sum(latencies)
+    return {
+        "calls": len(latencies),
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "rows_per_sec": total_rows / total_time if total_time else 0.0,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Return the cases whose p50 regressed by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        result["vs_baseline"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def _print_table(results: Dict[str, dict]) -> None:
+    header = f"{'case':<42} {'calls':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rows/s':>12} {'vs base':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        ratio = f"{r['vs_baseline']:.2f}x" if "vs_baseline" in r else ""
+        print(
+            f"{name:<42} {r['calls']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+            f"{r['rows_per_sec']:>12,.0f} {ratio:>8}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the query tools on synthetic data.")
+    parser.add_argument("--scale", choices=sorted(SCALES, key=SCALES.get), default="100k",
+                        help="passenger-flow rows to generate")
+    parser.add_argument("--seed", type=int, default=42, help="seed for both the data and the call arguments")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per case")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed calls per case")
+    parser.add_argument("--only", default=None, help="run only cases whose name contains this string")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the database even if it exists")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--save-baseline", default=None, help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p50 slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(DATA_DIR, f"{args.scale}-{args.seed}.sqlite")
+    if args.regenerate or not os.path.exists(path):
+        generate(path, SCALES[args.scale], seed=args.seed)
+
+    db.connect(min_size=1, max_size=1, factory=lambda: SQLiteConnection(path))
+    tool_cache.enabled = False
+    try:
+        results = {}
+        for name, tool, build in cases():
+            if args.only and args.only not in name:
+                continue
+            # Each case gets its own stream so adding cases does not shift the others
+            rng = random.Random(f"{args.seed}:{name}")
+            results[name] = run_case(tool, build, args.repeat, args.warmup, rng)
+    finally:
+        db.close_connection()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            logger.warning(f"Baseline was recorded at scale {baseline.get('scale')}, not {args.scale}")
+        regressions = compare(results, baseline["cases"], args.tolerance)
+
+    _print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "seed": args.seed, "repeat": args.repeat, "cases": results}, f, indent=2)
+        logger.info(f"Saved results to {args.save_baseline}")
+
+    if regressions:
+        logger.error(f"{len(regressions)} case(s) slower than baseline by more than {args.tolerance:.0%}: "
+                     + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
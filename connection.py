@@ -1,66 +1,317 @@
+import asyncio
+import contextvars
 import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
 import pymysql
-from typing import Any, Dict, List, Optional
 from loguru import logger
 
+from database.MockData import mock_database
+from database.QueryGuard import QueryGuard, guarded_connection
+from database.Schema import RequiredIndex, dialect, migrate, verify_indexes
+from database.SQLiteEngine import SQLiteConnection
+from instrumentation import tracer, traced_connection
+
+# Errors after which a connection cannot be trusted and must not be reused
+_BROKEN_CONNECTION_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class _PooledEntry:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn: Any) -> None:
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """A thread-safe pool of DB-API connections.
+
+    Connections are created lazily up to `max_size`; `min_size` of them are
+    opened eagerly and kept around even when idle. Each checkout pings a
+    connection that has been idle for more than `ping_interval` seconds and
+    replaces it if the ping fails. Connections idle for longer than
+    `idle_timeout` (above `min_size`) or older than `max_lifetime` are
+    recycled.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 8,
+        idle_timeout: float = 300.0,
+        max_lifetime: float = 3600.0,
+        checkout_timeout: float = 10.0,
+        ping_interval: float = 0.5,
+    ) -> None:
+        if max_size <= 0 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
 
-class MockCursor:
-    def __init__(self, conn: "MockConnection") -> None:
-        self._conn = conn
-        self._results: List[Dict[str, Any]] = []
-
-    def __enter__(self) -> "MockCursor":
-        return self
-
-    def __exit__(self, exc_type, exc, tb) -> None:
-        return None
-
-    def execute(self, query: str, params: Optional[tuple] = None) -> None:
-        # Very lightweight mock based on table keywords in the query
-        self._conn._call_count += 1
-        if "FROM t_kltj_alarm_msg" in query:
-            # passenger flow sum
-            val = 10 + (self._conn._call_count % 10)
-            self._results = [{"total_flow": val}]
-        elif "FROM t_lgsb_alarm_record" in query:
-            self._results = [
-                {"time_slot_start": "080000", "time_slot_end": "082000", "interval_time": 20},
-                {"time_slot_start": "103000", "time_slot_end": "105000", "interval_time": 20},
-            ]
-        elif "FROM t_qyrq_alarm_msg" in query and "SELECT alarm_time, id" in query:
-            self._results = [
-                {"alarm_time": pymysql.Timestamp(2024, 5, 27, 11, 7, 31), "id": 66406},
-                {"alarm_time": pymysql.Timestamp(2024, 5, 27, 11, 13, 50), "id": 66414},
-                {"alarm_time": pymysql.Timestamp(2024, 5, 27, 11, 25, 39), "id": 66428},
-            ]
-        elif "FROM t_qyrq_alarm_msg" in query and "alarm_pic_url" in query:
-            self._results = [
-                {"id": 66406, "alarm_time": pymysql.Timestamp(2024, 5, 27, 11, 7, 31), "alarm_pic_url": "http://example.com/1.jpg"},
-                {"id": 66414, "alarm_time": pymysql.Timestamp(2024, 5, 27, 11, 13, 50), "alarm_pic_url": "http://example.com/2.jpg"},
-                {"id": 66428, "alarm_time": pymysql.Timestamp(2024, 5, 27, 11, 25, 39), "alarm_pic_url": "http://example.com/3.jpg"},
-            ]
-        else:
-            self._results = []
-
-    def fetchone(self) -> Optional[Dict[str, Any]]:
-        return self._results[0] if self._results else None
-
-    def fetchall(self) -> List[Dict[str, Any]]:
-        return list(self._results)
-
-
-class MockConnection:
-    def __init__(self) -> None:
-        self._call_count = 0
-
-    def cursor(self, *_args, **_kwargs) -> MockCursor:
-        return MockCursor(self)
-
-    def commit(self) -> None:
-        return None
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle: Deque[_PooledEntry] = deque()
+        self._in_use: Dict[int, _PooledEntry] = {}
+        self._size = 0  # open connections, idle + in use + being created
+        self._closed = False
+        self._waits = 0
+        self._discarded = 0
+
+        for _ in range(min_size):
+            self._size += 1
+            try:
+                self._idle.append(_PooledEntry(self._factory()))
+            except Exception:
+                self._size -= 1
+                raise
+
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    if self._idle:
+                        # LIFO keeps a warm working set and lets the rest go idle
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.checkout_timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._waits += 1
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    entry = _PooledEntry(self._factory())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._usable(entry):
+                self._discard(entry)
+                continue
+
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+            return entry.conn
+
+    def release(self, conn: Any, discard: bool = False) -> None:
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.warning("Released a connection that does not belong to the pool")
+            return
+        if discard or self._closed:
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        expired = []
+        with self._cond:
+            self._idle.append(entry)
+            # Recycle connections idle for too long, oldest first, above min_size
+            while (
+                self._size - len(expired) > self.min_size
+                and self._idle
+                and entry.last_used - self._idle[0].last_used > self.idle_timeout
+            ):
+                expired.append(self._idle.popleft())
+            self._cond.notify()
+        for stale in expired:
+            self._discard(stale)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except _BROKEN_CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken)
 
     def close(self) -> None:
-        return None
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waits": self._waits,
+                "discarded": self._discarded,
+            }
+
+    def _usable(self, entry: _PooledEntry) -> bool:
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used > self.idle_timeout and self._size > self.min_size:
+            return False
+        if now - entry.last_used > self.ping_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"Dropping unhealthy pooled connection: {e}")
+                return False
+        return True
+
+    def _discard(self, entry: _PooledEntry) -> None:
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+
+class ReadSession:
+    """One read-only transaction with a consistent snapshot, shared by every
+    `db.checkout()` made while it is current.
+
+    The connection is taken from the pool on the first checkout, so a plan
+    that never reaches the database holds none. Tool calls running in
+    parallel threads take turns on it: a DB-API connection runs one
+    statement at a time, and a snapshot cannot be shared between
+    connections. Sessions are therefore kept short (see
+    `DatabaseConnection.read_session`).
+    """
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self._pool = pool
+        self._conn: Any = None
+        self._lock = threading.RLock()
+        self._active = 0
+        self.closed = False
+        self.checkouts = 0
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        if self.closed:
+            # A tool call that outlived its session (TOOL_TIMEOUT) reads
+            # outside the snapshot rather than reopening it
+            with self._pool.connection() as conn:
+                yield conn
+            return
+        try:
+            with self._lock:
+                if self._conn is None:
+                    self._conn = self._begin()
+                self.checkouts += 1
+                self._active += 1
+                try:
+                    yield self._conn
+                except _BROKEN_CONNECTION_ERRORS:
+                    # The snapshot is lost with the connection; a later checkout
+                    # starts a new one
+                    logger.warning("Read session connection failed; its snapshot is lost")
+                    self._end(discard=True)
+                    raise
+                finally:
+                    self._active -= 1
+        finally:
+            if self.closed:
+                # close() found the connection in use and left ending the
+                # transaction to the last call on it
+                self._end_if_idle()
+
+    def close(self) -> None:
+        """End the transaction now, or, when a timed-out tool call is still
+        running on the connection, as soon as that call finishes. Never
+        waits for the call, so TOOL_TIMEOUT still bounds the reply."""
+        self.closed = True
+        self._end_if_idle()
+
+    def _end_if_idle(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._active == 0 and self._conn is not None:
+                self._end()
+        finally:
+            self._lock.release()
+
+    def _begin(self) -> Any:
+        conn = self._pool.acquire()
+        try:
+            with conn.cursor() as cursor:
+                if dialect(conn) == "sqlite":
+                    cursor.execute("PRAGMA query_only = ON")
+                    cursor.execute("BEGIN")
+                    # A deferred transaction takes its snapshot at the first read
+                    cursor.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+                    cursor.fetchall()
+                else:
+                    # REPEATABLE READ (the InnoDB default) keeps this snapshot
+                    # for every statement of the transaction
+                    cursor.execute("START TRANSACTION READ ONLY, WITH CONSISTENT SNAPSHOT")
+        except Exception:
+            self._pool.release(conn, discard=True)
+            raise
+        return conn
+
+    def _end(self, discard: bool = False) -> None:
+        conn, self._conn = self._conn, None
+        if not discard:
+            try:
+                conn.rollback()
+                if dialect(conn) == "sqlite":
+                    with conn.cursor() as cursor:
+                        cursor.execute("PRAGMA query_only = OFF")
+            except Exception as e:
+                logger.warning(f"Could not end read session cleanly: {e}")
+                discard = True
+        self._pool.release(conn, discard=discard)
+
+
+_read_session: contextvars.ContextVar[Optional[ReadSession]] = contextvars.ContextVar("read_session", default=None)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
 
 
 class DatabaseConnection:
@@ -69,16 +320,92 @@ class DatabaseConnection:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(DatabaseConnection, cls).__new__(cls)
-            cls._instance.connection = None
+            cls._instance.pool = None
+            cls._instance.guard = None
+            cls._instance.read_sessions = os.getenv("DB_READ_SESSIONS", "0") == "1"
         return cls._instance
 
-    def connect(self):
-        use_mock = os.getenv("USE_MOCK_DB", "0").lower() in {"1", "true", "yes"}
-        if use_mock:
-            self.connection = MockConnection()
-            logger.info("Using Mock DB connection (USE_MOCK_DB=1)")
-            return
+    def connect(
+        self,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        max_lifetime: Optional[float] = None,
+        checkout_timeout: Optional[float] = None,
+        factory: Optional[Callable[[], Any]] = None,
+    ):
+        """Create the connection pool.
+
+        Pool settings fall back to the `DB_POOL_*` environment variables
+        when not passed explicitly. `factory` overrides how connections are
+        opened (the benchmarks pass one for their own SQLite database).
 
+        The indexes the tools need are then checked (`DB_VERIFY_INDEXES`:
+        "warn" logs missing ones, "create" creates them, "off" skips the
+        check), and `DB_EXPLAIN_GUARD` ("off", "log" or "reject") sets how
+        statements whose plan scans more than `DB_EXPLAIN_MAX_ROWS` rows
+        of a table are treated.
+        """
+        if self.pool is not None:
+            self.close_connection()
+
+        if factory is None:
+            use_mock = os.getenv("USE_MOCK_DB", "0").lower() in {"1", "true", "yes"}
+            if use_mock:
+                factory = self._mock_factory()
+            else:
+                factory = self._mysql_factory()
+
+        try:
+            self.pool = ConnectionPool(
+                factory,
+                min_size=min_size if min_size is not None else _env_int("DB_POOL_MIN_SIZE", 1),
+                max_size=max_size if max_size is not None else _env_int("DB_POOL_MAX_SIZE", 8),
+                idle_timeout=idle_timeout if idle_timeout is not None else _env_float("DB_POOL_IDLE_TIMEOUT", 300.0),
+                max_lifetime=max_lifetime if max_lifetime is not None else _env_float("DB_POOL_MAX_LIFETIME", 3600.0),
+                checkout_timeout=checkout_timeout if checkout_timeout is not None else _env_float("DB_POOL_TIMEOUT", 10.0),
+            )
+            logger.info(f"Database connection pool established (max_size={self.pool.max_size})")
+        except Exception as e:
+            logger.exception(f"Failed to connect to database: {e}")
+            raise
+
+        self.check_indexes(os.getenv("DB_VERIFY_INDEXES", "warn").lower())
+        self.guard = QueryGuard(
+            mode=os.getenv("DB_EXPLAIN_GUARD", "off").lower(),
+            max_rows=_env_int("DB_EXPLAIN_MAX_ROWS", 100_000),
+        )
+
+    def check_indexes(self, mode: str = "warn") -> List[RequiredIndex]:
+        """Check the indexes the tools rely on; in "create" mode, create the
+        missing ones. Returns the indexes still missing."""
+        if mode == "off":
+            return []
+        if mode not in ("warn", "create"):
+            raise ValueError(f"Unknown DB_VERIFY_INDEXES mode {mode!r}; expected off, warn or create")
+        try:
+            with self.pool.connection() as conn:
+                if mode == "create":
+                    migrate(conn)
+                missing = verify_indexes(conn)
+        except Exception as e:
+            logger.warning(f"Could not verify database indexes: {e}")
+            return []
+        for index in missing:
+            logger.warning(
+                f"Missing index on {index.table} ({index.column}); queries on it scan the whole table. "
+                "Set DB_VERIFY_INDEXES=create to add it."
+            )
+        return missing
+
+    def _mock_factory(self) -> Callable[[], Any]:
+        # The real tool SQL runs against a generated SQLite database
+        path = mock_database()
+        latency = _env_float("MOCK_DB_LATENCY_MS", 0.0) / 1000.0
+        logger.info(f"Using mock DB {path} (USE_MOCK_DB=1)")
+        return lambda: SQLiteConnection(path, latency=latency)
+
+    def _mysql_factory(self) -> Callable[[], Any]:
         host = os.getenv("DB_HOST")
         port = int(os.getenv("DB_PORT", "3306"))
         user = os.getenv("DB_USER")
@@ -97,8 +424,8 @@ class DatabaseConnection:
                 "Set USE_MOCK_DB=1 to run without a real database."
             )
 
-        try:
-            self.connection = pymysql.connect(
+        def factory():
+            return pymysql.connect(
                 host=host,
                 port=port,
                 user=user,
@@ -107,23 +434,99 @@ class DatabaseConnection:
                 connect_timeout=10,
                 read_timeout=30,
                 write_timeout=30,
+                # Pooled connections outlive a single query; without autocommit
+                # they would keep reading from the snapshot of their first SELECT
+                autocommit=True,
                 cursorclass=pymysql.cursors.DictCursor,
             )
-            logger.info("Database connection established")
-        except Exception as e:
-            logger.exception(f"Failed to connect to database: {e}")
-            raise
 
-    def get_connection(self):
-        return self.connection
+        return factory
+
+    @contextmanager
+    def checkout(self) -> Iterator[Any]:
+        """Check out a pooled connection for the duration of a `with` block.
+
+        Inside a `read_session()` this is the session's connection, in its
+        read-only transaction.
+        """
+        if self.pool is None:
+            raise RuntimeError("Database is not connected; call db.connect() first.")
+        session = _read_session.get()
+        with session.connection() if session is not None else self.pool.connection() as conn:
+            conn = guarded_connection(conn, self.guard)
+            yield traced_connection(conn) if tracer.enabled else conn
+
+    def in_read_session(self) -> bool:
+        """Whether checkouts of the current context read a session's snapshot."""
+        return _read_session.get() is not None
+
+    @contextmanager
+    def read_session(self) -> Iterator[Optional[ReadSession]]:
+        """Run the checkouts of a `with` block, including those of tool
+        threads started from it with a copy of the context, in one read-only
+        transaction with a consistent snapshot, so that the statements of a
+        plan all see the database at the same point in time.
+
+        The session holds a pooled connection and serializes the block's
+        statements on it, so keep the block to the queries themselves (no
+        model calls). Nested calls join the current session. Yields `None`,
+        and changes nothing, when `DB_READ_SESSIONS=0` (the default) or the
+        database is not connected.
+        """
+        current = _read_session.get()
+        if current is not None or not self.read_sessions or self.pool is None:
+            yield current
+            return
+        session = ReadSession(self.pool)
+        token = _read_session.set(session)
+        try:
+            yield session
+        finally:
+            _read_session.reset(token)
+            session.close()
+
+    @asynccontextmanager
+    async def aread_session(self) -> AsyncIterator[Optional[ReadSession]]:
+        """Asynchronous counterpart of `read_session`; the transaction is
+        ended in a worker thread rather than on the event loop."""
+        current = _read_session.get()
+        if current is not None or not self.read_sessions or self.pool is None:
+            yield current
+            return
+        session = ReadSession(self.pool)
+        token = _read_session.set(session)
+        try:
+            yield session
+        finally:
+            _read_session.reset(token)
+            await asyncio.to_thread(session.close)
 
     def close_connection(self):
-        if self.connection:
+        if self.pool:
             try:
-                self.connection.close()
-                logger.info("Database connection closed")
+                self.pool.close()
+                logger.info("Database connection pool closed")
             finally:
-                self.connection = None
+                self.pool = None
 
 
 db = DatabaseConnection()
+
+
+def stream_batches(conn: Any, query: str, params: Optional[tuple] = None, batch_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the rows of a SELECT in batches without materializing the result set.
+
+    On MySQL this uses an unbuffered server-side cursor (`SSDictCursor`):
+    rows are read off the socket `batch_size` at a time, so client memory
+    stays flat however many rows match. The connection cannot run another
+    statement until the generator is exhausted or closed.
+    """
+    batch_size = batch_size or _env_int("DB_STREAM_BATCH_SIZE", 1000)
+    with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
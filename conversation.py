@@ -0,0 +1,291 @@
+import asyncio
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from agentscope.message import Msg
+from agentscope.models import ModelWrapperBase, load_model_by_config_name
+from agentscope.service import ServiceToolkit
+from loguru import logger
+
+from agents.ChatAgent import ChatAgent
+from agents.Prefetcher import Prefetcher
+from agents.QueryAgent import QueryAgent
+from agents.ToolExecutor import ConcurrentToolExecutor
+from instrumentation import tracer
+from structure.QueryMemory import QueryResultStore
+from tools.ResultCodec import format_note
+
+from tools.InvaseAlarmEventsQuery import InvaseAlarmEventsQuery
+from tools.FlowQuery import FlowQuery
+from tools.FlowDistributeQuery import FlowDistribution
+from tools.LeaveRecordsQuery import LeaveRecordsQuery
+from tools.MultiInvaseAlarmIndexQuery import MultiInvaseAlarmPictureQuery
+from tools.InvaseAlarmIndexQuery import InvaseAlarmPictureQuery
+
+GREETING = 'Hello, I am your smart store assistant. How can I help today?'
+
+dialog_prompt = '''
+You are a multimodal smart store assistant. Follow these rules:
+
+0) Scope:
+If a user asks for non-store-monitoring topics, do not call the planner; answer directly using common sense.
+
+Data you can access:
+1. Passenger flow
+2. Intrusion events
+3. Intrusion event images
+4. Employee leave-post records
+
+When the above can address the user's needs, follow:
+1) Memory check: If you already have enough information in memory, answer directly. If memory is empty or insufficient, reply only with: "Plan." to trigger planning. When a user asks for images, reply "Plan." to fetch via planner + query agent.
+2) Response rules: Never fabricate; if insufficient info, reply only: "Plan." Do not imitate other agents' answers.
+3) Presentation: The user cannot see raw reports/internal data. Provide clear, structured, readable answers. Use lists/tables if helpful. To insert specific query results, place "[xxxxx]" where xxxxx is the query_id from results.
+4) Trigger: Replying "Plan." triggers the planner and query agent. You should use placeholders like [query_id] to show results where appropriate.
+5) Confidentiality: Be professional and friendly. Ensure accuracy and clarity.
+'''
+
+plan_prompt = '''
+Role: Planner for a multimodal video monitoring system
+
+Main tasks:
+1) Infer user needs from the Chat Assistant conversation
+2) Turn needs into concrete monitoring queries (keep simple; split into smaller queries)
+3) Do not ask follow-up questions; just produce a plan
+4) In an appendix, list prior query results required by this plan, using placeholders like [query_id]
+
+Principles:
+1) Summarize user needs first
+2) Only include monitoring-related queries within system capability
+3) Default to today's records unless specified
+
+Available query types:
+1) Passenger flow statistics across time ranges
+2) Passenger flow distribution within a single time range
+3) Intrusion events in a time range
+4) Intrusion event images by event_id
+5) Multiple intrusion event images by a set of event_ids
+6) Leave-post records in a time range
+
+Output format:
+1) Use a numbered list to present the query plan
+2) Each query must state the query type
+3) In the appendix, include needed prior query results as [query_id]
+
+Cautions:
+1) Stay strictly in scope
+2) Keep the plan concise; only query what is needed
+'''
+
+react_prompt = '''
+You are the Query Agent of the monitoring system.
+Your task is to query the database according to the planner's plan and return results.
+Notes:
+1) Return raw results (no summary)
+2) Your reply must only contain the full results returned by the tools
+3) The query date is fixed to 2024-05-27
+'''
+
+summarize_prompt = '''
+You are the Summarizer of the monitoring system.
+Summarize the query results concisely and present them clearly:
+1) Provide a brief summary for each query result (<= 20 words)
+2) Provide initial analysis
+3) Insert the corresponding [query_id] placeholder for each result
+4) Repeat for each query result
+
+Notes:
+1) If no valid data is received, report an error
+2) The reply should be well-structured
+'''
+
+
+def build_toolkit() -> ServiceToolkit:
+    service_toolkit = ServiceToolkit()
+    service_toolkit.add(FlowQuery)
+    service_toolkit.add(FlowDistribution)
+
+    service_toolkit.add(LeaveRecordsQuery)
+
+    service_toolkit.add(MultiInvaseAlarmPictureQuery)
+    service_toolkit.add(InvaseAlarmPictureQuery)
+    service_toolkit.add(InvaseAlarmEventsQuery)
+    return service_toolkit
+
+
+class SharedResources:
+    """What every conversation of a process shares: the tools and their
+    thread pool, the prefetch pool and one loaded model per config. The DB
+    pool (`connection.db`) and the tool cache are process-wide already.
+
+    Create it after `agentscope.init` has loaded the model configs.
+
+    Args:
+        prefetch_workers (int): threads of the shared prefetch pool;
+            defaults to `PREFETCH_WORKERS` or 2
+    """
+
+    def __init__(self, prefetch_workers: Optional[int] = None) -> None:
+        self.service_toolkit = build_toolkit()
+        # Shared by every QueryAgent instance so the number of tool threads stays bounded
+        self.tool_executor = ConcurrentToolExecutor(self.service_toolkit)
+        self.prefetch_pool = ThreadPoolExecutor(
+            max_workers=prefetch_workers or int(os.getenv("PREFETCH_WORKERS", "2")),
+            thread_name_prefix="prefetch",
+        )
+        self._models: Dict[str, ModelWrapperBase] = {}
+        self._lock = threading.Lock()
+
+    def model(self, config_name: str) -> ModelWrapperBase:
+        """The model of `config_name`, loaded once. Model wrappers keep no
+        per-conversation state, so one client serves every session."""
+        with self._lock:
+            model = self._models.get(config_name)
+            if model is None:
+                model = self._models[config_name] = load_model_by_config_name(config_name)
+            return model
+
+    def shutdown(self) -> None:
+        self.prefetch_pool.shutdown(wait=False, cancel_futures=True)
+        self.tool_executor.shutdown()
+
+
+def session_store() -> QueryResultStore:
+    """A result store for one conversation, sized by `SESSION_STORE_SIZE`
+    and `SESSION_STORE_MAX_BYTES`."""
+    return QueryResultStore(
+        max_entries=int(os.getenv("SESSION_STORE_SIZE", "64")),
+        max_bytes=int(os.getenv("SESSION_STORE_MAX_BYTES", str(4 * 1024 * 1024))),
+    )
+
+
+class Conversation:
+    """One user's conversation with the assistant.
+
+    Each conversation has its own agents (and so its own memories), its own
+    result store and its own last query result and summary; the models,
+    tools and caches come from `shared`. `respond` takes one user message
+    at a time and must not be called concurrently on the same conversation.
+
+    Args:
+        shared (SharedResources): resources shared with other conversations
+        session_id (str): identifies the conversation in logs; a random id
+            if omitted
+        query_store (QueryResultStore): results of earlier rounds; a new
+            `session_store` if omitted
+        verbose (bool): whether the QueryAgent prints its reasoning steps
+    """
+
+    def __init__(
+        self,
+        shared: SharedResources,
+        session_id: Optional[str] = None,
+        query_store: Optional[QueryResultStore] = None,
+        verbose: bool = True,
+    ) -> None:
+        self.shared = shared
+        self.session_id = session_id or uuid.uuid4().hex
+        self.query_store = query_store if query_store is not None else session_store()
+        self.verbose = verbose
+
+        self.plan_agent = self._chat_agent("Planner", plan_prompt)
+        self.summarize_agent = self._chat_agent("Summarizer", summarize_prompt)
+        self.dialog_agent = self._chat_agent("ChatAssistant", dialog_prompt)
+        self.query_agent = self._query_agent()
+        # Runs likely tool queries while the Planner and QueryAgent models think
+        self.prefetcher = Prefetcher(shared.service_toolkit, executor=shared.prefetch_pool)
+
+        self.query_result = Msg(name="QueryAgent", content='', role='assistant')  # last query result
+        self.summarize = Msg(name="Summarizer", content='', role='assistant')  # last summary
+        self.dialog: List[Msg] = []  # dialogue history for planner and summarizer
+        self.rounds = 0  # planning rounds run
+        self.turns = 0  # user messages answered
+
+    def greet(self) -> Msg:
+        msg = Msg(self.dialog_agent.name, GREETING, role="assistant")
+        self.dialog_agent.speak(msg)
+        return msg
+
+    async def respond(self, content: str) -> Msg:
+        """Answer one user message: from memory when the ChatAssistant can,
+        otherwise by planning, querying and summarizing a new round."""
+        msg = Msg("User", content, role="user")
+        turn = tracer.begin_turn(user_chars=len(content))
+        try:
+            self.turns += 1
+            fresh = not self.dialog
+            self.dialog.append(msg)
+            if fresh:
+                # feed the last query result and summary in the first message of a round
+                reply = await self.dialog_agent.areply([self.query_result, self.summarize, msg], self.query_result)
+            else:
+                reply = await self.dialog_agent.areply(msg, self.query_result)
+            if not reply.content.endswith("Plan."):
+                # Answered directly from memory
+                self.dialog.append(reply)
+                return reply
+            return await self._plan_round()
+        finally:
+            tracer.end_turn(turn)
+
+    async def _plan_round(self) -> Msg:
+        # "Plan." was detected: start the likely queries before the Planner runs
+        self.prefetcher.start([m.content for m in self.dialog if m.role == "user"])
+
+        # "Plan." itself is not given to the planner, to avoid confusing it
+        plan_input = [self.query_result] + self.dialog
+        msg = await self.plan_agent.areply(plan_input, self.query_result)
+
+        # Plan steps the compiler understands run without a model call
+        msg = await self.query_agent.areply_plan(msg)
+        # Prefetched results the plan did not ask for are not kept
+        self.prefetcher.discard()
+
+        self.query_result = msg
+        summarize_input = self.dialog + [msg]
+
+        # The summary does not depend on preparing the next round, so the
+        # summarizer's model call overlaps with recreating the query agent
+        # (to reduce context length) and with logging the round.
+        msg, self.query_agent, _ = await asyncio.gather(
+            self.summarize_agent.areply(summarize_input, self.query_result),
+            asyncio.to_thread(self._query_agent),
+            asyncio.to_thread(logger.info, f"Query round finished with {self.query_result.content.count('[RESULT]')} result(s)"),
+        )
+        self.summarize_agent = self._chat_agent("Summarizer", summarize_prompt)
+        self.summarize = msg
+        self.rounds += 1
+        # The planner and summarizer only see this round's dialogue. The
+        # ChatAssistant keeps its memory across rounds so follow-ups can be
+        # answered from it; its prompts stay within CHAT_TOKEN_BUDGET because
+        # results of earlier rounds are compacted to [query_id] references.
+        self.dialog = []
+        return msg
+
+    def close(self) -> None:
+        self.prefetcher.shutdown()
+
+    def _chat_agent(self, name: str, sys_prompt: str) -> ChatAgent:
+        return ChatAgent(
+            name=name,
+            model_config_name="qwen",
+            # The chat agents see the QueryAgent's [RESULT] text too
+            sys_prompt=sys_prompt + format_note(),
+            query_store=self.query_store,
+            model=self.shared.model("qwen"),
+        )
+
+    def _query_agent(self) -> QueryAgent:
+        return QueryAgent(
+            name="QueryAgent",
+            model_config_name="qwen_zero_temp",
+            verbose=self.verbose,
+            service_toolkit=self.shared.service_toolkit,
+            sys_prompt="",
+            max_iters=10,
+            tool_executor=self.shared.tool_executor,
+            query_store=self.query_store,
+            model=self.shared.model("qwen_zero_temp"),
+        )
@@ -0,0 +1,199 @@
+"""Synthetic alarm tables for the SQLite mock database.
+
+Passenger flow peaks at lunch and in the evening, intrusion alarms come in
+bursts and leave-post records fall within opening hours, over the days up
+to 2024-05-27 (the date the agents treat as today).
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+
+from database.SQLiteEngine import create_schema
+
+# Total passenger-flow rows per scale; intrusion alarms and leave-post
+# records are generated in proportion.
+SCALES: Dict[str, int] = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+DAYS = 28
+LAST_DAY = datetime(2024, 5, 27)  # the date the agents treat as "today"
+BATCH_SIZE = 50_000
+
+
+def first_day(days: int = DAYS) -> datetime:
+    return LAST_DAY - timedelta(days=days - 1)
+
+
+def _time_of_day(rng: random.Random) -> float:
+    """Seconds since midnight, shaped like store traffic: lunch and evening
+    peaks within opening hours plus a thin background."""
+    r = rng.random()
+    if r < 0.35:
+        t = rng.gauss(12.5 * 3600, 1.2 * 3600)
+    elif r < 0.75:
+        t = rng.gauss(18.5 * 3600, 1.5 * 3600)
+    elif r < 0.95:
+        t = rng.uniform(9 * 3600, 22 * 3600)
+    else:
+        t = rng.uniform(0, 86400)
+    return min(max(t, 0.0), 86399.0)
+
+
+def _flow_rows(rng: random.Random, total: int, days: int) -> Iterator[Tuple[int, str, int]]:
+    per_day = total // days
+    row_id = 0
+    for d in range(days):
+        day = first_day(days) + timedelta(days=d)
+        count = per_day + (total - per_day * days if d == days - 1 else 0)
+        for seconds in sorted(int(_time_of_day(rng)) for _ in range(count)):
+            row_id += 1
+            stamp = (day + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+            yield row_id, stamp, rng.choice((1, 1, 1, 1, 2, 2, 3, 4))
+
+
+def _intrusion_rows(rng: random.Random, total: int, days: int) -> Iterator[Tuple[int, str, str]]:
+    """Intrusion alarms come in bursts: a camera fires every few seconds
+    while someone stays in the restricted area."""
+    per_day = max(total // days, 1)
+    row_id = 0
+    for d in range(days):
+        day = first_day(days) + timedelta(days=d)
+        stamps = []
+        while len(stamps) < per_day:
+            t = _time_of_day(rng)
+            for _ in range(min(int(rng.expovariate(1 / 20)) + 1, per_day - len(stamps))):
+                stamps.append(int(t))
+                t = min(t + rng.choice((2, 3, 5, 8, 15, 30, 60, 90)), 86399)
+        for seconds in sorted(stamps):
+            row_id += 1
+            stamp = (day + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+            yield row_id, stamp, f"http://example.com/alarm/{row_id}.jpg"
+
+
+def _leave_rows(rng: random.Random, total: int, days: int) -> Iterator[Tuple[int, str, str, str, int]]:
+    per_day = max(total // days, 1)
+    row_id = 0
+    for d in range(days):
+        day = first_day(days) + timedelta(days=d)
+        for seconds in sorted(int(rng.uniform(8 * 3600, 21 * 3600)) for _ in range(per_day)):
+            row_id += 1
+            minutes = rng.choice((5, 10, 15, 20, 25, 30, 45))
+            start = day + timedelta(seconds=seconds)
+            end = start + timedelta(minutes=minutes)
+            yield (
+                row_id,
+                end.strftime("%Y-%m-%d %H:%M:%S"),
+                start.strftime("%H%M%S"),
+                end.strftime("%H%M%S"),
+                minutes,
+            )
+
+
+def _insert(conn: sqlite3.Connection, statement: str, rows: Iterator[tuple]) -> int:
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(statement, batch)
+            count += len(batch)
+            batch.clear()
+    if batch:
+        conn.executemany(statement, batch)
+        count += len(batch)
+    return count
+
+
+def generate(path: str, rows: int, seed: int = 42, days: int = DAYS) -> Dict[str, int]:
+    """Create a SQLite database with synthetic alarm tables.
+
+    Args:
+        path (str): database file to (re)create
+        rows (int): number of passenger-flow rows; intrusion alarms get half
+            as many and leave-post records 1%
+        seed (int): random seed, the same seed always yields the same data
+        days (int): number of days of data, ending on 2024-05-27
+
+    Returns:
+        dict: row count per table
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        create_schema(conn, with_indexes=False)
+        counts = {
+            "t_kltj_alarm_msg": _insert(
+                conn,
+                "INSERT INTO t_kltj_alarm_msg (id, create_time, person_num) VALUES (?, ?, ?)",
+                _flow_rows(rng, rows, days),
+            ),
+            "t_qyrq_alarm_msg": _insert(
+                conn,
+                "INSERT INTO t_qyrq_alarm_msg (id, alarm_time, alarm_pic_url) VALUES (?, ?, ?)",
+                _intrusion_rows(rng, rows // 2, days),
+            ),
+            "t_lgsb_alarm_record": _insert(
+                conn,
+                "INSERT INTO t_lgsb_alarm_record (id, alarm_time, time_slot_start, time_slot_end, interval_time) "
+                "VALUES (?, ?, ?, ?, ?)",
+                _leave_rows(rng, max(rows // 100, days), days),
+            ),
+        }
+        # Indexes are built after loading, which is much faster than
+        # maintaining them row by row
+        create_schema(conn, with_indexes=True)
+        conn.execute("ANALYZE")
+        conn.commit()
+        # Readers keep their snapshot while new alarms are written
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+
+    logger.info(f"Generated {counts} into {path} in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+_generate_lock = threading.Lock()
+
+
+def mock_database(
+    path: Optional[str] = None,
+    rows: Optional[int] = None,
+    seed: Optional[int] = None,
+    days: Optional[int] = None,
+) -> str:
+    """Path of the mock database, generated on first use.
+
+    Settings default to `MOCK_DB_ROWS` (passenger-flow rows, default
+    10000), `MOCK_DB_SEED` (42) and `MOCK_DB_DAYS` (28). The file is
+    `MOCK_DB_PATH` if set, else `runs/mock_db/<rows>-<seed>-<days>.sqlite`,
+    so each setting gets its own file. It is generated under a temporary
+    name and renamed, so a process never opens a half-written database.
+    """
+    rows = rows if rows is not None else int(os.getenv("MOCK_DB_ROWS", "10000"))
+    seed = seed if seed is not None else int(os.getenv("MOCK_DB_SEED", "42"))
+    days = days if days is not None else int(os.getenv("MOCK_DB_DAYS", str(DAYS)))
+    path = path or os.getenv("MOCK_DB_PATH") or os.path.join("runs", "mock_db", f"{rows}-{seed}-{days}.sqlite")
+    with _generate_lock:
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            generate(tmp, rows, seed=seed, days=days)
+            os.replace(tmp, path)
+    return path
@@ -0,0 +1,161 @@
+"""EXPLAIN-based guard against statements that scan whole tables.
+
+The first time a statement shape (its SQL text, with placeholders) runs,
+the guard explains it with the same parameters. A plan that reads a table
+in full (MySQL access type ALL or index; SQLite `SCAN`) whose estimated rows
+exceed `max_rows` is logged, or rejected in "reject" mode. Later
+executions of the same shape reuse the verdict, for the `MAX_VERDICTS`
+most recently run shapes.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from database.Schema import dialect
+
+MODES = ("off", "log", "reject")
+
+MAX_VERDICTS = 1024
+
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)")
+
+
+class SlowQueryError(RuntimeError):
+    """Raised in "reject" mode for a statement whose plan scans a table
+    of more than the allowed rows."""
+
+
+class QueryGuard:
+    """Checks each statement shape's plan once.
+
+    Args:
+        mode (str): "off", "log" or "reject"
+        max_rows (int): estimated rows a full scan may read
+    """
+
+    def __init__(self, mode: str = "off", max_rows: int = 100_000) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown query guard mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.max_rows = max_rows
+        # statement -> full scans above max_rows, as (table, estimated rows)
+        self._verdicts: "OrderedDict[str, List[Tuple[str, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def check(self, conn: Any, query: str, params: Any = None) -> None:
+        """Explain `query` on its first run and log or reject it.
+
+        Raises:
+            SlowQueryError: in "reject" mode, the plan scans too many rows
+        """
+        if not query.lstrip()[:6].upper() == "SELECT":
+            return
+        with self._lock:
+            scans = self._verdicts.get(query)
+            if scans is not None:
+                self._verdicts.move_to_end(query)
+        if scans is None:
+            try:
+                scans = [(table, rows) for table, rows in self.full_scans(conn, query, params) if rows > self.max_rows]
+            except Exception as e:
+                logger.warning(f"Could not EXPLAIN statement ({e}): {_short(query)}")
+                scans = []
+            with self._lock:
+                self._verdicts[query] = scans
+                while len(self._verdicts) > MAX_VERDICTS:
+                    self._verdicts.popitem(last=False)
+            for table, rows in scans:
+                logger.warning(f"Full scan of {table} (~{rows} rows) in: {_short(query)}")
+        if scans and self.mode == "reject":
+            table, rows = scans[0]
+            raise SlowQueryError(f"Statement rejected: full scan of {table} (~{rows} rows > {self.max_rows})")
+
+    def full_scans(self, conn: Any, query: str, params: Any = None) -> List[Tuple[str, int]]:
+        """(table, estimated rows) of each table the plan of `query` reads
+        in full."""
+        scans = []
+        with conn.cursor() as cursor:
+            if dialect(conn) == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+                tables = [match.group(1) for match in (_SQLITE_SCAN.match(row["detail"]) for row in cursor.fetchall()) if match]
+                for table in tables:
+                    scans.append((table, _sqlite_rows(cursor, table)))
+            else:
+                cursor.execute("EXPLAIN " + query, params)
+                for row in cursor.fetchall():
+                    if row.get("type") in ("ALL", "index"):
+                        scans.append((row.get("table"), int(row.get("rows") or 0)))
+        return scans
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "statements": len(self._verdicts),
+                "flagged": sum(1 for scans in self._verdicts.values() if scans),
+            }
+
+
+def _sqlite_rows(cursor: Any, table: str) -> int:
+    # Row count from the ANALYZE statistics, counted if there are none
+    try:
+        cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", (table,))
+        counts = [int(row["stat"].split()[0]) for row in cursor.fetchall()]
+    except Exception:
+        counts = []
+    if counts:
+        return max(counts)
+    cursor.execute(f"SELECT COUNT(*) AS n FROM {table}")
+    return int(cursor.fetchone()["n"])
+
+
+def _short(query: str) -> str:
+    return " ".join(query.split())[:200]
+
+
+class _GuardedCursor:
+    def __init__(self, cursor: Any, conn: Any, guard: QueryGuard) -> None:
+        self._cursor = cursor
+        self._conn = conn
+        self._guard = guard
+
+    def __enter__(self) -> "_GuardedCursor":
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> Any:
+        return self._cursor.__exit__(exc_type, exc, tb)
+
+    def execute(self, query: str, params: Any = None) -> Any:
+        self._guard.check(self._conn, query, params)
+        return self._cursor.execute(query, params)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+class _GuardedConnection:
+    def __init__(self, conn: Any, guard: QueryGuard) -> None:
+        self._conn = conn
+        self._guard = guard
+
+    def cursor(self, *args: Any, **kwargs: Any) -> _GuardedCursor:
+        return _GuardedCursor(self._conn.cursor(*args, **kwargs), self._conn, self._guard)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+
+def guarded_connection(conn: Any, guard: Optional[QueryGuard]) -> Any:
+    """Wrap a DB-API connection so every `cursor.execute` is checked by
+    `guard` first; returns `conn` itself when the guard is off."""
+    if guard is None or not guard.enabled:
+        return conn
+    return _GuardedConnection(conn, guard)
@@ -0,0 +1,173 @@
+"""SQLite stand-in for the MySQL database used by the tools.
+
+`SQLiteConnection` mimics the subset of the pymysql API the tools use
+(dict rows, `%s` placeholders, cursor context managers, `ping`) and
+rewrites the MySQL-only syntax in the tool statements to SQLite. It backs
+`USE_MOCK_DB=1` (see `database/MockData.py`) and the benchmarks.
+"""
+import functools
+import re
+import sqlite3
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+
+import pymysql
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS t_kltj_alarm_msg ("
+    "    id INTEGER PRIMARY KEY,"
+    "    create_time DATETIME NOT NULL,"
+    "    person_num INTEGER NOT NULL"
+    ")",
+    "CREATE TABLE IF NOT EXISTS t_qyrq_alarm_msg ("
+    "    id INTEGER PRIMARY KEY,"
+    "    alarm_time DATETIME NOT NULL,"
+    "    alarm_pic_url TEXT"
+    ")",
+    "CREATE TABLE IF NOT EXISTS t_lgsb_alarm_record ("
+    "    id INTEGER PRIMARY KEY,"
+    "    alarm_time DATETIME NOT NULL,"
+    "    time_slot_start TEXT,"
+    "    time_slot_end TEXT,"
+    "    interval_time INTEGER"
+    ")",
+)
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_kltj_create_time ON t_kltj_alarm_msg (create_time)",
+    "CREATE INDEX IF NOT EXISTS idx_qyrq_alarm_time ON t_qyrq_alarm_msg (alarm_time)",
+    "CREATE INDEX IF NOT EXISTS idx_lgsb_alarm_time ON t_lgsb_alarm_record (alarm_time)",
+)
+
+_INTERVAL_UNITS = {"SECOND": "seconds", "MINUTE": "minutes", "HOUR": "hours", "DAY": "days"}
+
+_TIMESTAMPDIFF = re.compile(r"TIMESTAMPDIFF\(\s*SECOND\s*,\s*([^,()]+?)\s*,\s*([^,()]+?)\s*\)", re.IGNORECASE)
+_INTERVAL = re.compile(r"(\?|\w+)\s*([+-])\s*INTERVAL\s+(\d+)\s+(SECOND|MINUTE|HOUR|DAY)\b", re.IGNORECASE)
+_DIV = re.compile(r"\bDIV\b", re.IGNORECASE)
+
+# Statement texts kept translated, and prepared per connection
+STATEMENT_CACHE_SIZE = 256
+
+
+def _epoch(expr: str) -> str:
+    return f"CAST(strftime('%s', {expr}) AS INTEGER)"
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def translate(query: str) -> str:
+    """Rewrite the MySQL dialect used by the tools into SQLite."""
+    sql = query.replace("%s", "?")
+    sql = _TIMESTAMPDIFF.sub(lambda m: f"({_epoch(m.group(2))} - {_epoch(m.group(1))})", sql)
+    sql = _INTERVAL.sub(
+        lambda m: f"datetime({m.group(1)}, '{m.group(2)}{m.group(3)} {_INTERVAL_UNITS[m.group(4).upper()]}')",
+        sql,
+    )
+    # Both operands are integers in the tool statements, so "/" truncates
+    return _DIV.sub("/", sql)
+
+
+def _adapt(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f" if value.microsecond else "%Y-%m-%d %H:%M:%S")
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _parse_datetime(value: bytes) -> datetime:
+    text = value.decode()
+    return datetime.strptime(text, "%Y-%m-%d %H:%M:%S.%f" if "." in text else "%Y-%m-%d %H:%M:%S")
+
+
+sqlite3.register_converter("DATETIME", _parse_datetime)
+
+
+class SQLiteCursor:
+    def __init__(self, conn: "SQLiteConnection") -> None:
+        self._conn = conn
+        self._cursor = conn._conn.cursor()
+        self._columns: List[str] = []
+
+    def __enter__(self) -> "SQLiteCursor":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def execute(self, query: str, params: Optional[Sequence[Any]] = None) -> int:
+        if self._conn.latency:
+            # Simulate a network round trip so pooled throughput is measurable
+            time.sleep(self._conn.latency)
+        self._cursor.execute(translate(query), tuple(_adapt(p) for p in params or ()))
+        self._columns = [d[0] for d in self._cursor.description or ()]
+        return self._cursor.rowcount
+
+    def _row(self, row: tuple) -> Dict[str, Any]:
+        return dict(zip(self._columns, row))
+
+    def fetchone(self) -> Optional[Dict[str, Any]]:
+        row = self._cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchmany(self, size: int = 1) -> List[Dict[str, Any]]:
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """A pymysql-like connection to a SQLite database file.
+
+    Args:
+        path (str): the database file
+        latency (float): seconds added to every statement
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str, latency: float = 0.0) -> None:
+        self.path = path
+        self.latency = latency
+        self._conn = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,  # autocommit, like the pooled MySQL connections
+            check_same_thread=False,  # the pool hands connections across threads
+            # Each statement text is prepared once per connection and reused
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        self.open = True
+
+    def cursor(self, *_args, **_kwargs) -> SQLiteCursor:
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, "SQLite connection is closed")
+        return SQLiteCursor(self)
+
+    def ping(self, reconnect: bool = False) -> None:
+        if not self.open:
+            raise pymysql.err.InterfaceError(0, "SQLite connection is closed")
+        self._conn.execute("SELECT 1")
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+
+    def close(self) -> None:
+        self.open = False
+        self._conn.close()
+
+
+def create_schema(conn: sqlite3.Connection, with_indexes: bool = True) -> None:
+    for statement in SCHEMA:
+        conn.execute(statement)
+    if with_indexes:
+        for statement in INDEXES:
+            conn.execute(statement)
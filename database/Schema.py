@@ -0,0 +1,77 @@
+"""Indexes the tools rely on, and a check that they exist.
+
+Every tool statement filters one alarm table by time (or by id), so a
+missing index turns it into a full scan, repeated for every period or
+segment of a query. `verify_indexes` finds the missing ones and
+`migrate` creates them; both work on MySQL and on the SQLite mock.
+"""
+from typing import Any, List, NamedTuple, Set
+
+from loguru import logger
+
+
+class RequiredIndex(NamedTuple):
+    table: str
+    column: str
+    name: str
+
+
+REQUIRED_INDEXES = (
+    RequiredIndex("t_kltj_alarm_msg", "create_time", "idx_kltj_create_time"),
+    RequiredIndex("t_qyrq_alarm_msg", "alarm_time", "idx_qyrq_alarm_time"),
+    RequiredIndex("t_qyrq_alarm_msg", "id", "PRIMARY"),
+    RequiredIndex("t_lgsb_alarm_record", "alarm_time", "idx_lgsb_alarm_time"),
+)
+
+
+def dialect(conn: Any) -> str:
+    """"sqlite" for the mock database, "mysql" otherwise."""
+    return getattr(conn, "dialect", "mysql")
+
+
+def _leading_columns(conn: Any, table: str) -> Set[str]:
+    """Columns that lead an index of `table`, i.e. that an index can
+    search by."""
+    columns = set()
+    with conn.cursor() as cursor:
+        if dialect(conn) == "sqlite":
+            cursor.execute(f"PRAGMA table_info({table})")
+            # An INTEGER PRIMARY KEY is the rowid, which needs no index
+            columns.update(row["name"] for row in cursor.fetchall() if row["pk"] == 1)
+            cursor.execute(f"PRAGMA index_list({table})")
+            for index in cursor.fetchall():
+                cursor.execute(f"PRAGMA index_info({index['name']})")
+                columns.update(row["name"] for row in cursor.fetchall() if row["seqno"] == 0)
+        else:
+            cursor.execute(f"SHOW INDEX FROM {table}")
+            columns.update(row["Column_name"] for row in cursor.fetchall() if int(row["Seq_in_index"]) == 1)
+    return columns
+
+
+def verify_indexes(conn: Any) -> List[RequiredIndex]:
+    """The required indexes that `conn`'s database lacks."""
+    missing = []
+    for table in dict.fromkeys(index.table for index in REQUIRED_INDEXES):
+        columns = _leading_columns(conn, table)
+        missing.extend(index for index in REQUIRED_INDEXES if index.table == table and index.column not in columns)
+    return missing
+
+
+def migrate(conn: Any) -> List[RequiredIndex]:
+    """Create the required indexes that are missing. Running it again does
+    nothing. Returns the indexes created.
+
+    A missing primary key is reported but not created: adding one rewrites
+    the table and should be done deliberately.
+    """
+    created = []
+    for index in verify_indexes(conn):
+        if index.name == "PRIMARY":
+            logger.error(f"{index.table} has no primary key on {index.column}; add it manually")
+            continue
+        logger.info(f"Creating index {index.name} on {index.table} ({index.column})")
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE INDEX {index.name} ON {index.table} ({index.column})")
+        conn.commit()
+        created.append(index)
+    return created
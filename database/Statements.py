@@ -0,0 +1,19 @@
+"""`IN` lists for the tool queries.
+
+The id values are always passed as parameters. pymysql interpolates them
+into the statement text on the client, so MySQL still parses each call's
+statement, and each list length is a different text.
+"""
+from typing import Any, Sequence, Tuple
+
+
+def in_list(template: str, values: Sequence[Any]) -> Tuple[str, Tuple[Any, ...]]:
+    """SQL and parameters of `template`, whose `{placeholders}` stands for
+    the `IN` list of `values`. An empty list becomes `IN (NULL)`, which
+    matches nothing.
+
+    Returns:
+        tuple: `(query, params)`
+    """
+    params = tuple(values) or (None,)
+    return template.format(placeholders=", ".join(["%s"] * len(params))), params
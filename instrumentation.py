@@ -0,0 +1,277 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from loguru import logger
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_current_turn: contextvars.ContextVar[Optional["Turn"]] = contextvars.ContextVar("current_turn", default=None)
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled; falsy so callers can skip
+    computing attributes nobody will record."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def __bool__(self) -> bool:
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """A timed stage. Spans nest through a context variable, so children
+    started in `asyncio` tasks or in threads that copied the context are
+    attached to the right parent and turn."""
+
+    __slots__ = ("tracer", "name", "attrs", "span_id", "parent_id", "turn", "start", "duration", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(tracer._ids)
+        self.parent_id: Optional[int] = None
+        self.turn: Optional[Turn] = None
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.turn = _current_turn.get()
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _current_span.reset(self._token)
+        self.tracer._finish(self)
+
+    def __bool__(self) -> bool:
+        return True
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+class Turn:
+    """All spans recorded between one user message and the final answer."""
+
+    __slots__ = ("turn_id", "attrs", "started_at", "start", "spans", "_token")
+
+    def __init__(self, attrs: Dict[str, Any]) -> None:
+        self.turn_id = str(uuid.uuid4())[:8]
+        self.attrs = attrs
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def record(self) -> Dict[str, Any]:
+        stages: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + span["duration_ms"], 3)
+        return {
+            "turn_id": self.turn_id,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "attrs": self.attrs,
+            "stages": stages,
+            "spans": self.spans,
+        }
+
+
+class Tracer:
+    """Per-stage latency and size instrumentation.
+
+    Spans are aggregated into an in-process summary; spans that belong to a
+    turn are also written, one JSON line per turn, to `path`. While disabled
+    every entry point returns immediately, and connections are not wrapped.
+    """
+
+    def __init__(self, enabled: bool = False, path: Optional[str] = None, window: int = 10000) -> None:
+        self.enabled = enabled
+        self.path = path or os.path.join("runs", f"trace-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._totals: Dict[str, float] = defaultdict(float)
+
+    def span(self, name: str, **attrs: Any):
+        """Context manager timing one stage."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def begin_turn(self, **attrs: Any) -> Optional[Turn]:
+        if not self.enabled:
+            return None
+        turn = Turn(attrs)
+        turn._token = _current_turn.set(turn)
+        return turn
+
+    def end_turn(self, turn: Optional[Turn]) -> None:
+        if turn is None:
+            return
+        _current_turn.reset(turn._token)
+        self._write(turn.record())
+
+    def _finish(self, span: Span) -> None:
+        with self._lock:
+            self._durations[span.name].append(span.duration)
+            self._counts[span.name] += 1
+            self._totals[span.name] += span.duration
+        if span.turn is not None:
+            span.turn.spans.append({
+                "name": span.name,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "offset_ms": round((span.start - span.turn.start) * 1000, 3),
+                "duration_ms": round(span.duration * 1000, 3),
+                **span.attrs,
+            })
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write trace record to {self.path}: {e}")
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Latency per stage since start-up (percentiles over the last
+        `window` spans of each stage)."""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._durations.items()}
+            counts = dict(self._counts)
+            totals = dict(self._totals)
+
+        result = {}
+        for name, values in snapshot.items():
+            result[name] = {
+                "count": counts[name],
+                "total_ms": round(totals[name] * 1000, 3),
+                "mean_ms": round(totals[name] * 1000 / counts[name], 3),
+                "p50_ms": round(values[int(0.50 * (len(values) - 1))] * 1000, 3),
+                "p95_ms": round(values[int(0.95 * (len(values) - 1))] * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        return result
+
+    def format_summary(self) -> str:
+        lines = [f"{'stage':<24} {'count':>6} {'total ms':>11} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"]
+        for name, s in sorted(self.summary().items(), key=lambda item: -item[1]["total_ms"]):
+            lines.append(
+                f"{name:<24} {s['count']:>6} {s['total_ms']:>11.1f} {s['mean_ms']:>9.1f} "
+                f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['max_ms']:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._totals.clear()
+
+
+def _prompt_chars(prompt: Any) -> int:
+    if isinstance(prompt, str):
+        return len(prompt)
+    return len(json.dumps(prompt, ensure_ascii=False, default=str))
+
+
+def _token_usage(raw: Any) -> Dict[str, int]:
+    """Token counts from an OpenAI-style (`prompt_tokens`) or DashScope-style
+    (`input_tokens`) usage block, if the model response carries one."""
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if not usage:
+        return {}
+    get = usage.get if hasattr(usage, "get") else lambda key: getattr(usage, key, None)
+    prompt_tokens = get("prompt_tokens") or get("input_tokens")
+    completion_tokens = get("completion_tokens") or get("output_tokens")
+    counts = {}
+    if prompt_tokens is not None:
+        counts["prompt_tokens"] = int(prompt_tokens)
+    if completion_tokens is not None:
+        counts["completion_tokens"] = int(completion_tokens)
+    return counts
+
+
+def record_model_io(span: Any, prompt: Any, response: Any = None) -> None:
+    """Attach prompt/response sizes and token usage to a model span."""
+    if not span:
+        return
+    span.set(prompt_chars=_prompt_chars(prompt))
+    if response is not None:
+        span.set(response_chars=len(getattr(response, "text", None) or ""))
+        span.set(**_token_usage(getattr(response, "raw", None)))
+
+
+class _TracedCursor:
+    def __init__(self, cursor: Any) -> None:
+        self._cursor = cursor
+
+    def __enter__(self) -> "_TracedCursor":
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> Any:
+        return self._cursor.__exit__(exc_type, exc, tb)
+
+    def execute(self, query: str, params: Any = None) -> Any:
+        with tracer.span("sql", statement=" ".join(query.split())[:120]) as span:
+            result = self._cursor.execute(query, params)
+            span.set(rowcount=getattr(self._cursor, "rowcount", None))
+            return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+class _TracedConnection:
+    def __init__(self, conn: Any) -> None:
+        self._conn = conn
+
+    def cursor(self, *args: Any, **kwargs: Any) -> _TracedCursor:
+        return _TracedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+
+def traced_connection(conn: Any) -> Any:
+    """Wrap a DB-API connection so every `cursor.execute` becomes a span."""
+    return _TracedConnection(conn)
+
+
+tracer = Tracer(
+    enabled=os.getenv("TRACE", "0").lower() in {"1", "true", "yes"},
+    path=os.getenv("TRACE_FILE") or None,
+)
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from agentscope.models import ModelResponse, ModelWrapperBase
+from agentscope.models import _get_model_wrapper
+
+from instrumentation import tracer
+
+
+class DiskCache:
+    """Content-addressed store of model responses on local disk.
+
+    Each entry is one JSON file named after the SHA-256 of its key, in a
+    subdirectory named after the first two hex digits. When the files
+    exceed `max_bytes` the least recently used ones are deleted; a hit
+    refreshes the file's modification time.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # digest -> (size, last use); loaded from the directory on first use
+        self._index: Optional[Dict[str, Tuple[int, float]]] = None
+        self._bytes = 0
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        text = json.dumps(parts, sort_keys=True, ensure_ascii=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        path = self._path(digest)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            index = self._load_index()
+            if digest in index:
+                index[digest] = (index[digest][0], now)
+        return entry
+
+    def put(self, digest: str, entry: Dict[str, Any]) -> None:
+        data = json.dumps(entry, ensure_ascii=True).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so concurrent readers never see partial files
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            index = self._load_index()
+            previous = index.get(digest)
+            if previous is not None:
+                self._bytes -= previous[0]
+            index[digest] = (len(data), time.time())
+            self._bytes += len(data)
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._load_index()
+            return {"entries": len(self._index), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        with self._lock:
+            for digest in list(self._load_index()):
+                self._remove(digest)
+            self.hits = self.misses = 0
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest + ".json")
+
+    def _load_index(self) -> Dict[str, Tuple[int, float]]:
+        if self._index is None:
+            self._index = {}
+            if os.path.isdir(self.directory):
+                for root, _, files in os.walk(self.directory):
+                    for name in files:
+                        if not name.endswith(".json"):
+                            continue
+                        stat = os.stat(os.path.join(root, name))
+                        self._index[name[:-5]] = (stat.st_size, stat.st_mtime)
+            self._bytes = sum(size for size, _ in self._index.values())
+        return self._index
+
+    def _evict(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        for digest, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._bytes <= self.max_bytes:
+                break
+            self._remove(digest)
+
+    def _remove(self, digest: str) -> None:
+        size, _ = self._index.pop(digest)
+        self._bytes -= size
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+
+_caches: Dict[str, DiskCache] = {}
+_caches_lock = threading.Lock()
+
+
+def disk_cache(directory: str, max_bytes: int) -> DiskCache:
+    """The cache for `directory`, shared by every model using it."""
+    directory = os.path.abspath(directory)
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = DiskCache(directory, max_bytes)
+        return cache
+
+
+class CachedModelWrapper(ModelWrapperBase):
+    """Wraps another model config and answers repeated prompts from disk.
+
+    The key is a hash of the wrapped config's model type, model name and
+    generation arguments, the formatted prompt and the call's keyword
+    arguments. Only the response text is stored. Use `cached_model_configs`
+    rather than writing these configs by hand.
+    """
+
+    model_type: str = "cached"
+
+    def __init__(
+        self,
+        config_name: str,
+        model: Dict[str, Any],
+        cache_dir: str = "runs/model_cache",
+        max_bytes: int = 64 * 1024 * 1024,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Args:
+            config_name (str): name of the config; also given to the wrapped model
+            model (dict): the wrapped model config, without `config_name`
+            cache_dir (str): directory of the cache files
+            max_bytes (int): total size of the cache files
+        """
+        super().__init__(config_name=config_name)
+        model = dict(model)
+        model_type = model.pop("model_type")
+        self.model = _get_model_wrapper(model_type)(config_name=config_name, **model)
+        self.model_name = getattr(self.model, "model_name", None)
+        self.cache = disk_cache(cache_dir, max_bytes)
+        self._identity = {
+            "model_type": model_type,
+            "model_name": self.model_name,
+            "generate_args": model.get("generate_args") or {},
+        }
+
+    def format(self, *args: Any) -> Any:
+        return self.model.format(*args)
+
+    def __call__(self, messages: Any, **kwargs: Any) -> ModelResponse:
+        digest = self.cache.key(self._identity, messages, kwargs)
+        with tracer.span("model.cache", config=self.config_name) as span:
+            entry = self.cache.get(digest)
+            span.set(hit=entry is not None)
+        if entry is not None:
+            return ModelResponse(text=entry["text"])
+
+        response = self.model(messages, **kwargs)
+        if response.text is not None:
+            self.cache.put(digest, {"text": response.text})
+        return response
+
+
+def is_deterministic(config: Dict[str, Any]) -> bool:
+    """Whether a model config always gives the same answer to a prompt,
+    i.e. samples with temperature 0."""
+    generate_args = config.get("generate_args") or {}
+    return generate_args.get("temperature") == 0
+
+
+def cached_model_configs(
+    configs: List[Dict[str, Any]],
+    cache_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    enabled: Optional[bool] = None,
+) -> List[Dict[str, Any]]:
+    """Wrap the deterministic configs of `configs` in `CachedModelWrapper`.
+
+    Configs that sample (temperature above 0) are returned unchanged, since
+    replaying one stored answer would change their behaviour. Settings
+    default to `MODEL_CACHE`, `MODEL_CACHE_DIR` and `MODEL_CACHE_MAX_BYTES`.
+    """
+    if enabled is None:
+        enabled = os.getenv("MODEL_CACHE", "1").lower() in {"1", "true", "yes"}
+    if not enabled:
+        return configs
+    cache_dir = cache_dir or os.getenv("MODEL_CACHE_DIR", "runs/model_cache")
+    if max_bytes is None:
+        max_bytes = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    wrapped = []
+    for config in configs:
+        if config.get("model_type") == CachedModelWrapper.model_type or not is_deterministic(config):
+            wrapped.append(config)
+            continue
+        model = {key: value for key, value in config.items() if key != "config_name"}
+        wrapped.append({
+            "config_name": config["config_name"],
+            "model_type": CachedModelWrapper.model_type,
+            "model": model,
+            "cache_dir": cache_dir,
+            "max_bytes": max_bytes,
+        })
+        logger.info(f"Caching responses of model config [{config['config_name']}] in {cache_dir}")
+    return wrapped
+
+
+def load_model_configs(path: str) -> List[Dict[str, Any]]:
+    """Read a model config file (one config or a list of them) and enable
+    the response cache on its deterministic configs."""
+    with open(path, encoding="utf-8") as f:
+        configs = json.load(f)
+    if isinstance(configs, dict):
+        configs = [configs]
+    return cached_model_configs(configs)
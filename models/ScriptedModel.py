@@ -0,0 +1,225 @@
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from agentscope.models import ModelResponse, ModelWrapperBase
+
+from structure.MemoryCompactor import RESULT, estimate_tokens
+from tools.ResultCodec import decode
+
+# Query types in the order the scripted Planner lists them, with the words
+# that select them and the tool that answers them
+QUERY_TYPES: List[Tuple[str, Tuple[str, ...], str]] = [
+    ("Passenger flow statistics", ("flow", "visitor", "customer", "passenger", "traffic", "客流"), "FlowQuery"),
+    ("Passenger flow distribution", ("distribution", "busiest", "peak", "segment", "分布"), "FlowDistribution"),
+    ("Leave-post records", ("leave", "left the post", "absent", "staff", "employee", "离岗"), "LeaveRecordsQuery"),
+    ("Intrusion events in time range", ("intrusion", "alarm", "event", "image", "picture", "photo", "入侵", "图片"), "InvaseAlarmEventsQuery"),
+    ("Multiple intrusion event images", ("image", "picture", "photo", "图片"), "MultiInvaseAlarmPictureQuery"),
+]
+
+RESULT_TYPES = {
+    "Passenger flow statistics": "passenger_flow_statistics",
+    "Passenger flow distribution": "passenger_flow_distribution",
+    "Leave-post records": "leave_post_records",
+    "Intrusion events in time range": "intrusion_events_in_time_range",
+    "Multiple intrusion event images": "multiple_intrusion_event_images",
+}
+
+PERIODS = {
+    "morning": ("06:00:00", "11:59:59"),
+    "afternoon": ("12:00:00", "17:59:59"),
+    "evening": ("18:00:00", "23:59:59"),
+}
+
+PLAN_STEP = re.compile(
+    r"^\s*(\d+)\. ([^:\n]+): (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) - (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:, (\d+) segments)?",
+    re.MULTILINE,
+)
+RESULT_HEAD = re.compile(r'"query_id": "([^"]+)", "query_type": "([^"]+)"(?:, "(total_\w+)": (\d+))?')
+
+
+def topics(text: str) -> List[str]:
+    """Query types a question asks about, by keyword."""
+    text = text.lower()
+    return [label for label, words, _ in QUERY_TYPES if any(word in text for word in words)]
+
+
+def time_range(text: str, today: str) -> Tuple[str, str]:
+    day = today
+    if "yesterday" in text.lower() or "昨天" in text:
+        day = time.strftime("%Y-%m-%d", time.localtime(time.mktime(time.strptime(today, "%Y-%m-%d")) - 86400))
+    for name, (start, end) in PERIODS.items():
+        if name in text.lower():
+            return f"{day} {start}", f"{day} {end}"
+    return f"{day} 00:00:00", f"{day} 23:59:59"
+
+
+class ScriptedChatWrapper(ModelWrapperBase):
+    """A local, deterministic stand-in for the chat models, so `app.py` can
+    run and be timed without an API key.
+
+    It recognises the agent it serves from the system prompt and answers
+    with simple keyword rules: the ChatAssistant replies "Plan." until the
+    results it needs are in its prompt, the Planner lists one numbered query
+    per topic of the question, the QueryAgent turns those steps into tool
+    calls and the Summarizer lists the results it received. `latency_ms`,
+    `ms_per_token` (per completion token) and `ms_per_prompt_token` (prompt
+    processing) add a simulated response time.
+    """
+
+    model_type: str = "scripted_chat"
+
+    def __init__(
+        self,
+        config_name: str,
+        model_name: str = "scripted",
+        latency_ms: float = 0,
+        ms_per_token: float = 0,
+        ms_per_prompt_token: float = 0,
+        today: str = "2024-05-27",
+        generate_args: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(config_name=config_name)
+        self.model_name = model_name
+        self.latency_ms = latency_ms
+        self.ms_per_token = ms_per_token
+        self.ms_per_prompt_token = ms_per_prompt_token
+        self.today = today
+        self.generate_args = generate_args or {}
+
+    def format(self, *args: Any) -> List[Dict[str, str]]:
+        messages = []
+        for arg in args:
+            if arg is None:
+                continue
+            for msg in arg if isinstance(arg, (list, tuple)) else [arg]:
+                messages.append({"role": msg.role, "name": msg.name, "content": str(msg.content)})
+        return messages
+
+    def __call__(self, messages: Sequence[Dict[str, str]], **kwargs: Any) -> ModelResponse:
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        if "Query Agent" in system:
+            text = self._query(messages)
+        elif "Planner" in system:
+            text = self._plan(messages)
+        elif "Summarizer" in system:
+            text = self._summarize(messages)
+        else:
+            text = self._chat(messages)
+
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(text)
+        delay = self.latency_ms + self.ms_per_token * completion_tokens + self.ms_per_prompt_token * prompt_tokens
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return ModelResponse(
+            text=text,
+            raw={"usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}},
+        )
+
+    @staticmethod
+    def _last_question(messages: Sequence[Dict[str, str]]) -> str:
+        for message in reversed(messages):
+            if message["role"] == "user" and topics(message["content"]):
+                return message["content"]
+        for message in reversed(messages):
+            if message["role"] == "user":
+                return message["content"]
+        return ""
+
+    def _chat(self, messages: Sequence[Dict[str, str]]) -> str:
+        question = next((message["content"] for message in reversed(messages) if message["role"] == "user"), "")
+        wanted = topics(question)
+        if not wanted:
+            return (
+                "I can help with passenger flow, intrusion events and their images, "
+                "and employee leave-post records. What would you like to know?"
+            )
+        # Newest result of each type in the prompt
+        latest = {}
+        for message in messages:
+            for query_id, query_type, _, _ in RESULT_HEAD.findall(message["content"]):
+                latest[query_type] = query_id
+        found = [(label, latest.get(RESULT_TYPES[label])) for label in wanted]
+        if not all(query_id for _, query_id in found):
+            return "Plan."
+        lines = ["Here is what I found:"]
+        lines += [f"- {label}: [{query_id}]" for label, query_id in found]
+        return "\n".join(lines)
+
+    def _plan(self, messages: Sequence[Dict[str, str]]) -> str:
+        question = self._last_question(messages)
+        start, end = time_range(question, self.today)
+        lines = [f"User needs: {question.strip()}"]
+        for label in topics(question) or ["Passenger flow statistics"]:
+            step = f"{len(lines)}. {label}: {start} - {end}"
+            if label == "Passenger flow distribution":
+                step += ", 6 segments"
+            lines.append(step)
+        lines.append("Appendix: none")
+        return "\n".join(lines)
+
+    def _query(self, messages: Sequence[Dict[str, str]]) -> str:
+        plan = next((message["content"] for message in messages if message["name"] == "Planner"), "")
+        executed = " ".join(
+            message["content"] for message in messages if message["content"].startswith("Executed functions")
+        )
+        results = [message["content"] for message in messages if "[RESULT]: " in message["content"]]
+
+        calls = []
+        tools = {label: tool for label, _, tool in QUERY_TYPES}
+        for _, label, start, end, segments in PLAN_STEP.findall(plan):
+            tool = tools.get(label.strip())
+            if tool is None or f"'{tool}'" in executed:
+                continue
+            if tool == "FlowQuery":
+                arguments = {"time_ranges": f"{start} - {end}"}
+            elif tool == "FlowDistribution":
+                arguments = {"time_range": f"{start} - {end}", "num_segments": segments or "6"}
+            elif tool == "MultiInvaseAlarmPictureQuery":
+                if "'InvaseAlarmEventsQuery'" not in executed:
+                    continue  # needs the event ids first
+                ids = self._event_ids(results)
+                if not ids:
+                    continue
+                arguments = {"ids": ids[:10]}
+            else:
+                arguments = {"start_time": start, "end_time": end}
+            calls.append({"name": tool, "arguments": arguments})
+
+        thought = "Query" if calls else "Done"
+        return "```json\n" + json.dumps({"thought": thought, "function": calls}) + "\n```"
+
+    @staticmethod
+    def _event_ids(results: Sequence[str]) -> List[int]:
+        # Full, compact (tools/ResultCodec.py) and compacted-to-reference
+        # results alike
+        ids = []
+        for text in results:
+            for _, result in RESULT.findall(text):
+                try:
+                    data = decode(json.loads(result))
+                except ValueError:
+                    continue
+                if not isinstance(data, dict) or data.get("query_type") != "intrusion_events_in_time_range":
+                    continue
+                ids.extend(event["id"] for event in data.get("events", ()))
+                ids.extend(data.get("ids", ()))
+        return list(dict.fromkeys(ids))
+
+    def _summarize(self, messages: Sequence[Dict[str, str]]) -> str:
+        labels = {query_type: label for label, query_type in RESULT_TYPES.items()}
+        lines = []
+        seen = set()
+        for message in messages:
+            for query_id, query_type, total, count in RESULT_HEAD.findall(message["content"]):
+                if query_id in seen:
+                    continue
+                seen.add(query_id)
+                brief = f"{count} {total[len('total_'):]}" if total else "see details"
+                lines.append(f"- {labels.get(query_type, query_type)}: {brief} [{query_id}]")
+        if not lines:
+            return "Error: no valid query results were received."
+        return "Summary of the query results:\n" + "\n".join(lines)
@@ -1,165 +1,170 @@
 import json
 import re
-from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+# "[query_id]" placeholders the chat agents put in their replies
+PLACEHOLDER = re.compile(r"\[([a-zA-Z0-9-]+)\]")
+
+# query_type -> function rendering one tool result as a text report
+RENDERERS: Dict[str, Callable[[dict], str]] = {}
+
+
+def renderer(query_type):
+    def register(func):
+        RENDERERS[query_type] = func
+        return func
+    return register
+
+
+def render_report(data):
+    query_type = data.get("query_type")
+    render = RENDERERS.get(query_type)
+    if render is None:
+        return f"Unknown query type: {query_type}"
+    return render(data)
 
 
 def parse_json(json_data, input_string):
-    data_list = json_data
-    reports = {}
-    if json_data == "":
+    """Replace each "[query_id]" in `input_string` with the report of that
+    query result.
+
+    Reports are rendered lazily, only for ids the text references, and at
+    most once per call; text without placeholders is returned as is.
+    """
+    if json_data == "" or "[" not in input_string:
         return input_string
-    for data in data_list:
-        query_id = data.get("query_id")
-        query_type = data.get("query_type")
-
-        if query_type == "leave_post_records":
-            report = process_leave_post_records(data)
-        elif query_type == "multiple_intrusion_event_images":
-            report = process_multiple_intrusion_events(data)
-        elif query_type == "intrusion_event_images_by_id":
-            report = process_specific_intrusion_event(data)
-        elif query_type == "intrusion_events_in_time_range":
-            report = process_time_range_intrusion_records(data)
-        elif query_type == "passenger_flow_statistics":
-            report = process_passenger_flow_statistics(data)
-        elif query_type == "passenger_flow_distribution":
-            report = process_passenger_flow_distribution(data)
-        else:
-            report = f"Unknown query type: {query_type}"
-
-        reports[query_id] = report
+
+    # Later results win when ids repeat
+    results = {data.get("query_id"): data for data in json_data}
+    reports = {}
 
     def replace_query_id(match):
         mid = match.group(1)
-        return reports.get(mid, f"[Query ID not found: {mid}]")
+        report = reports.get(mid)
+        if report is None:
+            data = results.get(mid)
+            report = render_report(data) if data is not None else f"[Query ID not found: {mid}]"
+            reports[mid] = report
+        return report
 
-    result = re.sub(r"\[([a-zA-Z0-9-]+)\]", replace_query_id, input_string)
-    return result
+    return PLACEHOLDER.sub(replace_query_id, input_string)
 
 
 def format_time(time_str):
     return f"{time_str[:2]}:{time_str[2:4]}:{time_str[4:]}"
 
 
-def format_duration(duration):
-    hours, remainder = divmod(duration.seconds, 3600)
+def _seconds_of_day(time_str):
+    return int(time_str[:2]) * 3600 + int(time_str[2:4]) * 60 + int(time_str[4:])
+
+
+def format_duration(seconds):
+    hours, remainder = divmod(seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
     return f"{hours} hours {minutes} minutes {seconds} seconds"
 
 
+@renderer("leave_post_records")
 def process_leave_post_records(data):
-    query_id = data["query_id"]
-    total_records = data["total_records"]
-    records = data["leave_post_records"]
-
-    report = f"Query ID: {query_id} (leave-post records)\n"
-    report += f"Total records: {total_records}\n"
-    report += "Details:\n"
-
-    for index, record in enumerate(records, 1):
-        start_time = format_time(record["time_slot_start"])
-        end_time = format_time(record["time_slot_end"])
-
-        start_datetime = datetime.strptime(start_time, "%H:%M:%S")
-        end_datetime = datetime.strptime(end_time, "%H:%M:%S")
-        interval = end_datetime - start_datetime
-        if interval < timedelta(0):
-            interval += timedelta(hours=24)
-
-        formatted_interval = format_duration(interval)
-
-        report += f"  Record {index}:\n"
-        report += f"    Start: {start_time}\n"
-        report += f"    End: {end_time}\n"
-        report += f"    Duration: {formatted_interval}\n\n"
-
-    return report
+    parts = [
+        f"Query ID: {data['query_id']} (leave-post records)\n"
+        f"Total records: {data['total_records']}\n"
+        "Details:\n"
+    ]
+    for index, record in enumerate(data["leave_post_records"], 1):
+        # Slots are HHMMSS within a day; a slot ending before it starts
+        # crosses midnight
+        interval = (_seconds_of_day(record["time_slot_end"]) - _seconds_of_day(record["time_slot_start"])) % 86400
+        parts.append(
+            f"  Record {index}:\n"
+            f"    Start: {format_time(record['time_slot_start'])}\n"
+            f"    End: {format_time(record['time_slot_end'])}\n"
+            f"    Duration: {format_duration(interval)}\n\n"
+        )
+    return "".join(parts)
 
 
+@renderer("multiple_intrusion_event_images")
 def process_multiple_intrusion_events(data):
-    query_id = data["query_id"]
     events = data["events"]
-
-    report = f"Query ID: {query_id} (multiple intrusion event images)\n"
-    report += f"Total events: {len(events)}\n"
-    report += "Details:\n"
-
-    for index, event in enumerate(events, 1):
-        report += f"  Event {index}:\n"
-        report += f"    ID: {event['id']}\n"
-        report += f"    Alarm time: {event['alarm_time']}\n"
-        report += f"    Image URL: {event['url']}\n\n"
-
-    return report
+    parts = [
+        f"Query ID: {data['query_id']} (multiple intrusion event images)\n"
+        f"Total events: {len(events)}\n"
+        "Details:\n"
+    ]
+    parts.extend(
+        f"  Event {index}:\n"
+        f"    ID: {event['id']}\n"
+        f"    Alarm time: {event['alarm_time']}\n"
+        f"    Image URL: {event['url']}\n\n"
+        for index, event in enumerate(events, 1)
+    )
+    return "".join(parts)
 
 
+@renderer("intrusion_event_images_by_id")
 def process_specific_intrusion_event(data):
-    query_id = data["query_id"]
     events = data["events"]
-
-    report = f"Query ID: {query_id} (intrusion event images by id)\n"
-    report += f"Total images: {len(events)}\n"
-    report += "Details:\n"
-
-    for index, event in enumerate(events, 1):
-        report += f"  Image {index}:\n"
-        report += f"    Alarm time: {event['alarm_time']}\n"
-        report += f"    Image URL: {event['url']}\n\n"
-
-    return report
+    parts = [
+        f"Query ID: {data['query_id']} (intrusion event images by id)\n"
+        f"Total images: {len(events)}\n"
+        "Details:\n"
+    ]
+    parts.extend(
+        f"  Image {index}:\n"
+        f"    Alarm time: {event['alarm_time']}\n"
+        f"    Image URL: {event['url']}\n\n"
+        for index, event in enumerate(events, 1)
+    )
+    return "".join(parts)
 
 
+@renderer("intrusion_events_in_time_range")
 def process_time_range_intrusion_records(data):
-    query_id = data["query_id"]
-    total_events = data["total_events"]
-    events = data["events"]
-
-    report = f"Query ID: {query_id} (intrusion events in time range)\n"
-    report += f"Total events: {total_events}\n"
-    report += "Details:\n"
-
-    for index, event in enumerate(events, 1):
-        report += f"  Event {index}:\n"
-        report += f"    Alarm time: {event['alarm_time']}\n"
-        report += f"    ID: {event['id']}\n\n"
-
-    return report
+    parts = [
+        f"Query ID: {data['query_id']} (intrusion events in time range)\n"
+        f"Total events: {data['total_events']}\n"
+        "Details:\n"
+    ]
+    parts.extend(
+        f"  Event {index}:\n"
+        f"    Alarm time: {event['alarm_time']}\n"
+        f"    ID: {event['id']}\n\n"
+        for index, event in enumerate(data["events"], 1)
+    )
+    return "".join(parts)
 
 
+@renderer("passenger_flow_statistics")
 def process_passenger_flow_statistics(data):
-    query_id = data["query_id"]
-    total_periods = data["total_periods"]
-    periods = data["periods"]
-
-    report = f"Query ID: {query_id} (passenger flow statistics)\n"
-    report += f"Total periods: {total_periods}\n"
-    report += "Details:\n"
-
-    for index, period in enumerate(periods, 1):
-        report += f"  Period {index}:\n"
-        report += f"    Start: {period['start_time']}\n"
-        report += f"    End: {period['end_time']}\n"
-        report += f"    Passenger flow: {period['passenger_flow']}\n\n"
-
-    return report
+    parts = [
+        f"Query ID: {data['query_id']} (passenger flow statistics)\n"
+        f"Total periods: {data['total_periods']}\n"
+        "Details:\n"
+    ]
+    parts.extend(
+        f"  Period {index}:\n"
+        f"    Start: {period['start_time']}\n"
+        f"    End: {period['end_time']}\n"
+        f"    Passenger flow: {period['passenger_flow']}\n\n"
+        for index, period in enumerate(data["periods"], 1)
+    )
+    return "".join(parts)
 
 
+@renderer("passenger_flow_distribution")
 def process_passenger_flow_distribution(data):
-    query_id = data["query_id"]
-    total_segments = data["total_segments"]
-    segments = data["segments"]
-
-    report = f"Query ID: {query_id} (passenger flow distribution)\n"
-    report += f"Total segments: {total_segments}\n"
-    report += "Details:\n"
-
-    for index, segment in enumerate(segments, 1):
-        report += (
-            f"  Segment {index}: {segment['start_time']} - {segment['end_time']}, "
-            f"Passenger flow: {segment['passenger_flow']}\n"
-        )
-
-    return report
+    parts = [
+        f"Query ID: {data['query_id']} (passenger flow distribution)\n"
+        f"Total segments: {data['total_segments']}\n"
+        "Details:\n"
+    ]
+    parts.extend(
+        f"  Segment {index}: {segment['start_time']} - {segment['end_time']}, "
+        f"Passenger flow: {segment['passenger_flow']}\n"
+        for index, segment in enumerate(data["segments"], 1)
+    )
+    return "".join(parts)
 
 
 def test_parser():
@@ -1,9 +1,11 @@
 import re
 import json
 
+from tools.ResultCodec import decode
+
 
 def extract_results(input_str):
     pattern = r"\[RESULT\]: (.*?)\n"
     matches = re.findall(pattern, input_str, re.DOTALL)
-    results = [json.loads(match) for match in matches]
+    results = [decode(json.loads(match)) for match in matches]
     return results
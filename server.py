@@ -0,0 +1,380 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple
+
+import agentscope
+from agentscope.message import Msg
+from loguru import logger
+
+from connection import db
+from conversation import Conversation, SharedResources
+from models.ModelCache import load_model_configs
+import models.ScriptedModel  # noqa: F401  (registers the offline "scripted_chat" model type)
+from tools.ToolCache import tool_cache
+
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 429: "Too Many Requests",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """An error answered with `status` and a JSON `{"error": message}`."""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class Session:
+    __slots__ = ("conversation", "lock", "pending", "created_at", "last_used")
+
+    def __init__(self, conversation: Conversation) -> None:
+        self.conversation = conversation
+        # One turn of a conversation at a time; the agents' memories are
+        # not safe to use from two turns at once
+        self.lock = asyncio.Lock()
+        self.pending = 0  # messages running or waiting for `lock`
+        self.created_at = self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """Conversations of many users on one set of shared resources.
+
+    Backpressure is applied when a message arrives, never by queueing
+    without bound:
+
+    - a session runs one message at a time and holds at most
+      `session_pending` of them (running or waiting); more get 429
+    - at most `max_active` turns run at once across sessions and at most
+      `max_pending` are accepted (running or waiting); more get 503 with
+      `Retry-After`
+    - at most `max_sessions` sessions exist; sessions unused for
+      `idle_timeout` seconds are closed
+
+    Settings default to the `SERVER_*` and `SESSION_*` environment variables.
+    """
+
+    def __init__(
+        self,
+        shared: SharedResources,
+        max_sessions: Optional[int] = None,
+        max_active: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        session_pending: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+    ) -> None:
+        self.shared = shared
+        self.max_sessions = max_sessions or int(os.getenv("SERVER_MAX_SESSIONS", "1000"))
+        self.max_active = max_active or int(os.getenv("SERVER_MAX_ACTIVE", "32"))
+        self.max_pending = max_pending or int(os.getenv("SERVER_MAX_PENDING", "256"))
+        self.session_pending = session_pending or int(os.getenv("SESSION_MAX_PENDING", "2"))
+        self.idle_timeout = idle_timeout or float(os.getenv("SESSION_IDLE_TIMEOUT", "900"))
+        self.sessions: Dict[str, Session] = {}
+        self._active = asyncio.Semaphore(self.max_active)
+        self.pending = 0  # turns accepted, running or waiting
+        self.active = 0  # turns running
+        self.counters = {"created": 0, "closed": 0, "expired": 0, "turns": 0, "failed": 0, "rejected_429": 0, "rejected_503": 0}
+        self._turn_seconds = 0.0
+
+    def create(self) -> Tuple[Session, Msg]:
+        if len(self.sessions) >= self.max_sessions:
+            self.counters["rejected_503"] += 1
+            raise HTTPError(503, f"session limit reached ({self.max_sessions})", retry_after=5)
+        session_id = uuid.uuid4().hex
+        conversation = Conversation(self.shared, session_id=session_id, verbose=False)
+        session = self.sessions[session_id] = Session(conversation)
+        self.counters["created"] += 1
+        return session, conversation.greet()
+
+    def get(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"no session {session_id}")
+        return session
+
+    def close(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            raise HTTPError(404, f"no session {session_id}")
+        session.conversation.close()
+        self.counters["closed"] += 1
+
+    async def send(self, session: Session, text: str) -> Msg:
+        if session.pending >= self.session_pending:
+            self.counters["rejected_429"] += 1
+            raise HTTPError(429, f"session already has {session.pending} message(s) in progress", retry_after=1)
+        if self.pending >= self.max_pending:
+            self.counters["rejected_503"] += 1
+            raise HTTPError(503, f"server busy ({self.pending} turns in progress)", retry_after=1)
+
+        session.pending += 1
+        self.pending += 1
+        try:
+            async with session.lock:
+                async with self._active:
+                    started = time.monotonic()
+                    self.active += 1
+                    try:
+                        reply = await session.conversation.respond(text)
+                    except Exception:
+                        self.counters["failed"] += 1
+                        raise
+                    finally:
+                        self.active -= 1
+                    self._turn_seconds += time.monotonic() - started
+                    self.counters["turns"] += 1
+                    return reply
+        finally:
+            session.pending -= 1
+            self.pending -= 1
+            session.last_used = time.monotonic()
+
+    def expire_idle(self) -> int:
+        now = time.monotonic()
+        idle = [
+            session_id for session_id, session in self.sessions.items()
+            if not session.pending and now - session.last_used > self.idle_timeout
+        ]
+        for session_id in idle:
+            self.sessions.pop(session_id).conversation.close()
+        self.counters["expired"] += len(idle)
+        return len(idle)
+
+    async def expire_forever(self) -> None:
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_timeout / 2))
+            expired = self.expire_idle()
+            if expired:
+                logger.info(f"Closed {expired} idle session(s)")
+
+    def stats(self) -> Dict[str, Any]:
+        turns = self.counters["turns"]
+        return {
+            "sessions": len(self.sessions),
+            "pending": self.pending,
+            "active": self.active,
+            "limits": {
+                "max_sessions": self.max_sessions,
+                "max_active": self.max_active,
+                "max_pending": self.max_pending,
+                "session_pending": self.session_pending,
+            },
+            **self.counters,
+            "mean_turn_ms": round(self._turn_seconds * 1000 / turns, 3) if turns else None,
+            "tool_cache": tool_cache.stats(),
+            "db_pool": db.pool.stats() if db.pool is not None else None,
+            "db_guard": db.guard.stats() if db.guard is not None else None,
+        }
+
+    def shutdown(self) -> None:
+        for session in self.sessions.values():
+            session.conversation.close()
+        self.sessions.clear()
+
+
+class Server:
+    """A small HTTP/1.1 JSON API over a `SessionManager`, on asyncio
+    streams (no web framework needed). Connections are kept alive.
+
+    Endpoints:
+        POST   /sessions                  start a conversation
+        POST   /sessions/{id}/messages    send `{"text": ...}`, get the reply
+        GET    /sessions/{id}             session info
+        DELETE /sessions/{id}             end a conversation
+        GET    /health, GET /stats
+    """
+
+    def __init__(self, manager: SessionManager, max_body: Optional[int] = None) -> None:
+        self.manager = manager
+        self.max_body = max_body or int(os.getenv("SERVER_MAX_BODY", str(64 * 1024)))
+        self.keepalive_timeout = float(os.getenv("SERVER_KEEPALIVE_TIMEOUT", "30"))
+        self._listener: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self._listener = await asyncio.start_server(self.handle, host, port, limit=self.max_body)
+        return self._listener
+
+    async def close(self) -> None:
+        """Stop listening and drop open connections, including turns in
+        progress."""
+        if self._listener is not None:
+            self._listener.close()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as e:
+                    await self._write(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                try:
+                    status, payload = await self.route(method, path, body)
+                    headers = {}
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                    headers = {"Retry-After": str(int(e.retry_after))} if e.retry_after else {}
+                except Exception as e:
+                    logger.exception(f"{method} {path} failed")
+                    status, payload, headers = 500, {"error": str(e)}, {}
+                await self._write(writer, status, payload, keep_alive, headers)
+                if not keep_alive:
+                    break
+        except asyncio.CancelledError:
+            pass  # server closing
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        parts = [part for part in path.split("?", 1)[0].split("/") if part]
+        manager = self.manager
+        if parts == ["health"] and method == "GET":
+            return 200, {"status": "ok"}
+        if parts == ["stats"] and method == "GET":
+            return 200, manager.stats()
+        if parts == ["sessions"] and method == "POST":
+            session, greeting = manager.create()
+            return 201, {"session_id": session.conversation.session_id, "reply": greeting.content}
+        if len(parts) == 2 and parts[0] == "sessions":
+            if method == "GET":
+                conversation = manager.get(parts[1]).conversation
+                return 200, {"session_id": parts[1], "turns": conversation.turns, "rounds": conversation.rounds}
+            if method == "DELETE":
+                manager.close(parts[1])
+                return 200, {"session_id": parts[1], "closed": True}
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages" and method == "POST":
+            session = manager.get(parts[1])
+            try:
+                text = json.loads(body or b"{}").get("text")
+            except (ValueError, AttributeError):
+                text = None
+            if not isinstance(text, str) or not text.strip():
+                raise HTTPError(400, 'expected a JSON body {"text": "..."}')
+            reply = await manager.send(session, text)
+            return 200, {"session_id": parts[1], "name": reply.name, "reply": reply.content}
+        if parts[:1] in (["sessions"], ["health"], ["stats"]):
+            raise HTTPError(405, f"{method} not allowed on {path}")
+        raise HTTPError(404, f"no route {path}")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes, bool]]:
+        try:
+            line = await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HTTPError(413, "request line too long")
+        if not line:
+            return None
+        try:
+            method, path, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise HTTPError(413, "header too long")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(411, "chunked bodies are not supported; send Content-Length")
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "bad Content-Length")
+        if length > self.max_body:
+            raise HTTPError(413, f"body larger than {self.max_body} bytes")
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return method.upper(), path, body, keep_alive
+
+    @staticmethod
+    async def _write(
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: Any,
+        keep_alive: bool,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def setup(model_configs: Optional[str] = None) -> SharedResources:
+    """Connect the DB pool and load the models shared by all sessions.
+    Logs go out at `SERVER_LOG_LEVEL` (default INFO); the agents' messages
+    are only printed with `SERVER_ECHO=1`."""
+    db.connect()
+    agentscope.init(
+        model_configs=load_model_configs(model_configs or os.getenv("MODEL_CONFIGS", "configs/model_configs.json")),
+        logger_level=os.getenv("SERVER_LOG_LEVEL", "INFO"),
+        save_log=False,
+    )
+    if os.getenv("SERVER_ECHO", "0") != "1":
+        # agentscope prints every agent message of every session
+        logger.disable("agentscope")
+    return SharedResources()
+
+
+async def serve(host: str, port: int) -> None:
+    shared = setup()
+    # Model calls and tool queries of all sessions run in these threads
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=int(os.getenv("SERVER_THREADS", "64")), thread_name_prefix="turn")
+    )
+    manager = SessionManager(shared)
+    server = Server(manager)
+    listener = await server.start(host, port)
+    expiry = asyncio.create_task(manager.expire_forever())
+    logger.info(f"Serving on http://{host}:{port} (max_active={manager.max_active}, max_sessions={manager.max_sessions})")
+    try:
+        await listener.serve_forever()
+    finally:
+        expiry.cancel()
+        await server.close()
+        manager.shutdown()
+        shared.shutdown()
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(os.getenv("SERVER_HOST", "127.0.0.1"), int(os.getenv("SERVER_PORT", "8080"))))
+    except KeyboardInterrupt:
+        pass
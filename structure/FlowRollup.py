@@ -0,0 +1,274 @@
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SECONDS_PER_DAY = 86400
+
+Range = Tuple[datetime, datetime]
+
+
+def _merge_ranges(ranges: Sequence[Range]) -> List[Range]:
+    """Coalesce overlapping or touching half-open ranges."""
+    merged: List[List[datetime]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _scan_query(count: int, merged: int) -> str:
+    sums = ", ".join(
+        f"SUM(CASE WHEN create_time >= %s AND create_time < %s THEN person_num ELSE 0 END) AS p{i}"
+        for i in range(count)
+    )
+    where = " OR ".join(["(create_time >= %s AND create_time < %s)"] * merged)
+    return (
+        f"SELECT {sums} "
+        "FROM t_kltj_alarm_msg "
+        f"WHERE {where}"
+    )
+
+
+def scan_ranges(conn: Any, ranges: Sequence[Range]) -> List[float]:
+    """Sum raw passenger flow for half-open [start, end) ranges in one statement.
+
+    Each range gets its own conditional aggregate column; the WHERE clause
+    covers only the union of the ranges, so overlapping ranges are scanned
+    once.
+    """
+    if not ranges:
+        return []
+
+    merged = _merge_ranges(ranges)
+    query = _scan_query(len(ranges), len(merged))
+    params = [t.strftime(TIME_FORMAT) for r in list(ranges) + merged for t in r]
+
+    with conn.cursor() as cursor:
+        cursor.execute(query, tuple(params))
+        result = cursor.fetchone()
+
+    flows = []
+    for i in range(len(ranges)):
+        total_flow = result and result[f"p{i}"]
+        flows.append(float(total_flow) if total_flow else 0)
+    return flows
+
+
+class _DayIndex:
+    """Per-bucket flow totals of one day plus lazily rebuilt prefix sums."""
+
+    __slots__ = ("counts", "_prefix")
+
+    def __init__(self, num_buckets: int) -> None:
+        self.counts = array("d", bytes(8 * num_buckets))
+        self._prefix: Optional[array] = None
+
+    def add(self, bucket: int, value: float) -> None:
+        self.counts[bucket] += value
+        self._prefix = None
+
+    def sum(self, lo: int, hi: int) -> float:
+        """Total of buckets [lo, hi)."""
+        if self._prefix is None:
+            prefix = array("d", [0.0])
+            running = 0.0
+            for value in self.counts:
+                running += value
+                prefix.append(running)
+            self._prefix = prefix
+        return self._prefix[hi] - self._prefix[lo]
+
+
+class FlowRollup:
+    """In-process rollup of passenger flow totals for `t_kltj_alarm_msg`.
+
+    Flow is kept per `resolution`-second bucket for every day that has been
+    queried, with prefix sums so any bucket-aligned range costs O(1) per day
+    it spans. Data is complete up to a `create_time` watermark, which is
+    advanced incrementally (only rows since the previous watermark are read)
+    at most once per `refresh_interval` seconds. The watermark trails the
+    clock by `lag` seconds, so rows still being ingested for recent buckets
+    are scanned raw rather than frozen into the rollup. Rows are assumed to
+    arrive within `lag` of their `create_time`; a row inserted behind the
+    watermark is only picked up when its day is evicted and loaded again.
+
+    Anything the rollup cannot answer exactly, i.e. the unaligned edges of a
+    range and the partial bucket at or after the watermark, is returned as a
+    residual range for the caller to scan raw.
+    """
+
+    def __init__(
+        self,
+        resolution: int = 60,
+        refresh_interval: Optional[float] = None,
+        max_days: int = 31,
+        lag: float = 300.0,
+        clock: Callable[[], datetime] = datetime.now,
+    ) -> None:
+        if resolution <= 0 or SECONDS_PER_DAY % resolution:
+            raise ValueError(f"resolution must divide a day evenly, got {resolution}")
+
+        self.resolution = resolution
+        self.buckets_per_day = SECONDS_PER_DAY // resolution
+        self.refresh_interval = resolution if refresh_interval is None else refresh_interval
+        self.max_days = max_days
+        self.lag = timedelta(seconds=lag)
+        self._clock = clock
+
+        self._days: "OrderedDict[date, _DayIndex]" = OrderedDict()
+        self._watermark: Optional[datetime] = None
+        self._last_refresh: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        return self._watermark
+
+    def clear(self) -> None:
+        with self._lock:
+            self._days.clear()
+            self._watermark = None
+            self._last_refresh = None
+
+    def range_sums(self, conn: Any, ranges: Sequence[Range]) -> Tuple[List[float], List[List[Range]]]:
+        """Answer half-open ranges from the rollup.
+
+        Returns:
+            The rolled-up total of each range and, per range, the residual
+            sub-ranges that still have to be scanned raw.
+        """
+        with self._lock:
+            self._maybe_refresh(conn)
+            totals, residuals = [], []
+            for start, end in ranges:
+                total, residual = self._range_sum(conn, start, end)
+                totals.append(total)
+                residuals.append(residual)
+            return totals, residuals
+
+    def _floor(self, t: datetime) -> datetime:
+        day_start = datetime(t.year, t.month, t.day)
+        elapsed = int((t - day_start).total_seconds())
+        return day_start + timedelta(seconds=elapsed - elapsed % self.resolution)
+
+    def _ceil(self, t: datetime) -> datetime:
+        floored = self._floor(t)
+        return floored if floored == t else floored + timedelta(seconds=self.resolution)
+
+    def _range_sum(self, conn: Any, start: datetime, end: datetime) -> Tuple[float, List[Range]]:
+        covered_end = min(end, self._watermark)
+        aligned_start = self._ceil(start)
+        aligned_end = self._floor(covered_end)
+        if aligned_start >= aligned_end:
+            return 0, [(start, end)] if start < end else []
+
+        residual = []
+        if start < aligned_start:
+            residual.append((start, aligned_start))
+        if aligned_end < end:
+            residual.append((aligned_end, end))
+
+        total = 0.0
+        day = aligned_start.date()
+        while True:
+            day_start = datetime(day.year, day.month, day.day)
+            lo = max(aligned_start, day_start)
+            hi = min(aligned_end, day_start + timedelta(days=1))
+            if lo >= hi:
+                break
+            index = self._day(conn, day)
+            total += index.sum(
+                int((lo - day_start).total_seconds()) // self.resolution,
+                int((hi - day_start).total_seconds()) // self.resolution,
+            )
+            day += timedelta(days=1)
+        return total, residual
+
+    def _day(self, conn: Any, day: date) -> _DayIndex:
+        index = self._days.get(day)
+        if index is not None:
+            self._days.move_to_end(day)
+            return index
+
+        index = _DayIndex(self.buckets_per_day)
+        day_start = datetime(day.year, day.month, day.day)
+        self._days[day] = index
+        self._load(conn, day_start, min(day_start + timedelta(days=1), self._watermark))
+        while len(self._days) > self.max_days:
+            self._days.popitem(last=False)
+        return index
+
+    def _maybe_refresh(self, conn: Any) -> None:
+        now = self._clock()
+        if self._last_refresh is not None and (now - self._last_refresh).total_seconds() < self.refresh_interval:
+            return
+        new_watermark = self._floor(now - self.lag)
+        if self._watermark is not None and self._days and new_watermark > self._watermark:
+            # Only already-loaded days need the rows between the watermarks;
+            # other days are loaded in full when first used.
+            self._load(conn, self._watermark, new_watermark)
+        self._watermark = new_watermark
+        self._last_refresh = now
+
+    def _load(self, conn: Any, lo: datetime, hi: datetime) -> None:
+        """Add bucket totals of rows with lo <= create_time < hi to loaded days."""
+        if lo >= hi:
+            return
+        base = datetime(lo.year, lo.month, lo.day)
+        query = (
+            "SELECT TIMESTAMPDIFF(SECOND, %s, create_time) DIV %s AS bucket, "
+            "SUM(person_num) AS total_flow "
+            "FROM t_kltj_alarm_msg "
+            "WHERE create_time >= %s AND create_time < %s "
+            "GROUP BY bucket"
+        )
+        with conn.cursor() as cursor:
+            cursor.execute(
+                query,
+                (base.strftime(TIME_FORMAT), self.resolution, lo.strftime(TIME_FORMAT), hi.strftime(TIME_FORMAT)),
+            )
+            rows = cursor.fetchall()
+
+        for row in rows:
+            if not row["total_flow"]:
+                continue
+            day_offset, bucket = divmod(int(row["bucket"]), self.buckets_per_day)
+            index = self._days.get(base.date() + timedelta(days=day_offset))
+            if index is not None:
+                index.add(bucket, float(row["total_flow"]))
+        logger.debug(f"Flow rollup loaded {len(rows)} buckets for {lo} - {hi}")
+
+
+def query_flows(conn: Any, ranges: Sequence[Range]) -> List[float]:
+    """Passenger flow for each half-open range, from the rollup when enabled.
+
+    At most one raw statement is issued, covering whatever the rollup could
+    not answer (or every range when the rollup is disabled).
+    """
+    if flow_rollup is None:
+        return scan_ranges(conn, ranges)
+
+    totals, residuals = flow_rollup.range_sums(conn, ranges)
+    pieces = [piece for residual in residuals for piece in residual]
+    raw = iter(scan_ranges(conn, pieces))
+    return [total + sum(next(raw) for _ in residual) for total, residual in zip(totals, residuals)]
+
+
+def _rollup_from_env() -> Optional[FlowRollup]:
+    if os.getenv("FLOW_ROLLUP", "0").lower() not in {"1", "true", "yes"}:
+        return None
+    return FlowRollup(
+        resolution=int(os.getenv("FLOW_ROLLUP_RESOLUTION", "60")),
+        lag=float(os.getenv("FLOW_ROLLUP_LAG", "300")),
+    )
+
+
+flow_rollup = _rollup_from_env()
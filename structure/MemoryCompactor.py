@@ -0,0 +1,195 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from agentscope.message import Msg
+
+from instrumentation import tracer
+from tools.ResultCodec import decode
+
+# Same framing as `parsers.QueryParser`: tool output follows "[RESULT]: "
+# on one line
+RESULT = re.compile(r"(\[RESULT\]: )(.*?)\n", re.DOTALL)
+QUERY_ID = re.compile(r'"query_id": "([^"]+)"')
+
+# Record lists kept as references, and how many record ids a reference keeps
+# so a later tool call can still use them (e.g. event ids -> images)
+_RECORD_KEYS = ("events", "periods", "segments", "leave_post_records")
+MAX_REFERENCE_IDS = 100
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count without a tokenizer: about four ASCII characters
+    per token, one token per other character (e.g. CJK)."""
+    if not isinstance(text, str):
+        text = "" if text is None else str(text)
+    if text.isascii():
+        return (len(text) + 3) // 4
+    wide = sum(1 for char in text if ord(char) > 127)
+    return (len(text) - wide + 3) // 4 + wide
+
+
+def reference(data: Dict[str, Any]) -> Dict[str, Any]:
+    """A short stand-in for a tool result: its id, type and totals, plus the
+    record ids when the records have any. The full data stays in the query
+    result store under the same `query_id`."""
+    ref = {"query_id": data["query_id"], "query_type": data.get("query_type")}
+    for key, value in data.items():
+        if key.startswith("total_") or key in ("start_time", "end_time"):
+            ref[key] = value
+    for key in _RECORD_KEYS:
+        records = data.get(key)
+        if not isinstance(records, list):
+            continue
+        ref["records"] = len(records)
+        ids = [record["id"] for record in records if isinstance(record, dict) and "id" in record]
+        if ids:
+            ref["ids"] = ids[:MAX_REFERENCE_IDS]
+            if len(ids) > MAX_REFERENCE_IDS:
+                ref["ids_omitted"] = len(ids) - MAX_REFERENCE_IDS
+        break
+    ref["note"] = f"compacted; insert [{data['query_id']}] to show the full result"
+    return ref
+
+
+def compact_results(text: str) -> str:
+    """Replace every tool result in `text` that has a `query_id` with its
+    `reference`. Errors and other short outputs are left as they are."""
+    if "[RESULT]: " not in text:
+        return text
+
+    def replace(match: "re.Match") -> str:
+        try:
+            data = decode(json.loads(match.group(2)))
+        except ValueError:
+            return match.group(0)
+        if not isinstance(data, dict) or not data.get("query_id"):
+            return match.group(0)
+        return match.group(1) + json.dumps(reference(data), ensure_ascii=True) + "\n"
+
+    return RESULT.sub(replace, text)
+
+
+class MemoryCompactor:
+    """Builds a prompt from an agent's memory within a token budget.
+
+    Memory itself is never modified; `compact` returns copies. In order:
+
+    1. Sliding window: only the last `window` messages after the `pinned`
+       leading ones (system prompt, the plan) are considered.
+    2. Tool results older than the last `keep_results` result messages are
+       replaced with references by `query_id`.
+    3. While over `budget`, the remaining full results are compacted too,
+       then the oldest unpinned messages are dropped (the newest is kept).
+
+    Args:
+        budget (int): token budget of the prompt, 0 for no limit
+        window (int): messages kept after the pinned ones, 0 for no limit
+        keep_results (int): newest messages whose tool results stay verbatim
+        enabled (bool): when False, `compact` returns the messages unchanged
+    """
+
+    def __init__(self, budget: int = 8000, window: int = 24, keep_results: int = 1, enabled: bool = True) -> None:
+        self.budget = budget
+        self.window = window
+        self.keep_results = keep_results
+        self.enabled = enabled
+
+    def compact(self, msgs: Sequence[Msg], pinned: int = 1, reserved: int = 0) -> List[Msg]:
+        """Prompt messages for `msgs`.
+
+        Args:
+            msgs (Sequence[Msg]): the agent's memory, oldest first
+            pinned (int): leading messages that are never dropped
+            reserved (int): tokens of prompt parts not in `msgs`, e.g. a
+                format hint appended after them
+        """
+        msgs = list(msgs)
+        if not self.enabled:
+            return msgs
+
+        with tracer.span("memory.compact") as span:
+            head, tail = msgs[:pinned], msgs[pinned:]
+            dropped: List[Msg] = []
+            if self.window and len(tail) > self.window:
+                dropped, tail = tail[:-self.window], tail[-self.window:]
+
+            with_results = [i for i, msg in enumerate(tail) if _has_results(msg)]
+            keep = set(with_results[-self.keep_results:]) if self.keep_results > 0 else set()
+            tail = [_compacted(msg) if i in with_results and i not in keep else msg for i, msg in enumerate(tail)]
+
+            if self.budget:
+                tokens = [_msg_tokens(msg) for msg in tail]
+                fixed = reserved + sum(_msg_tokens(msg) for msg in head)
+                for i in sorted(keep):
+                    if fixed + sum(tokens) <= self.budget:
+                        break
+                    tail[i] = _compacted(tail[i])
+                    tokens[i] = _msg_tokens(tail[i])
+                drop = 0
+                while drop < len(tail) - 1 and fixed + sum(tokens[drop:]) > self.budget:
+                    drop += 1
+                dropped += tail[:drop]
+                tail = tail[drop:]
+
+            omitted = len(dropped)
+            if omitted:
+                tail.insert(0, _omission_note(dropped))
+            prompt = head + tail
+            if span:
+                span.set(
+                    tokens_before=sum(_msg_tokens(msg) for msg in msgs),
+                    tokens_after=sum(_msg_tokens(msg) for msg in prompt),
+                    omitted=omitted,
+                )
+            return prompt
+
+
+def _has_results(msg: Msg) -> bool:
+    return isinstance(msg.content, str) and "[RESULT]: " in msg.content
+
+
+def _compacted(msg: Msg) -> Msg:
+    content = compact_results(msg.content)
+    if content == msg.content:
+        return msg
+    return Msg(msg.name, content, msg.role)
+
+
+def _omission_note(dropped: List[Msg]) -> Msg:
+    # Name the results that were dropped so they can still be referenced
+    ids = []
+    for msg in dropped:
+        if _has_results(msg):
+            ids.extend(QUERY_ID.findall(msg.content))
+    note = f"({len(dropped)} earlier messages omitted"
+    if ids:
+        note += "; earlier results can still be shown as " + ", ".join(f"[{query_id}]" for query_id in dict.fromkeys(ids))
+    return Msg("system", note + ")", "system")
+
+
+def _msg_tokens(msg: Msg) -> int:
+    return estimate_tokens(msg.content) + 4  # name/role framing
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def chat_compactor(budget: Optional[int] = None) -> MemoryCompactor:
+    """Compactor for a ChatAgent, configured from the environment."""
+    return MemoryCompactor(
+        budget=_env_int("CHAT_TOKEN_BUDGET", 6000) if budget is None else budget,
+        window=_env_int("MEMORY_WINDOW", 24),
+        enabled=os.getenv("MEMORY_COMPACTION", "1") == "1",
+    )
+
+
+def query_compactor(budget: Optional[int] = None) -> MemoryCompactor:
+    """Compactor for a QueryAgent, configured from the environment."""
+    return MemoryCompactor(
+        budget=_env_int("QUERY_TOKEN_BUDGET", 12000) if budget is None else budget,
+        window=_env_int("MEMORY_WINDOW", 24),
+        enabled=os.getenv("MEMORY_COMPACTION", "1") == "1",
+    )
@@ -0,0 +1,141 @@
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from parsers.JsonParser import PLACEHOLDER
+from structure.QueryResult import QueryResult
+
+
+class QueryResultStore:
+    """Tool results of a session, so "[query_id]" placeholders from earlier
+    planning rounds still resolve without re-querying the database.
+
+    Records are looked up by `query_id` and indexed by `query_type` and by
+    the time range they cover. The store is an LRU bounded by entry count
+    and by the total JSON size of the records; resolving a placeholder
+    counts as a use.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._records: "OrderedDict[str, QueryResult]" = OrderedDict()
+        self._by_type: Dict[Optional[str], Set[str]] = {}
+        # (start, query_id) of records with a known time range, sorted
+        self._by_start: List[Tuple[str, str]] = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, data: Dict[str, Any]) -> Optional[QueryResult]:
+        """Store a decoded tool result. Results without a `query_id` (empty
+        results, errors) are ignored."""
+        if not isinstance(data, dict) or not data.get("query_id"):
+            return None
+        record = QueryResult.from_data(data)
+        if record.size > self.max_bytes:
+            logger.warning(f"Query result {record.query_id} ({record.size} bytes) exceeds the store limit; not kept")
+            return None
+        with self._lock:
+            self._discard(record.query_id)
+            self._records[record.query_id] = record
+            self._by_type.setdefault(record.query_type, set()).add(record.query_id)
+            if record.start is not None:
+                bisect.insort(self._by_start, (record.start, record.query_id))
+            self._bytes += record.size
+            self._evict()
+        return record
+
+    def add_many(self, results: Iterable[Dict[str, Any]]) -> None:
+        for data in results:
+            self.add(data)
+
+    def get(self, query_id: str) -> Optional[QueryResult]:
+        with self._lock:
+            record = self._records.get(query_id)
+            if record is not None:
+                self._records.move_to_end(query_id)
+            return record
+
+    def find(
+        self,
+        query_type: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> List[QueryResult]:
+        """Records of `query_type` (any type if None) whose time range
+        overlaps `[start, end]`, oldest first. Timestamps use the tools'
+        "YYYY-MM-DD hh:mm:ss" format; pass neither to match by type only."""
+        with self._lock:
+            if start is None and end is None:
+                ids = self._by_type.get(query_type, set()) if query_type is not None else set(self._records)
+                return [record for query_id, record in self._records.items() if query_id in ids]
+
+            # Records starting after `end` cannot overlap
+            stop = len(self._by_start) if end is None else bisect.bisect_right(self._by_start, (end, "\uffff"))
+            matches = []
+            for _, query_id in self._by_start[:stop]:
+                record = self._records[query_id]
+                if (query_type is None or record.query_type == query_type) and record.overlaps(start, end):
+                    matches.append(record)
+            return matches
+
+    def resolve(self, text: str, exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Decoded results for the placeholders in `text`, skipping ids in
+        `exclude` and ids the store does not hold."""
+        if "[" not in text:
+            return []
+        exclude = set(exclude)
+        results = []
+        for query_id in dict.fromkeys(match.group(1) for match in PLACEHOLDER.finditer(text)):
+            if query_id in exclude:
+                continue
+            record = self.get(query_id)
+            if record is not None:
+                results.append(record.data)
+        return results
+
+    def __contains__(self, query_id: str) -> bool:
+        return query_id in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._records), "bytes": self._bytes}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._by_type.clear()
+            self._by_start.clear()
+            self._bytes = 0
+
+    def _evict(self) -> None:
+        while self._records and (len(self._records) > self.max_entries or self._bytes > self.max_bytes):
+            self._discard(next(iter(self._records)))
+
+    def _discard(self, query_id: str) -> None:
+        record = self._records.pop(query_id, None)
+        if record is None:
+            return
+        self._bytes -= record.size
+        ids = self._by_type.get(record.query_type)
+        if ids is not None:
+            ids.discard(query_id)
+            if not ids:
+                del self._by_type[record.query_type]
+        if record.start is not None:
+            index = bisect.bisect_left(self._by_start, (record.start, query_id))
+            if index < len(self._by_start) and self._by_start[index] == (record.start, query_id):
+                del self._by_start[index]
+
+
+query_store = QueryResultStore(
+    max_entries=int(os.getenv("QUERY_STORE_SIZE", "256")),
+    max_bytes=int(os.getenv("QUERY_STORE_MAX_BYTES", str(16 * 1024 * 1024))),
+)
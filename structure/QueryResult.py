@@ -0,0 +1,75 @@
+import json
+from typing import Any, Dict, Optional, Tuple
+
+# Record lists per query_type and the fields bounding each record in time.
+# Timestamps are "YYYY-MM-DD hh:mm:ss" strings, which sort chronologically.
+_TIMED_RECORDS = {
+    "passenger_flow_statistics": ("periods", "start_time", "end_time"),
+    "passenger_flow_distribution": ("segments", "start_time", "end_time"),
+    "intrusion_events_in_time_range": ("events", "alarm_time", "alarm_time"),
+    "intrusion_event_images_by_id": ("events", "alarm_time", "alarm_time"),
+    "multiple_intrusion_event_images": ("events", "alarm_time", "alarm_time"),
+}
+
+
+def _time_range(query_type: Optional[str], data: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    spec = _TIMED_RECORDS.get(query_type)
+    if spec is None:
+        # e.g. leave-post records only carry times of day
+        return None, None
+    key, start_field, end_field = spec
+    records = data.get(key) or ()
+    starts = [record[start_field] for record in records if record.get(start_field)]
+    ends = [record[end_field] for record in records if record.get(end_field)]
+    if not starts or not ends:
+        return None, None
+    return min(starts), max(ends)
+
+
+class QueryResult:
+    """One decoded tool result with the keys it is indexed by.
+
+    Args:
+        query_id (str): id the agents use as a "[query_id]" placeholder
+        query_type (str): tool result type, e.g. "passenger_flow_statistics"
+        start (str): earliest timestamp covered, or None when unknown
+        end (str): latest timestamp covered, or None when unknown
+        data (dict): the decoded tool output
+        size (int): approximate memory cost, the length of the JSON text
+    """
+
+    __slots__ = ("query_id", "query_type", "start", "end", "data", "size")
+
+    def __init__(
+        self,
+        query_id: str,
+        query_type: Optional[str],
+        start: Optional[str],
+        end: Optional[str],
+        data: Dict[str, Any],
+        size: int,
+    ) -> None:
+        self.query_id = query_id
+        self.query_type = query_type
+        self.start = start
+        self.end = end
+        self.data = data
+        self.size = size
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any], size: Optional[int] = None) -> "QueryResult":
+        """Build a record from a decoded tool result that has a `query_id`."""
+        query_type = data.get("query_type")
+        start, end = _time_range(query_type, data)
+        if size is None:
+            size = len(json.dumps(data, ensure_ascii=True))
+        return cls(data["query_id"], query_type, start, end, data, size)
+
+    def overlaps(self, start: Optional[str], end: Optional[str]) -> bool:
+        if self.start is None:
+            return False
+        return (end is None or self.start <= end) and (start is None or self.end >= start)
+
+    def __repr__(self) -> str:
+        return f"QueryResult({self.query_id!r}, {self.query_type!r}, {self.start!r}, {self.end!r}, size={self.size})"
+
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pymysql
+import pytest
+
+from connection import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    """Stands in for a pymysql connection: `ping` fails once it is broken."""
+
+    def __init__(self) -> None:
+        self.healthy = True
+        self.closed = False
+
+    def ping(self, reconnect: bool = False) -> None:
+        if not self.healthy:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class Factory:
+    def __init__(self) -> None:
+        self.created = []
+
+    def __call__(self) -> FakeConnection:
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+
+def make_pool(**kwargs) -> ConnectionPool:
+    kwargs.setdefault("min_size", 0)
+    kwargs.setdefault("max_size", 2)
+    return ConnectionPool(kwargs.pop("factory", Factory()), **kwargs)
+
+
+def test_min_size_connections_are_opened_eagerly():
+    factory = Factory()
+    pool = make_pool(factory=factory, min_size=2)
+    assert len(factory.created) == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_released_connection_is_reused():
+    factory = Factory()
+    pool = make_pool(factory=factory)
+    conn = pool.acquire()
+    assert pool.stats()["in_use"] == 1
+    pool.release(conn)
+    assert pool.stats() == {"size": 1, "idle": 1, "in_use": 0, "waits": 0, "discarded": 0}
+    assert pool.acquire() is conn
+    assert len(factory.created) == 1
+
+
+def test_acquire_times_out_when_all_connections_are_in_use():
+    pool = make_pool(max_size=1, checkout_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()["waits"] >= 1
+
+
+def test_release_wakes_a_waiting_acquire():
+    pool = make_pool(max_size=1, checkout_timeout=5)
+    conn = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(conn)
+    waiter.join(timeout=5)
+    assert acquired == [conn]
+
+
+def test_connection_failing_ping_is_replaced():
+    factory = Factory()
+    pool = make_pool(factory=factory, ping_interval=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.healthy = False
+    time.sleep(0.001)
+
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()["discarded"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_connection_broken_inside_checkout_is_discarded():
+    factory = Factory()
+    pool = make_pool(factory=factory)
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection() as conn:
+            raise pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")
+    assert conn.closed
+    assert pool.stats()["size"] == 0
+    assert pool.acquire() is not conn
+
+
+def test_other_errors_keep_the_connection():
+    pool = make_pool()
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("not a connection problem")
+    assert not conn.closed
+    assert pool.acquire() is conn
+
+
+def test_connection_past_max_lifetime_is_recycled():
+    factory = Factory()
+    pool = make_pool(factory=factory, max_lifetime=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    time.sleep(0.001)
+    assert pool.acquire() is not conn
+    assert conn.closed
+
+
+def test_failed_connect_frees_its_slot():
+    attempts = []
+
+    def flaky() -> FakeConnection:
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+        return FakeConnection()
+
+    pool = make_pool(factory=flaky, max_size=1, checkout_timeout=0.05)
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.acquire()
+    assert isinstance(pool.acquire(), FakeConnection)
+
+
+def test_closed_pool_closes_idle_connections_and_rejects_checkouts():
+    factory = Factory()
+    pool = make_pool(factory=factory, min_size=1)
+    pool.close()
+    assert factory.created[0].closed
+    with pytest.raises(RuntimeError):
+        pool.acquire()
@@ -0,0 +1,103 @@
+import json
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from connection import db
+from database.MockData import generate
+from database.SQLiteEngine import SQLiteConnection
+from tools.EventSeries import debounce
+from tools.InvaseAlarmEventsQuery import DEBOUNCE, InvaseAlarmEventsQuery
+from tools.ToolCache import tool_cache
+
+
+def loop_debounce(ts, min_gap, last=None):
+    """The per-row loop the intrusion tools used before EventSeries."""
+    kept = []
+    for i, t in enumerate(ts):
+        if last is None or t - last >= min_gap:
+            kept.append(i)
+            last = t
+    return kept
+
+
+def alarm_times(rng: random.Random, count: int) -> np.ndarray:
+    """Sorted seconds shaped like alarm bursts: repeats, short steps within
+    a burst and long gaps between bursts."""
+    steps = [rng.choice((0, 1, 3, 7, 30, 119, 120, 121, 600, 5000)) for _ in range(count)]
+    return np.cumsum(steps, dtype=np.int64)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_debounce_matches_loop(seed):
+    rng = random.Random(seed)
+    ts = alarm_times(rng, rng.randrange(1, 400))
+    for min_gap in (1, 60, 120, 900):
+        assert debounce(ts, min_gap).tolist() == loop_debounce(ts.tolist(), min_gap)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_debounce_in_batches_matches_loop(seed):
+    rng = random.Random(seed)
+    ts = alarm_times(rng, 500)
+    kept, last, offset = [], None, 0
+    while offset < len(ts):
+        batch = ts[offset:offset + rng.randrange(1, 80)]
+        for i in debounce(batch, 120, last):
+            kept.append(offset + int(i))
+            last = int(batch[i])
+        offset += len(batch)
+    assert kept == loop_debounce(ts.tolist(), 120)
+
+
+def test_debounce_edge_cases():
+    assert debounce(np.empty(0, dtype=np.int64), 120).tolist() == []
+    assert debounce(np.array([5], dtype=np.int64), 120).tolist() == [0]
+    assert debounce(np.array([5, 5, 6], dtype=np.int64), 0).tolist() == [0, 1, 2]
+    # Everything before last + min_gap was covered by the earlier batch
+    assert debounce(np.array([10, 100, 130], dtype=np.int64), 120, last=10).tolist() == [2]
+    ts = np.array([0, 119, 120, 240], dtype=np.int64)
+    assert debounce(ts, timedelta(minutes=2)).tolist() == debounce(ts, 120).tolist() == [0, 2, 3]
+
+
+@pytest.fixture(scope="module")
+def mock_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("mock") / "events.sqlite")
+    generate(path, 20_000, seed=7, days=3)
+    db.connect(min_size=1, max_size=2, factory=lambda: SQLiteConnection(path))
+    enabled, tool_cache.enabled = tool_cache.enabled, False
+    yield path
+    tool_cache.enabled = enabled
+    db.close_connection()
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2024-05-25 00:00:00", "2024-05-27 23:59:59"),
+    ("2024-05-27 12:00:00", "2024-05-27 17:59:59"),
+    ("2024-05-26 09:13:07", "2024-05-26 09:58:41"),
+])
+def test_intrusion_events_match_loop(mock_db, start, end):
+    conn = SQLiteConnection(mock_db)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT alarm_time, id FROM t_qyrq_alarm_msg WHERE alarm_time BETWEEN %s AND %s "
+                "ORDER BY alarm_time ASC, id ASC",
+                (start, end),
+            )
+            rows = cursor.fetchall()
+    finally:
+        conn.close()
+    base = datetime(2024, 1, 1)
+    seconds = [int((row["alarm_time"] - base).total_seconds()) for row in rows]
+    expected = [
+        {"alarm_time": rows[i]["alarm_time"].strftime("%Y-%m-%d %H:%M:%S"), "id": rows[i]["id"]}
+        for i in loop_debounce(seconds, DEBOUNCE.total_seconds())
+    ]
+    assert expected
+
+    result = json.loads(InvaseAlarmEventsQuery(start, end).content)
+    assert result["events"] == expected
+    assert result["total_events"] == len(expected)
@@ -0,0 +1,134 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import structure.FlowRollup as FlowRollupModule
+from database.MockData import generate
+from database.SQLiteEngine import SQLiteConnection
+from structure.FlowRollup import FlowRollup, query_flows, scan_ranges
+
+FIRST_DAY = datetime(2024, 5, 25)
+# Inside the data, on no bucket boundary, and after the data ends
+CLOCKS = [datetime(2024, 5, 27, 12, 34, 56), datetime(2024, 5, 29, 8, 0, 0)]
+
+
+class Clock:
+    def __init__(self, now: datetime) -> None:
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+@pytest.fixture(scope="module")
+def mock_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("mock") / "flow.sqlite")
+    generate(path, 30_000, seed=5, days=3)
+    return path
+
+
+@pytest.fixture
+def conn(mock_db):
+    conn = SQLiteConnection(mock_db)
+    yield conn
+    conn.close()
+
+
+def rolled_up(monkeypatch, rollup, conn, ranges):
+    monkeypatch.setattr(FlowRollupModule, "flow_rollup", rollup)
+    return query_flows(conn, ranges)
+
+
+def random_point(rng: random.Random, resolution: int, watermark: datetime) -> datetime:
+    kind = rng.random()
+    if kind < 0.15:
+        # Exactly on the watermark or a few buckets around it
+        return watermark + timedelta(seconds=resolution * rng.randint(-3, 3))
+    point = FIRST_DAY + timedelta(seconds=rng.randrange(5 * 86400))
+    if kind < 0.55:
+        # On a bucket boundary (midnight included)
+        point -= timedelta(seconds=(point - FIRST_DAY).total_seconds() % resolution)
+    return point
+
+
+def random_ranges(rng: random.Random, resolution: int, watermark: datetime):
+    ranges = []
+    for _ in range(rng.randint(1, 6)):
+        a, b = random_point(rng, resolution, watermark), random_point(rng, resolution, watermark)
+        if rng.random() < 0.1:
+            b = a  # empty range
+        ranges.append((min(a, b), max(a, b)))
+    return ranges
+
+
+@pytest.mark.parametrize("resolution", [60, 900])
+@pytest.mark.parametrize("now", CLOCKS)
+def test_rollup_matches_raw_scans(monkeypatch, conn, resolution, now):
+    rollup = FlowRollup(resolution=resolution, lag=300, clock=Clock(now))
+    rng = random.Random(f"{resolution}:{now}")
+    rolled_up(monkeypatch, rollup, conn, [(now - timedelta(hours=1), now)])
+    watermark = rollup.watermark
+    # The last bucket boundary at least `lag` before the clock
+    assert watermark <= now - timedelta(seconds=300) < watermark + timedelta(seconds=resolution)
+    assert (watermark - FIRST_DAY).total_seconds() % resolution == 0
+    for _ in range(150):
+        ranges = random_ranges(rng, resolution, watermark)
+        assert rolled_up(monkeypatch, rollup, conn, ranges) == pytest.approx(scan_ranges(conn, ranges)), ranges
+
+
+def test_edges_on_buckets_and_across_the_watermark(monkeypatch, conn):
+    now = CLOCKS[0]
+    rollup = FlowRollup(resolution=60, lag=300, clock=Clock(now))
+    rolled_up(monkeypatch, rollup, conn, [])
+    watermark = rollup.watermark
+    assert watermark == datetime(2024, 5, 27, 12, 29)
+    minute, day = timedelta(minutes=1), timedelta(days=1)
+    ranges = [
+        (datetime(2024, 5, 26), datetime(2024, 5, 27)),  # one whole day
+        (datetime(2024, 5, 25), watermark),  # up to the watermark exactly
+        (watermark, now),  # wholly past the watermark
+        (watermark - minute, watermark + minute),  # across it, on buckets
+        (watermark - timedelta(seconds=61), watermark + timedelta(seconds=1)),  # across it, off buckets
+        (datetime(2024, 5, 26, 23, 59), datetime(2024, 5, 27, 0, 1)),  # across midnight
+        (datetime(2024, 5, 26, 10, 0, 30), datetime(2024, 5, 26, 10, 0, 40)),  # inside one bucket
+        (datetime(2024, 5, 26, 10, 0), datetime(2024, 5, 26, 10, 1)),  # exactly one bucket
+        (datetime(2024, 5, 24), datetime(2024, 5, 28) + day),  # beyond the data on both sides
+        (datetime(2024, 5, 26, 10, 0), datetime(2024, 5, 26, 10, 0)),  # empty
+    ]
+    assert rolled_up(monkeypatch, rollup, conn, ranges) == pytest.approx(scan_ranges(conn, ranges))
+
+
+def test_stays_exact_while_the_clock_advances(monkeypatch, conn):
+    clock = Clock(datetime(2024, 5, 27, 9, 0, 0))
+    rollup = FlowRollup(resolution=60, lag=300, refresh_interval=0, clock=clock)
+    day = [(datetime(2024, 5, 27), datetime(2024, 5, 28))]
+    for _ in range(12):
+        assert rolled_up(monkeypatch, rollup, conn, day) == pytest.approx(scan_ranges(conn, day))
+        clock.now += timedelta(minutes=37, seconds=13)
+
+
+def test_row_arriving_within_the_lag_is_counted(monkeypatch, mock_db, tmp_path):
+    path = str(tmp_path / "late.sqlite")
+    with sqlite3.connect(mock_db) as source, sqlite3.connect(path) as copy:
+        source.backup(copy)
+    conn = SQLiteConnection(path)
+    now = CLOCKS[0]
+    span = [(now - timedelta(minutes=30), now)]
+    try:
+        for lag, counted in ((300, True), (0, False)):
+            rollup = FlowRollup(resolution=60, lag=lag, clock=Clock(now))
+            before = rolled_up(monkeypatch, rollup, conn, span)[0]
+            # Written two minutes late, behind a zero-lag watermark
+            with sqlite3.connect(path) as writer:
+                writer.execute(
+                    "INSERT INTO t_kltj_alarm_msg (create_time, person_num) VALUES (?, 1000)",
+                    ((now - timedelta(minutes=2)).strftime("%Y-%m-%d %H:%M:%S"),),
+                )
+            assert rolled_up(monkeypatch, rollup, conn, span)[0] - before == (1000 if counted else 0)
+            assert scan_ranges(conn, span)[0] - before == 1000
+            with sqlite3.connect(path) as writer:
+                writer.execute("DELETE FROM t_kltj_alarm_msg WHERE person_num = 1000")
+    finally:
+        conn.close()
@@ -0,0 +1,85 @@
+import os
+
+from parsers.JsonParser import parse_json
+
+# Rendered by parsers/JsonParser.py as it was before the placeholders were
+# substituted lazily (the baseline commit); the output must not change
+EXPECTED = os.path.join(os.path.dirname(__file__), "data", "json_parser_report.txt")
+
+RESULTS = [
+    {
+        "query_id": "a1b2c3",
+        "query_type": "leave_post_records",
+        "total_records": 3,
+        "leave_post_records": [
+            {"time_slot_start": "090000", "time_slot_end": "093000"},
+            {"time_slot_start": "140000", "time_slot_end": "141505"},
+            {"time_slot_start": "235500", "time_slot_end": "000730"},
+        ],
+    },
+    {
+        "query_id": "d4e5f6",
+        "query_type": "multiple_intrusion_event_images",
+        "events": [
+            {"id": "001", "alarm_time": "2023-05-01 10:00:00", "url": "http://example.com/image1.jpg"},
+            {"id": "002", "alarm_time": "2023-05-01 11:30:00", "url": "http://example.com/image2.jpg"},
+        ],
+    },
+    {
+        "query_id": "g7h8i9",
+        "query_type": "intrusion_event_images_by_id",
+        "events": [{"alarm_time": "2023-05-01 15:45:00", "url": "http://example.com/image3.jpg"}],
+    },
+    {
+        "query_id": "e4afea46",
+        "query_type": "intrusion_events_in_time_range",
+        "total_events": 2,
+        "events": [
+            {"alarm_time": "2024-05-27 11:07:31", "id": 66406},
+            {"alarm_time": "2024-05-27 11:13:50", "id": 66414},
+        ],
+    },
+    {
+        "query_id": "f90efeff",
+        "query_type": "passenger_flow_statistics",
+        "total_periods": 1,
+        "periods": [{"start_time": "2024-05-27 00:00:00", "end_time": "2024-05-27 23:59:59", "passenger_flow": 349.0}],
+    },
+    {
+        "query_id": "5a823393",
+        "query_type": "passenger_flow_distribution",
+        "total_segments": 2,
+        "segments": [
+            {"start_time": "2024-05-27 00:00:00", "end_time": "2024-05-27 02:23:59", "passenger_flow": 36.0},
+            {"start_time": "2024-05-27 02:23:59", "end_time": "2024-05-27 04:47:59", "passenger_flow": 26.0},
+        ],
+    },
+    {"query_id": "0bad0bad", "query_type": "something_else"},
+    # A repeated id: the later result is rendered
+    {
+        "query_id": "f90efeff",
+        "query_type": "passenger_flow_statistics",
+        "total_periods": 1,
+        "periods": [{"start_time": "2024-05-26 00:00:00", "end_time": "2024-05-26 23:59:59", "passenger_flow": 512.0}],
+    },
+]
+
+REPLY = (
+    "Leave [a1b2c3]. Images [d4e5f6]. One [g7h8i9]. Events [e4afea46]. Flow [f90efeff]. "
+    "Distribution [5a823393]. Other [0bad0bad]. Unknown [x1y2z3]. Again [a1b2c3]."
+)
+
+
+def test_reports_are_byte_identical():
+    with open(EXPECTED, encoding="utf-8", newline="") as f:
+        expected = f.read()
+    assert parse_json(RESULTS, REPLY) == expected
+
+
+def test_text_without_placeholders_is_unchanged():
+    for text in ("No placeholders here.", "Brackets [not an id!] and [] stay."):
+        assert parse_json(RESULTS, text) == text
+
+
+def test_no_results_leaves_placeholders():
+    assert parse_json("", "Flow [f90efeff].") == "Flow [f90efeff]."
@@ -0,0 +1,126 @@
+import pytest
+
+from agents.PlanCompiler import compile_plan, compile_step, time_ranges
+
+
+def flow_ranges(text):
+    call = compile_step(1, text).call
+    assert call["name"] == "FlowQuery"
+    return call["arguments"]["time_ranges"].split(",")
+
+
+def test_whole_day_is_the_default():
+    assert time_ranges("Query passenger flow.") == [("2024-05-27 00:00:00", "2024-05-27 23:59:59")]
+    assert time_ranges("Query passenger flow yesterday afternoon.") == [("2024-05-26 12:00:00", "2024-05-26 17:59:59")]
+
+
+def test_two_dates_give_a_range_each():
+    assert flow_ranges("Query passenger flow for 2024-05-27 and 2024-05-26.") == [
+        "2024-05-27 00:00:00 - 2024-05-27 23:59:59",
+        "2024-05-26 00:00:00 - 2024-05-26 23:59:59",
+    ]
+
+
+def test_today_and_yesterday_give_a_range_each():
+    assert flow_ranges("Query passenger flow for today and yesterday.") == [
+        "2024-05-27 00:00:00 - 2024-05-27 23:59:59",
+        "2024-05-26 00:00:00 - 2024-05-26 23:59:59",
+    ]
+
+
+def test_clock_ranges_take_the_date_written_next_to_them():
+    text = "Query passenger flow on 2024-05-27 from 08:00 to 10:00 and on 2024-05-26 from 08:00 to 10:00."
+    assert flow_ranges(text) == [
+        "2024-05-27 08:00:00 - 2024-05-27 10:00:00",
+        "2024-05-26 08:00:00 - 2024-05-26 10:00:00",
+    ]
+    text = "Query passenger flow 10:00-11:00 on 2024-05-25 and 14:00-15:00 on 2024-05-26."
+    assert flow_ranges(text) == [
+        "2024-05-25 10:00:00 - 2024-05-25 11:00:00",
+        "2024-05-26 14:00:00 - 2024-05-26 15:00:00",
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "Query passenger flow 10:00-11:00 and 14:00-15:00 for 2024-05-25 and 2024-05-26.",
+    "Query passenger flow on 2024-05-25 and 2024-05-26 from 10:00 to 11:00.",
+    "Query passenger flow this morning and afternoon.",
+    "Query passenger flow from 2024-05-27 08:00:00 to 2024-05-27 10:00:00 and on 2024-05-26.",
+    "Query passenger flow for the last 3 hours.",
+    "Query passenger flow from 9 to 11.",
+])
+def test_times_it_cannot_place_are_left_to_the_model(text):
+    with pytest.raises(ValueError):
+        time_ranges(text)
+    assert compile_plan(f"1. {text}") == ([], [f"1. {text}"])
+
+
+def test_intrusion_step_over_several_days_is_left_to_the_model():
+    with pytest.raises(ValueError):
+        compile_step(1, "Query intrusion events for today and yesterday.")
+
+
+def test_mixed_plan_keeps_data_steps_that_use_analysis_words():
+    compiled, left = compile_plan(
+        "1. Query intrusion events today.\n"
+        "2. Compare passenger flow of today and yesterday.\n"
+        "3. Summarize the results.\n"
+    )
+    assert left == []
+    assert [step.call and step.call["name"] for step in compiled] == ["InvaseAlarmEventsQuery", "FlowQuery", None]
+    assert compiled[1].call["arguments"]["time_ranges"] == (
+        "2024-05-27 00:00:00 - 2024-05-27 23:59:59,2024-05-26 00:00:00 - 2024-05-26 23:59:59"
+    )
+
+
+def test_mixed_plan_leaves_analysis_steps_naming_data_to_the_model():
+    compiled, left = compile_plan(
+        "1. Query passenger flow from 2024-05-27 08:00:00 to 2024-05-27 10:00:00.\n"
+        "2. Analyze the correlation between passenger flow and intrusion events.\n"
+        "3. Analyze the intrusion events of step 1.\n"
+        "4. Explain the results of step 1.\n"
+    )
+    assert [(step.number, step.call and step.call["name"]) for step in compiled] == [(1, "FlowQuery"), (4, None)]
+    assert left == [
+        "2. Analyze the correlation between passenger flow and intrusion events.",
+        "3. Analyze the intrusion events of step 1.",
+    ]
+
+
+def test_images_follow_the_events_step():
+    compiled, left = compile_plan(
+        "1. Query intrusion events from 2024-05-27 10:00:00 to 2024-05-27 12:00:00.\n"
+        "2. Query images of the events from 2024-05-27 10:00:00 to 2024-05-27 12:00:00.\n"
+        "3. Query leave-post records today.\n"
+        "Appendix: [abc123]\n"
+    )
+    assert left == []
+    assert [(step.number, step.call["name"], step.after) for step in compiled] == [
+        (1, "InvaseAlarmEventsQuery", None),
+        (2, "MultiInvaseAlarmPictureQuery", 1),
+        (3, "LeaveRecordsQuery", None),
+    ]
+
+
+def test_images_of_an_uncompiled_events_step_are_left_too():
+    compiled, left = compile_plan(
+        "1. Query intrusion events for the last 2 hours.\n"
+        "2. Query images of the events from step 1.\n"
+    )
+    assert compiled == []
+    assert left == ["1. Query intrusion events for the last 2 hours.", "2. Query images of the events from step 1."]
+
+
+def test_image_step_with_explicit_ids():
+    step = compile_step(1, "Query images of event ids 4801, 4806 and 4810 on 2024-05-27.")
+    assert step.call == {"name": "MultiInvaseAlarmPictureQuery", "arguments": {"ids": [4801, 4806, 4810]}}
+
+
+def test_analysis_of_referenced_results_needs_no_query():
+    compiled, left = compile_plan(
+        "1. Query today's leave-post records for a specific time range (default: today)\n"
+        "2. Query today's intrusion events for a specific time range (default: today)\n"
+        "3. Analyze [leave_records_id] and [intrusion_events_id] correlation (time and space)\n"
+    )
+    assert left == []
+    assert [step.call and step.call["name"] for step in compiled] == ["LeaveRecordsQuery", "InvaseAlarmEventsQuery", None]
@@ -0,0 +1,91 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from agentscope.service import ServiceExecStatus, ServiceResponse
+
+from agents.Prefetcher import Prefetcher
+from tools.ToolCache import ToolCache
+
+QUESTION = "How many visitors came in today?"
+
+
+class Tools:
+    """A toolkit with one cached `FlowQuery` that blocks until `release`."""
+
+    def __init__(self, cache: ToolCache) -> None:
+        self.calls = 0
+        self.release = threading.Event()
+
+        @cache.cached(lambda time_ranges: (time_ranges, None))
+        def FlowQuery(time_ranges: str) -> ServiceResponse:
+            self.calls += 1
+            self.release.wait(5)
+            content = {"query_id": "q", "query_type": "passenger_flow", "time_ranges": time_ranges}
+            return ServiceResponse(status=ServiceExecStatus.SUCCESS, content=json.dumps(content))
+
+        self.FlowQuery = FlowQuery
+        self.service_funcs = {"FlowQuery": SimpleNamespace(original_func=FlowQuery)}
+
+
+@pytest.fixture
+def pool():
+    executor = ThreadPoolExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+def test_sessions_share_one_speculative_call(pool):
+    cache = ToolCache()
+    tools = Tools(cache)
+    first = Prefetcher(tools, cache=cache, enabled=True, executor=pool)
+    second = Prefetcher(tools, cache=cache, enabled=True, executor=pool)
+
+    assert [call["name"] for call in first.start([QUESTION])] == ["FlowQuery"]
+    assert second.start([QUESTION]) == []  # in flight for the first session
+    assert cache.stats()["speculative"]["pending"] == 1
+
+    # The first session's plan is done: the second still needs the call
+    assert first.discard() == 0
+    assert cache.stats()["speculative"]["pending"] == 1
+
+    tools.release.set()
+    response = tools.FlowQuery(time_ranges="2024-05-27 00:00:00 - 2024-05-27 23:59:59")
+    assert response.status == ServiceExecStatus.SUCCESS
+    assert tools.calls == 1
+    assert cache.stats()["speculative"] == {"pending": 0, "claimed": 1, "discarded": 0}
+    assert second.discard() == 0
+
+
+def test_call_is_dropped_once_every_session_discards_it(pool):
+    cache = ToolCache()
+    tools = Tools(cache)
+    first = Prefetcher(tools, cache=cache, enabled=True, executor=pool)
+    second = Prefetcher(tools, cache=cache, enabled=True, executor=pool)
+    first.start([QUESTION])
+    second.start([QUESTION])
+
+    assert second.discard() == 0
+    assert first.discard() == 1
+    assert cache.stats()["speculative"]["pending"] == 0
+    tools.release.set()
+
+
+def test_discard_leaves_a_newer_call_for_the_same_key(pool):
+    cache = ToolCache()
+    tools = Tools(cache)
+    tools.release.set()
+    first = Prefetcher(tools, cache=cache, enabled=True, executor=pool)
+    second = Prefetcher(tools, cache=cache, enabled=True, executor=pool)
+    first.start([QUESTION])
+    # Taken over by a tool call, then the result expires and the second
+    # session starts the call again
+    tools.FlowQuery(time_ranges="2024-05-27 00:00:00 - 2024-05-27 23:59:59")
+    cache.clear()
+    assert second.start([QUESTION])
+
+    assert first.discard() == 0
+    assert cache.stats()["speculative"]["pending"] == 1
+    assert second.discard() == 1
@@ -0,0 +1,121 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+from agents.ToolExecutor import decode_result
+from connection import db
+from database.MockData import generate
+from database.SQLiteEngine import SQLiteConnection
+from tools.FlowDistributeQuery import FlowDistribution
+from tools.FlowQuery import DecimalEncoder, FlowQuery
+from tools.InvaseAlarmEventsQuery import InvaseAlarmEventsQuery
+from tools.InvaseAlarmIndexQuery import InvaseAlarmPictureQuery
+from tools.LeaveRecordsQuery import LeaveRecordsQuery
+from tools.MultiInvaseAlarmIndexQuery import MultiInvaseAlarmPictureQuery
+from tools.ResultCodec import RECORD_KEYS, compact, decode, encode_result
+from tools.ToolCache import tool_cache
+
+DAY = ("2024-05-27 00:00:00", "2024-05-27 23:59:59")
+# Before the mock data starts
+EMPTY = ("2020-01-01 00:00:00", "2020-01-01 23:59:59")
+
+
+@pytest.fixture(scope="module")
+def event_ids(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("mock") / "codec.sqlite")
+    generate(path, 5_000, seed=11, days=2)
+    db.connect(min_size=1, max_size=2, factory=lambda: SQLiteConnection(path))
+    enabled, tool_cache.enabled = tool_cache.enabled, False
+    with db.checkout() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT id FROM t_qyrq_alarm_msg ORDER BY id")
+        ids = [row["id"] for row in cursor.fetchall()]
+    yield ids
+    tool_cache.enabled = enabled
+    db.close_connection()
+
+
+def calls(ids):
+    return [
+        (FlowQuery, {"time_ranges": f"{DAY[0]} - {DAY[1]}"}),
+        (FlowQuery, {"time_ranges": "2024-05-27 08:00:00 - 2024-05-27 09:00:00,2024-05-26 08:00:00 - 2024-05-26 09:00:00"}),
+        (FlowDistribution, {"time_range": f"{DAY[0]} - {DAY[1]}", "num_segments": "24"}),
+        (FlowDistribution, {"time_range": "2024-05-27 10:00:00 - 2024-05-27 10:59:59", "num_segments": "1"}),
+        (InvaseAlarmEventsQuery, {"start_time": DAY[0], "end_time": DAY[1]}),
+        (LeaveRecordsQuery, {"start_time": "2024-05-26 00:00:00", "end_time": DAY[1]}),
+        (InvaseAlarmPictureQuery, {"id": str(ids[len(ids) // 2])}),
+        (MultiInvaseAlarmPictureQuery, {"ids": ids[:40]}),
+        (MultiInvaseAlarmPictureQuery, {"ids": ids[:1]}),
+        # Ranges and ids without data
+        (FlowQuery, {"time_ranges": f"{EMPTY[0]} - {EMPTY[1]}"}),
+        (FlowDistribution, {"time_range": f"{EMPTY[0]} - {EMPTY[1]}", "num_segments": "4"}),
+        (InvaseAlarmEventsQuery, {"start_time": EMPTY[0], "end_time": EMPTY[1]}),
+        (LeaveRecordsQuery, {"start_time": EMPTY[0], "end_time": EMPTY[1]}),
+        (InvaseAlarmPictureQuery, {"id": "999999999"}),
+        (MultiInvaseAlarmPictureQuery, {"ids": []}),
+        (MultiInvaseAlarmPictureQuery, {"ids": [999999998, 999999999]}),
+    ]
+
+
+def without_id(data):
+    return {key: value for key, value in data.items() if key != "query_id"}
+
+
+def test_every_tool_result_survives_the_compact_format(event_ids, monkeypatch):
+    checked = set()
+    for tool, kwargs in calls(event_ids):
+        monkeypatch.setenv("TOOL_RESULT_FORMAT", "json")
+        full = json.loads(tool(**kwargs).content)
+        monkeypatch.setenv("TOOL_RESULT_FORMAT", "compact")
+        packed = tool(**kwargs).content
+
+        assert "error" not in full, (tool.__name__, full)
+        # What the agents, the compactor and the result store read
+        assert without_id(decode_result(packed)) == without_id(full), tool.__name__
+        assert decode(json.loads(encode_result(full, "compact"))) == full
+        if any(len(full.get(key) or ()) >= 2 for key in RECORD_KEYS):
+            assert json.loads(packed)["encoding"] == "compact"
+        if "query_type" not in full:
+            assert json.loads(packed) == full  # "no data" messages are left as they are
+        checked.add((tool.__name__, "query_type" in full))
+    # The flow tools answer a range without data with zero-flow periods
+    assert checked == {(tool.__name__, found) for tool, _ in calls(event_ids) for found in (True, False)} - {
+        ("FlowQuery", False), ("FlowDistribution", False),
+    }
+
+
+@pytest.mark.parametrize("content", [
+    {"query_id": "a", "query_type": "intrusion_events_in_time_range", "total": 0, "events": []},
+    {"query_id": "a", "query_type": "intrusion_events_in_time_range", "events": [{"id": 1, "alarm_time": "2024-05-27 10:00:00"}]},
+    {"query_id": "a", "query_type": "leave_post_records", "leave_post_records": [
+        {"start": "2024-05-27 10:00:00", "end": None}, {"start": "2024-05-27 11:00:00", "end": "2024-05-27 11:05:00"},
+    ]},
+    {"query_id": "a", "query_type": "intrusion_events_in_time_range", "events": [
+        {"id": 3, "url": "http://img/3.jpg"}, {"url": "http://img/4.jpg", "id": 4},
+    ]},
+    {"query_id": "a", "query_type": "passenger_flow", "periods": [
+        {"id": True, "count": 1.5, "url": "a"}, {"id": False, "count": 2, "url": "b"},
+    ]},
+    {"query_id": "a", "query_type": "intrusion_events_in_time_range", "events": [
+        {"id": 9, "alarm_time": "2024-05-27 10:00:00"}, {"id": 2, "alarm_time": "2024-05-26 23:59:59"},
+    ]},
+    {"message": "No intrusion events found in the given time range."},
+    {"error": "num_segments must be greater than 0"},
+])
+def test_edge_shapes_round_trip(content):
+    assert decode(json.loads(encode_result(content, "compact"))) == content
+    assert decode(compact(content)) == content
+
+
+def test_decimals_encode_like_the_json_format():
+    content = {"query_id": "a", "query_type": "passenger_flow", "periods": [
+        {"time_range": "x", "count": Decimal("12")}, {"time_range": "y", "count": Decimal("7.5")},
+    ]}
+    full = json.loads(encode_result(content, "json", cls=DecimalEncoder))
+    assert decode(json.loads(encode_result(content, "compact", cls=DecimalEncoder))) == full
+
+
+def test_results_that_are_not_compact_decode_unchanged():
+    for data in ({"query_id": "a", "events": [{"id": 1}, {"id": 2}]}, ["not", "a", "dict"], "text", None):
+        assert decode(data) == data
+    assert decode_result("Tool call timed out") is None
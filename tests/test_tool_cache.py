@@ -0,0 +1,250 @@
+import json
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from agentscope.service import ServiceExecStatus, ServiceResponse
+
+import tools.ToolCache as ToolCacheModule
+from connection import db
+from database.SQLiteEngine import SQLiteConnection
+from tools.ToolCache import ToolCache
+
+PAST = datetime(2024, 5, 26, 23, 59, 59)
+FUTURE = datetime.now() + timedelta(days=1)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ToolCacheModule, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def response(content: dict, status=ServiceExecStatus.SUCCESS) -> ServiceResponse:
+    return ServiceResponse(status=status, content=json.dumps(content))
+
+
+def counting_tool(cache: ToolCache, settled_at=PAST, content=None, status=ServiceExecStatus.SUCCESS):
+    """A cached tool `Query(day)` returning `content`; `calls` counts the runs."""
+    content = content if content is not None else {"query_id": "q1", "query_type": "passenger_flow", "total": 7}
+
+    @cache.cached(lambda day: (day, settled_at))
+    def Query(day: str) -> ServiceResponse:
+        Query.calls += 1
+        return response(content, status)
+
+    Query.calls = 0
+    return Query
+
+
+def test_hit_is_reemitted_with_a_fresh_query_id(clock):
+    cache = ToolCache()
+    tool = counting_tool(cache)
+    first = json.loads(tool("2024-05-26").content)
+    second = json.loads(tool("2024-05-26").content)
+    third = json.loads(tool("2024-05-26").content)
+    assert tool.calls == 1
+    assert first["query_id"] == "q1"
+    assert len({first["query_id"], second["query_id"], third["query_id"]}) == 3
+    assert {**second, "query_id": "q1"} == first
+    assert cache.stats()["by_tool"] == {"Query": {"hits": 2, "misses": 1}}
+
+
+def test_settled_window_is_kept_without_expiry(clock):
+    cache = ToolCache(live_ttl=15)
+    tool = counting_tool(cache, settled_at=PAST)
+    tool("2024-05-26")
+    clock.now += 10 ** 6
+    tool("2024-05-26")
+    assert tool.calls == 1
+
+
+def test_live_window_expires_after_live_ttl(clock):
+    cache = ToolCache(live_ttl=15)
+    tool = counting_tool(cache, settled_at=FUTURE)
+    tool("today")
+    clock.now += 14
+    tool("today")
+    assert tool.calls == 1
+    clock.now += 2
+    tool("today")
+    assert tool.calls == 2
+
+
+def test_unknown_settled_time_is_a_live_window(clock):
+    cache = ToolCache(live_ttl=15)
+    tool = counting_tool(cache, settled_at=None)
+    tool("today")
+    clock.now += 16
+    tool("today")
+    assert tool.calls == 2
+
+
+def test_no_data_answer_of_a_settled_window_expires(clock):
+    cache = ToolCache(live_ttl=15)
+    tool = counting_tool(cache, settled_at=PAST, content={"message": "No records found"})
+    assert json.loads(tool("2024-05-26").content) == {"message": "No records found"}
+    assert json.loads(tool("2024-05-26").content) == {"message": "No records found"}
+    assert tool.calls == 1
+    clock.now += 16
+    tool("2024-05-26")
+    assert tool.calls == 2
+
+
+def test_errors_are_not_cached(clock):
+    cache = ToolCache()
+    tool = counting_tool(cache, content={"error": "boom"}, status=ServiceExecStatus.ERROR)
+    tool("2024-05-26")
+    tool("2024-05-26")
+    assert tool.calls == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_put_ttl_expiry(clock):
+    cache = ToolCache()
+    cache.put("a", {"v": 1}, 10, ttl=5)
+    clock.now += 4.9
+    assert cache.get("a") == {"v": 1}
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ToolCache(max_entries=2)
+    cache.put("a", 1, 1)
+    cache.put("b", 2, 1)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3, 1)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_entries_are_evicted_by_total_size():
+    cache = ToolCache(max_bytes=10)
+    cache.put("a", 1, 6)
+    cache.put("b", 2, 6)
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+    cache.put("c", 3, 11)  # larger than the whole cache: not stored
+    assert cache.get("c") is None
+    assert cache.get("b") == 2
+
+
+@pytest.fixture
+def read_sessions(tmp_path, monkeypatch):
+    path = str(tmp_path / "empty.sqlite")
+    db.connect(min_size=1, max_size=2, factory=lambda: SQLiteConnection(path))
+    monkeypatch.setattr(db, "read_sessions", True)
+    yield
+    db.close_connection()
+
+
+def test_read_session_bypasses_cached_and_speculative_results(read_sessions):
+    cache = ToolCache()
+    tool = counting_tool(cache)
+    tool("2024-05-26")
+    done = Future()
+    done.set_result(response({"query_id": "s1", "query_type": "passenger_flow", "total": 1}))
+    cache.speculate(tool.key_of("2024-05-27"), lambda: done, 30, owner="prefetcher")
+
+    with db.read_session() as session:
+        assert session is not None
+        first = json.loads(tool("2024-05-26").content)
+        tool("2024-05-27")
+        tool("2024-05-27")
+    assert first["query_id"] == "q1"  # read in the session, not a cache hit
+    assert tool.calls == 4
+    assert cache.stats()["speculative"]["pending"] == 1
+    assert cache.stats()["entries"] == 1
+
+    assert json.loads(tool("2024-05-27").content)["query_id"] == "s1"  # outside again
+    assert tool.calls == 4
+
+
+def test_claim_takes_over_a_finished_speculation(clock):
+    cache = ToolCache()
+    tool = counting_tool(cache)
+    done = Future()
+    done.set_result(response({"query_id": "s1", "query_type": "passenger_flow", "total": 1}))
+    future, started = cache.speculate(tool.key_of("2024-05-26"), lambda: done, 30, owner="p")
+    assert (future, started) == (done, True)
+
+    assert json.loads(tool("2024-05-26").content)["query_id"] == "s1"
+    assert tool.calls == 0
+    assert cache.stats()["speculative"] == {"pending": 0, "claimed": 1, "discarded": 0}
+    # ... and the taken-over result is cached like any other
+    assert json.loads(tool("2024-05-26").content)["total"] == 1
+    assert tool.calls == 0
+
+
+def test_claim_cancels_a_speculation_that_has_not_started(clock):
+    cache = ToolCache()
+    tool = counting_tool(cache)
+    queued = Future()
+    cache.speculate(tool.key_of("2024-05-26"), lambda: queued, 30, owner="p")
+    assert json.loads(tool("2024-05-26").content)["query_id"] == "q1"
+    assert tool.calls == 1
+    assert queued.cancelled()
+    assert cache.stats()["speculative"] == {"pending": 0, "claimed": 0, "discarded": 1}
+
+
+def test_failed_or_expired_speculation_is_not_used(clock):
+    cache = ToolCache()
+    tool = counting_tool(cache)
+    failed = Future()
+    failed.set_running_or_notify_cancel()
+    failed.set_exception(RuntimeError("db down"))
+    cache.speculate(tool.key_of("2024-05-26"), lambda: failed, 30, owner="p")
+    tool("2024-05-26")
+    assert tool.calls == 1
+
+    running = Future()
+    running.set_running_or_notify_cancel()
+    cache.speculate(tool.key_of("2024-05-25"), lambda: running, 30, owner="p")
+    clock.now += 31
+    tool("2024-05-25")
+    assert tool.calls == 2
+    assert cache.stats()["speculative"] == {"pending": 0, "claimed": 0, "discarded": 2}
+
+
+def test_speculate_joins_an_unexpired_call_and_replaces_an_expired_one(clock):
+    cache = ToolCache()
+    first, second = Future(), Future()
+    assert cache.speculate("k", lambda: first, 30, owner="a") == (first, True)
+    assert cache.speculate("k", lambda: second, 30, owner="b") == (first, False)
+    clock.now += 31
+    assert cache.speculate("k", lambda: second, 30, owner="b") == (second, True)
+    assert first.cancelled()
+
+
+def test_discard_drops_a_speculation_once_all_owners_give_it_up(clock):
+    cache = ToolCache()
+    queued = Future()
+    cache.speculate("k", lambda: queued, 30, owner="a")
+    cache.speculate("k", lambda: Future(), 30, owner="b")
+    assert cache.discard_speculative(["k"], owner="c") == 0
+    assert cache.discard_speculative(["k"], owner="a") == 0
+    assert not queued.cancelled()
+    assert cache.discard_speculative(["k"], owner="b") == 1
+    assert queued.cancelled()
+    assert cache.stats()["speculative"] == {"pending": 0, "claimed": 0, "discarded": 1}
+
+
+def test_discard_without_keys_drops_every_speculation(clock):
+    cache = ToolCache()
+    futures = [Future(), Future()]
+    cache.speculate("a", lambda: futures[0], 30, owner="p")
+    cache.speculate("b", lambda: futures[1], 30, owner="q")
+    assert cache.discard_speculative() == 2
+    assert all(future.cancelled() for future in futures)
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Gaps and timestamps are whole seconds: alarm_time columns are DATETIME(0)
+Gap = Union[int, timedelta]
+
+_EPOCH_SECONDS = datetime(1970, 1, 1).toordinal() * 86400
+
+
+def _seconds(gap: Gap) -> int:
+    return int(gap.total_seconds()) if isinstance(gap, timedelta) else int(gap)
+
+
+def to_seconds(times: Sequence[datetime]) -> np.ndarray:
+    """Convert datetimes to an int64 array of seconds since the epoch.
+
+    Sub-second parts are dropped. Building the integers from the date
+    fields is several times faster than NumPy's own object-to-datetime64
+    conversion.
+    """
+    if isinstance(times, np.ndarray):
+        return times.astype("datetime64[s]").astype(np.int64)
+    return np.fromiter(
+        (t.toordinal() * 86400 + t.hour * 3600 + t.minute * 60 + t.second - _EPOCH_SECONDS for t in times),
+        dtype=np.int64,
+        count=len(times),
+    )
+
+
+def find_gaps(ts: np.ndarray, gap: Gap) -> np.ndarray:
+    """Indices `i` where `ts[i] - ts[i - 1]` exceeds `gap`.
+
+    Args:
+        ts (np.ndarray): sorted int64 timestamps in seconds
+        gap (int | timedelta): largest step that does not count as a gap
+
+    Returns:
+        np.ndarray: indices of the first element after each gap
+    """
+    return np.flatnonzero(np.diff(ts) > _seconds(gap)) + 1
+
+
+def split_runs(ts: np.ndarray, max_gap: Gap) -> Tuple[np.ndarray, np.ndarray]:
+    """Segment sorted timestamps into runs whose steps are all <= `max_gap`.
+
+    Returns:
+        tuple: `(starts, ends)` so that run `k` is `ts[starts[k]:ends[k]]`
+    """
+    if len(ts) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    breaks = find_gaps(ts, max_gap)
+    return np.concatenate(([0], breaks)), np.concatenate((breaks, [len(ts)]))
+
+
+def run_length(ts: np.ndarray, max_gap: Gap, previous: Optional[int] = None) -> int:
+    """Length of the leading run of `ts`, i.e. the index of the first gap.
+
+    `previous` is the timestamp just before `ts[0]` when a run is extended
+    batch by batch; a gap before the first element yields 0.
+    """
+    if len(ts) == 0:
+        return 0
+    if previous is not None and ts[0] - previous > _seconds(max_gap):
+        return 0
+    breaks = find_gaps(ts, max_gap)
+    return int(breaks[0]) if len(breaks) else len(ts)
+
+
+def debounce(ts: np.ndarray, min_gap: Gap, last: Optional[int] = None) -> np.ndarray:
+    """Greedy debounce: keep the first timestamp, then each first timestamp
+    at least `min_gap` after the last kept one.
+
+    A step of at least `min_gap` always starts a new chain, because the
+    last kept element can be no later than the element before the step.
+    The chains between such steps are independent, so they are advanced
+    in lockstep: each round finds the next kept element of every chain
+    with one vectorized binary search. The number of rounds is the largest
+    number of elements kept from any one chain, not the input size.
+
+    Args:
+        ts (np.ndarray): sorted int64 timestamps in seconds
+        min_gap (int | timedelta): minimum distance between kept timestamps
+        last (int, optional): last timestamp kept from an earlier batch
+
+    Returns:
+        np.ndarray: indices of the kept timestamps, ascending
+    """
+    step = _seconds(min_gap)
+    n = len(ts)
+    i = 0 if last is None else int(np.searchsorted(ts, last + step, side="left"))
+    if step <= 0 or i >= n:
+        return np.arange(i, n, dtype=np.int64)
+
+    starts = np.concatenate(([i], np.flatnonzero(np.diff(ts[i:]) >= step) + i + 1))
+    ends = np.append(starts[1:], n)
+
+    kept = [starts]
+    current = starts
+    while len(current):
+        following = np.searchsorted(ts, ts[current] + step, side="left")
+        open_chains = following < ends
+        current, ends = following[open_chains], ends[open_chains]
+        kept.append(current)
+    return np.sort(np.concatenate(kept))
+
+
+def sample_indices(length: int, count: int = 5) -> np.ndarray:
+    """Evenly spaced quantile indices into a run of `length` elements.
+
+    Runs no longer than `count` are returned whole. Otherwise the first and
+    last elements are always included, e.g. for `count=5` the indices are
+    `0, n//4, n//2, 3n//4, n-1`.
+    """
+    if count < 1:
+        raise ValueError(f"count must be positive, got {count}")
+    if length <= count:
+        return np.arange(length, dtype=np.int64)
+    if count == 1:
+        return np.zeros(1, dtype=np.int64)
+    indices = np.arange(count, dtype=np.int64) * length // (count - 1)
+    indices[-1] = length - 1
+    return indices
@@ -1,16 +1,17 @@
-import pymysql
 import json
 from datetime import datetime, timedelta
 from decimal import Decimal
 import uuid
 
 from connection import db
+from tools.ToolCache import tool_cache, parse_range
+from tools.ResultCodec import encode_result
+from structure.FlowRollup import flow_rollup, query_flows
 
 from agentscope.service import(
     ServiceResponse,
     ServiceExecStatus,
 )
-from agentscope.utils.common import _if_change_database
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -18,6 +19,37 @@ class DecimalEncoder(json.JSONEncoder):
             return int(obj)
         return super(DecimalEncoder, self).default(obj)
 
+def _ceil_second(t):
+    return t if not t.microsecond else t.replace(microsecond=0) + timedelta(seconds=1)
+
+def _bucketed_flows(start_time, end_time, num_segments, total_seconds):
+    # One grouped pass over the range: each row falls into bucket
+    # floor(elapsed * num_segments / total), so the number of round trips
+    # no longer grows with num_segments.
+    query = (
+        "SELECT TIMESTAMPDIFF(SECOND, %s, create_time) * %s DIV %s AS bucket, "
+        "SUM(person_num) AS total_flow "
+        "FROM t_kltj_alarm_msg "
+        "WHERE create_time BETWEEN %s AND %s "
+        "GROUP BY bucket"
+    )
+
+    with db.checkout() as conn, conn.cursor() as cursor:
+        cursor.execute(query, (start_time, num_segments, total_seconds, start_time, end_time))
+        rows = cursor.fetchall()
+
+    flows = [0] * num_segments
+    for row in rows:
+        # Rows stamped exactly at end_time belong to the last segment
+        bucket = min(int(row['bucket']), num_segments - 1)
+        flows[bucket] += float(row['total_flow']) if row['total_flow'] else 0
+    return flows
+
+def _cache_key(time_range, num_segments):
+    start, end = parse_range(time_range)
+    return (start, end, int(num_segments)), end
+
+@tool_cache.cached(_cache_key)
 def FlowDistribution(time_range: str, num_segments: str) -> str:
     """
     Query passenger flow distribution over sub-intervals within a time range.
@@ -43,38 +75,29 @@ def FlowDistribution(time_range: str, num_segments: str) -> str:
             )
 
         segment_duration = (end_datetime - start_datetime) / num_segments
-        results = []
+        total_seconds = max(int((end_datetime - start_datetime).total_seconds()), 1)
 
-        conn = db.get_connection()
+        if flow_rollup is not None:
+            # Segments are half-open except the last, which includes end_time.
+            # create_time has second precision, so fractional boundaries round up.
+            ranges = [
+                (_ceil_second(start_datetime + i * segment_duration), _ceil_second(start_datetime + (i + 1) * segment_duration))
+                for i in range(num_segments)
+            ]
+            ranges[-1] = (ranges[-1][0], end_datetime + timedelta(seconds=1))
+            with db.checkout() as conn:
+                flows = query_flows(conn, ranges)
+        else:
+            flows = _bucketed_flows(start_time, end_time, num_segments, total_seconds)
 
+        results = []
         for i in range(num_segments):
             segment_start = start_datetime + i * segment_duration
             segment_end = segment_start + segment_duration
-
-            query = (
-                "SELECT SUM(person_num) as total_flow "
-                "FROM t_kltj_alarm_msg "
-                "WHERE create_time BETWEEN %s AND %s"
-            )
-
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    query,
-                    (
-                        segment_start.strftime("%Y-%m-%d %H:%M:%S"),
-                        segment_end.strftime("%Y-%m-%d %H:%M:%S"),
-                    ),
-                )
-                if _if_change_database(query):
-                    conn.commit()
-                result = cursor.fetchone()
-
-            total_flow = float(result['total_flow']) if result and result['total_flow'] else 0
-            
             results.append({
                 "start_time": segment_start.strftime("%Y-%m-%d %H:%M:%S"),
                 "end_time": segment_end.strftime("%Y-%m-%d %H:%M:%S"),
-                "passenger_flow": total_flow
+                "passenger_flow": flows[i]
             })
 
         if results:
@@ -86,7 +109,7 @@ def FlowDistribution(time_range: str, num_segments: str) -> str:
             }
             return ServiceResponse(
                 status=ServiceExecStatus.SUCCESS,
-                content=json.dumps(content, ensure_ascii=True, cls=DecimalEncoder),
+                content=encode_result(content, cls=DecimalEncoder),
             )
         else:
             return ServiceResponse(
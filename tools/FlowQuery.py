@@ -1,16 +1,17 @@
 import uuid
-import pymysql
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
 
 from connection import db
+from tools.ToolCache import tool_cache, parse_range
+from tools.ResultCodec import encode_result
+from structure.FlowRollup import query_flows
 
 from agentscope.service import(
     ServiceResponse,
     ServiceExecStatus,
 )
-from agentscope.utils.common import _if_change_database
 
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -18,6 +19,11 @@ class DecimalEncoder(json.JSONEncoder):
             return int(obj)
         return super(DecimalEncoder, self).default(obj)
 
+def _cache_key(time_ranges):
+    ranges = tuple(parse_range(time_range) for time_range in time_ranges.split(','))
+    return ranges, max(end for _, end in ranges)
+
+@tool_cache.cached(_cache_key)
 def FlowQuery(time_ranges: str) -> str:
     """
     Query passenger flow totals for multiple time ranges.
@@ -33,25 +39,24 @@ def FlowQuery(time_ranges: str) -> str:
     results = []
 
     try:
-        conn = db.get_connection()
-        
+        periods = []
         for time_range in time_ranges:
             start_time, end_time = time_range.split(' - ')
-            
-            query = (
-                "SELECT SUM(person_num) as total_flow "
-                "FROM t_kltj_alarm_msg "
-                "WHERE create_time BETWEEN %s AND %s"
+            periods.append((start_time.strip(), end_time.strip()))
+
+        # Periods are inclusive at second precision, i.e. [start, end + 1s)
+        ranges = [
+            (
+                datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S"),
+                datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S") + timedelta(seconds=1),
             )
+            for start_time, end_time in periods
+        ]
 
-            with conn.cursor() as cursor:
-                cursor.execute(query, (start_time, end_time))
-                if _if_change_database(query):
-                    conn.commit()
-                result = cursor.fetchone()
+        with db.checkout() as conn:
+            flows = query_flows(conn, ranges)
 
-            total_flow = float(result['total_flow']) if result and result['total_flow'] else 0
-            
+        for (start_time, end_time), total_flow in zip(periods, flows):
             results.append({
                 "start_time": start_time,
                 "end_time": end_time,
@@ -67,7 +72,7 @@ def FlowQuery(time_ranges: str) -> str:
             }
             return ServiceResponse(
                 status=ServiceExecStatus.SUCCESS,
-                content=json.dumps(content, ensure_ascii=True, cls=DecimalEncoder),
+                content=encode_result(content, cls=DecimalEncoder),
             )
         else:
             return ServiceResponse(
@@ -1,19 +1,28 @@
 import uuid
-import pymysql
 import json
-from datetime import datetime, timedelta
+from contextlib import closing
+from datetime import timedelta
 
-from connection import db
+import numpy as np
+
+from connection import db, stream_batches
+from tools.ToolCache import tool_cache, parse_time
+from tools.ResultCodec import encode_result
+from tools.EventSeries import debounce
 
 from agentscope.service import(
     ServiceResponse,
     ServiceExecStatus,
 )
-from agentscope.utils.common import _if_change_database
+
+DEBOUNCE = timedelta(minutes=2)
 
 
 
+def _cache_key(start_time, end_time):
+    return (parse_time(start_time), parse_time(end_time)), parse_time(end_time)
 
+@tool_cache.cached(_cache_key)
 def InvaseAlarmEventsQuery(start_time: str, end_time: str) -> str:
     """
     Query intrusion events within a given time range. You may expand the time
@@ -27,33 +36,34 @@ def InvaseAlarmEventsQuery(start_time: str, end_time: str) -> str:
         str: JSON string with event ids and alarm_time.
     """
 
+    # Timestamps come back as integer seconds since start_time, which feed
+    # the vectorized debounce without per-row datetime conversion
     query = (
-        "SELECT alarm_time, id "
+        "SELECT TIMESTAMPDIFF(SECOND, %s, alarm_time) AS elapsed, id "
         "FROM t_qyrq_alarm_msg "
         "WHERE alarm_time BETWEEN %s AND %s "
-        "ORDER BY alarm_time ASC"
+        "ORDER BY alarm_time ASC, id ASC"
     )
 
 
     try:
-        conn = db.get_connection()
-        
-        with conn.cursor() as cursor:
-            cursor.execute(query, (start_time, end_time))
-            if _if_change_database(query):
-                conn.commit()
-            results = cursor.fetchall()
-
+        # Rows are streamed and debounced batch by batch, so only the emitted
+        # events are kept in memory however wide the range is. The pooled
+        # connection is in autocommit mode, so no COMMIT is needed (and one
+        # would abort the unbuffered read).
+        start = parse_time(start_time)
         filtered_results = []
-        last_time = None
-        for result in results:
-            current_time = result['alarm_time']
-            if last_time is None or (current_time - last_time) >= timedelta(minutes=2):
-                filtered_results.append({
-                    "alarm_time": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "id": result['id']
-                })
-                last_time = current_time
+        last_kept = None
+        with db.checkout() as conn, closing(stream_batches(conn, query, (start_time, start_time, end_time))) as batches:
+            for rows in batches:
+                elapsed = np.fromiter((row['elapsed'] for row in rows), dtype=np.int64, count=len(rows))
+                for i in debounce(elapsed, DEBOUNCE, last_kept):
+                    row = rows[i]
+                    filtered_results.append({
+                        "alarm_time": (start + timedelta(seconds=row['elapsed'])).strftime("%Y-%m-%d %H:%M:%S"),
+                        "id": row['id']
+                    })
+                    last_kept = row['elapsed']
 
         if filtered_results:
             content = {
@@ -64,7 +74,7 @@ def InvaseAlarmEventsQuery(start_time: str, end_time: str) -> str:
             }
             return ServiceResponse(
                 status=ServiceExecStatus.SUCCESS,
-                content=json.dumps(content, ensure_ascii=True),
+                content=encode_result(content),
             )
         else:
             return ServiceResponse(
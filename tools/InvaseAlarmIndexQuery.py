@@ -1,15 +1,27 @@
 import uuid
-import pymysql
 import json
 from datetime import timedelta
 from connection import db
+from database.Statements import in_list
+from tools.ToolCache import tool_cache
+from tools.ResultCodec import encode_result
+from tools.EventSeries import to_seconds, run_length, sample_indices
 
 from agentscope.service import(
     ServiceResponse,
     ServiceExecStatus,
 )
-from agentscope.utils.common import _if_change_database
 
+IMAGE_WINDOW = timedelta(minutes=10)
+MAX_GAP = timedelta(minutes=2)
+PAGE_SIZE = 64
+SAMPLE_COUNT = 5
+
+def _cache_key(id):
+    # The image window after an event may still be filling up
+    return int(id), None
+
+@tool_cache.cached(_cache_key)
 def InvaseAlarmPictureQuery(id: str) -> str:
     """
     Query multiple images for a single intrusion event by id.
@@ -22,52 +34,77 @@ def InvaseAlarmPictureQuery(id: str) -> str:
         str: JSON with image urls and timestamps.
     """
 
-    query = (
+    anchor_query = (
+        "SELECT id, alarm_time, alarm_pic_url "
+        "FROM t_qyrq_alarm_msg "
+        "WHERE id = %s"
+    )
+    # Keyset pages over the alarm_time index; (id) rides along in the
+    # secondary index, so pages never touch the wide rows.
+    first_page_query = (
+        "SELECT id, alarm_time "
+        "FROM t_qyrq_alarm_msg "
+        "WHERE alarm_time > %s AND alarm_time <= %s "
+        "ORDER BY alarm_time ASC, id ASC "
+        "LIMIT %s"
+    )
+    next_page_query = (
+        "SELECT id, alarm_time "
+        "FROM t_qyrq_alarm_msg "
+        "WHERE (alarm_time, id) > (%s, %s) AND alarm_time <= %s "
+        "ORDER BY alarm_time ASC, id ASC "
+        "LIMIT %s"
+    )
+    images_query = (
         "SELECT id, alarm_time, alarm_pic_url "
         "FROM t_qyrq_alarm_msg "
-        "WHERE id = %s "
-        "    OR (alarm_time > (SELECT alarm_time FROM t_qyrq_alarm_msg WHERE id = %s) "
-        "        AND alarm_time <= (SELECT alarm_time FROM t_qyrq_alarm_msg WHERE id = %s) + INTERVAL 10 MINUTE) "
-        "ORDER BY alarm_time ASC"
+        "WHERE id IN ({placeholders})"
     )
 
     try:
-        conn = db.get_connection()
-
-        with conn.cursor() as cursor:
-            cursor.execute(query, (id, id, id))
-            if _if_change_database(query):
-                conn.commit()
-            results = cursor.fetchall()
-
-        if not results:
-            return ServiceResponse(
-                status=ServiceExecStatus.SUCCESS,
-                content=json.dumps({"message": f"No intrusion event found for id {id}."}, ensure_ascii=True),
-            )
-
-        filtered_results = []
-        last_time = None
-        for result in results:
-            current_time = result['alarm_time']
-            if last_time is None or (current_time - last_time) <= timedelta(minutes=2):
-                filtered_results.append(result)
-                last_time = current_time
-            else:
-                break
-
-        if len(filtered_results) <= 5:
-            selected_results = filtered_results
-        else:
-            # compute five-point sampling indices across the sequence
-            indices = [
-                0,
-                len(filtered_results) // 4,
-                len(filtered_results) // 2,
-                (3 * len(filtered_results)) // 4,
-                len(filtered_results) - 1
-            ]
-            selected_results = [filtered_results[i] for i in indices]
+        with db.checkout() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(anchor_query, (id,))
+                anchor = cursor.fetchone()
+
+            if not anchor:
+                return ServiceResponse(
+                    status=ServiceExecStatus.SUCCESS,
+                    content=json.dumps({"message": f"No intrusion event found for id {id}."}, ensure_ascii=True),
+                )
+
+            # Walk forward from the anchor and stop at the first gap > 2 minutes
+            window_end = anchor['alarm_time'] + IMAGE_WINDOW
+            run_ids = [anchor['id']]
+            previous = int(to_seconds([anchor['alarm_time']])[0])
+            query, params = first_page_query, (anchor['alarm_time'], window_end, PAGE_SIZE)
+            while True:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    page = cursor.fetchall()
+
+                times = to_seconds([row['alarm_time'] for row in page])
+                length = run_length(times, MAX_GAP, previous)
+                run_ids.extend(row['id'] for row in page[:length])
+
+                if length < len(page) or len(page) < PAGE_SIZE:
+                    break
+                previous = int(times[-1])
+                query, params = next_page_query, (page[-1]['alarm_time'], page[-1]['id'], window_end, PAGE_SIZE)
+
+            # Quantile sampling across the run; only the sampled rows are read in full
+            sampled_ids = [run_ids[i] for i in sample_indices(len(run_ids), SAMPLE_COUNT)]
+
+            rows = {anchor['id']: anchor}
+            missing = [event_id for event_id in sampled_ids if event_id not in rows]
+            if missing:
+                query, params = in_list(images_query, missing)
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    for row in cursor.fetchall():
+                        rows[row['id']] = row
+
+        selected_results = [rows[event_id] for event_id in sampled_ids]
 
         content = {
             "query_id": str(uuid.uuid4())[:8],
@@ -82,7 +119,7 @@ def InvaseAlarmPictureQuery(id: str) -> str:
         }
         return ServiceResponse(
             status=ServiceExecStatus.SUCCESS,
-            content=json.dumps(content, ensure_ascii=True),
+            content=encode_result(content),
         )
         
     except Exception as e:
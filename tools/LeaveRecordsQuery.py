@@ -1,15 +1,19 @@
 import uuid
-import pymysql
 import json
 
 from connection import db
+from tools.ToolCache import tool_cache, parse_time
+from tools.ResultCodec import encode_result
 
 from agentscope.service import(
     ServiceResponse,
     ServiceExecStatus,
 )
-from agentscope.utils.common import _if_change_database
 
+def _cache_key(start_time, end_time):
+    return (parse_time(start_time), parse_time(end_time)), parse_time(end_time)
+
+@tool_cache.cached(_cache_key)
 def LeaveRecordsQuery(start_time: str, end_time: str) -> str:
     """
     Query leave-post records within a time range.
@@ -22,8 +26,6 @@ def LeaveRecordsQuery(start_time: str, end_time: str) -> str:
         str: JSON string of leave records.
     """
     try:
-        conn = db.get_connection()
-
         query = (
             "SELECT time_slot_start, time_slot_end, interval_time "
             "FROM t_lgsb_alarm_record "
@@ -33,10 +35,8 @@ def LeaveRecordsQuery(start_time: str, end_time: str) -> str:
 
         results = []
 
-        with conn.cursor() as cursor:
+        with db.checkout() as conn, conn.cursor() as cursor:
             cursor.execute(query, (start_time, end_time))
-            if _if_change_database(query):
-                conn.commit()
             records = cursor.fetchall()
 
             for record in records:
@@ -55,7 +55,7 @@ def LeaveRecordsQuery(start_time: str, end_time: str) -> str:
             }
             return ServiceResponse(
                 status=ServiceExecStatus.SUCCESS,
-                content=json.dumps(content, ensure_ascii=True),
+                content=encode_result(content),
             )
         else:
             return ServiceResponse(
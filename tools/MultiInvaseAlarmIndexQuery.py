@@ -1,17 +1,30 @@
 import uuid
-import pymysql
 import json
-from datetime import timedelta
+from datetime import datetime
 from connection import db
+from database.Statements import in_list
+from tools.ToolCache import tool_cache
+from tools.ResultCodec import encode_result
 
 from agentscope.service import(
     ServiceResponse,
     ServiceExecStatus,
 )
-from agentscope.utils.common import _if_change_database
+
+IMAGES_QUERY = (
+    "SELECT id, alarm_time, alarm_pic_url "
+    "FROM t_qyrq_alarm_msg "
+    "WHERE id IN ({placeholders}) "
+    "ORDER BY alarm_time ASC"
+)
 
 
+def _cache_key(ids):
+    # Rows looked up by id do not change once written (ToolCache still
+    # expires "not found" answers like live ones)
+    return tuple(sorted({int(i) for i in ids})), datetime.min
 
+@tool_cache.cached(_cache_key)
 def MultiInvaseAlarmPictureQuery(ids: list) -> str:
     """
     Query images for multiple intrusion events by ids.
@@ -23,22 +36,12 @@ def MultiInvaseAlarmPictureQuery(ids: list) -> str:
         str: JSON with image urls per event.
     """
 
-    placeholders = ", ".join(["%s"] * len(ids)) if ids else "%s"
-    query = (
-        "SELECT id, alarm_time, alarm_pic_url "
-        "FROM t_qyrq_alarm_msg "
-        f"WHERE id IN ({placeholders}) "
-        "ORDER BY alarm_time ASC"
-    )
+    query, params = in_list(IMAGES_QUERY, ids)
 
 
     try:
-        conn = db.get_connection()
-
-        with conn.cursor() as cursor:
-            cursor.execute(query, tuple(ids) if ids else (None,))
-            if _if_change_database(query):
-                conn.commit()
+        with db.checkout() as conn, conn.cursor() as cursor:
+            cursor.execute(query, params)
             results = cursor.fetchall()
 
         if not results:
@@ -61,7 +64,7 @@ def MultiInvaseAlarmPictureQuery(ids: list) -> str:
         }
         return ServiceResponse(
             status=ServiceExecStatus.SUCCESS,
-            content=json.dumps(content, ensure_ascii=True),
+            content=encode_result(content),
         )
         
     except Exception as e:
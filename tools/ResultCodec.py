@@ -0,0 +1,136 @@
+"""Compact encoding of tool results for model prompts.
+
+A tool result is a JSON object whose record lists (events, periods, ...)
+repeat every key once per record. In the compact form each record list
+becomes one array per column, and the columns that dominate large results
+are shortened further:
+
+- timestamps: `{"base": "2024-05-27 12:00:03", "seconds_after": [0, 125]}`
+- integer columns (ids): `{"start": 4801, "deltas": [5, 6]}`, each value the
+  previous one plus its delta
+- strings sharing a prefix (image URLs): `{"prefix": "http://.../", "suffixes": ["4895.jpg"]}`
+
+The result is marked `"encoding": "compact"` and `decode` restores it
+exactly, so the full records still reach the query result store, and from
+there the reports `JsonParser` renders by `query_id`. The format is chosen
+with `TOOL_RESULT_FORMAT` ("json", the default, or "compact").
+"""
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+FORMATS = ("json", "compact")
+
+ENCODING = "compact"
+
+# Keys of the record lists in the tool results
+RECORD_KEYS = ("events", "periods", "segments", "leave_post_records")
+
+_SECOND = timedelta(seconds=1)
+_TIMESTAMP = re.compile(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$")
+
+# Column objects cost more than they save on shorter lists and prefixes
+MIN_RECORDS = 2
+MIN_PREFIX = 8
+
+
+# How to read compact results, for the prompts of the agents that get them
+FORMAT_NOTE = """
+Tool results marked "encoding": "compact" give each record field as one column:
+- {"base": t, "seconds_after": [...]}: the time t plus each number of seconds
+- {"start": n, "deltas": [...]}: n, then each value is the previous one plus the next delta
+- {"prefix": p, "suffixes": [...]}: p followed by each suffix
+"""
+
+
+def result_format() -> str:
+    fmt = os.getenv("TOOL_RESULT_FORMAT", "json").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown TOOL_RESULT_FORMAT {fmt!r}; expected one of {FORMATS}")
+    return fmt
+
+
+def format_note() -> str:
+    """`FORMAT_NOTE` when tools return compact results, else nothing, so
+    the prompts stay the same in the default format."""
+    return FORMAT_NOTE if result_format() == "compact" else ""
+
+
+def encode_result(content: Dict[str, Any], fmt: Optional[str] = None, **kwargs: Any) -> str:
+    """JSON text of a tool result in `fmt` (defaults to `TOOL_RESULT_FORMAT`).
+    Extra keyword arguments go to `json.dumps`, e.g. `cls`."""
+    if (fmt or result_format()) == "compact":
+        content = compact(content)
+    return json.dumps(content, ensure_ascii=True, **kwargs)
+
+
+def compact(content: Dict[str, Any]) -> Dict[str, Any]:
+    """The compact form of a decoded tool result. Record lists that are not
+    lists of at least `MIN_RECORDS` uniform objects are kept as they are."""
+    encoded = {}
+    changed = False
+    for key, value in content.items():
+        if key in RECORD_KEYS and _uniform(value):
+            encoded[key] = {column: _encode_column([record[column] for record in value]) for column in value[0]}
+            changed = True
+        else:
+            encoded[key] = value
+    if changed:
+        # Last, so results still start with query_id, query_type and totals
+        encoded["encoding"] = ENCODING
+    return encoded
+
+
+def decode(data: Any) -> Any:
+    """The full form of a decoded tool result; anything that is not a
+    compact result is returned unchanged."""
+    if not isinstance(data, dict) or data.get("encoding") != ENCODING:
+        return data
+    decoded = {}
+    for key, value in data.items():
+        if key == "encoding":
+            continue
+        if key in RECORD_KEYS and isinstance(value, dict):
+            columns = {column: _decode_column(encoded) for column, encoded in value.items()}
+            count = min((len(values) for values in columns.values()), default=0)
+            value = [{column: values[i] for column, values in columns.items()} for i in range(count)]
+        decoded[key] = value
+    return decoded
+
+
+def _uniform(records: Any) -> bool:
+    if not isinstance(records, list) or len(records) < MIN_RECORDS or not isinstance(records[0], dict):
+        return False
+    keys = list(records[0])
+    return all(isinstance(record, dict) and list(record) == keys for record in records)
+
+
+def _encode_column(values: List[Any]) -> Any:
+    if all(isinstance(value, str) and _TIMESTAMP.match(value) for value in values):
+        base = datetime.fromisoformat(values[0])
+        return {"base": values[0], "seconds_after": [(datetime.fromisoformat(value) - base) // _SECOND for value in values]}
+    if all(type(value) is int for value in values):
+        return {"start": values[0], "deltas": [b - a for a, b in zip(values, values[1:])]}
+    if all(isinstance(value, str) for value in values):
+        prefix = os.path.commonprefix(values)
+        if len(prefix) >= MIN_PREFIX:
+            return {"prefix": prefix, "suffixes": [value[len(prefix):] for value in values]}
+    return values
+
+
+def _decode_column(encoded: Any) -> List[Any]:
+    if isinstance(encoded, list):
+        return encoded
+    if "seconds_after" in encoded:
+        base = datetime.fromisoformat(encoded["base"])
+        return [(base + offset * _SECOND).isoformat(" ") for offset in encoded["seconds_after"]]
+    if "deltas" in encoded:
+        values = [encoded["start"]]
+        for delta in encoded["deltas"]:
+            values.append(values[-1] + delta)
+        return values
+    if "suffixes" in encoded:
+        return [encoded["prefix"] + suffix for suffix in encoded["suffixes"]]
+    raise ValueError(f"Unknown column encoding: {sorted(encoded)}")
@@ -0,0 +1,286 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from agentscope.service import ServiceResponse, ServiceExecStatus
+
+from connection import db
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Normalizers map a tool's arguments to (cache key, settled_at). `settled_at`
+# is the time after which the answer can no longer change (the end of the
+# queried window); None means unknown, which is treated like a live window.
+Normalizer = Callable[..., Tuple[Hashable, Optional[datetime]]]
+
+
+def parse_time(value: str) -> datetime:
+    return datetime.strptime(value.strip(), TIME_FORMAT)
+
+
+def parse_range(value: str) -> Tuple[datetime, datetime]:
+    start_time, end_time = value.split(' - ')
+    return parse_time(start_time), parse_time(end_time)
+
+
+class _Entry:
+    __slots__ = ("content", "size", "expires_at")
+
+    def __init__(self, content: Any, size: int, expires_at: Optional[float]) -> None:
+        self.content = content
+        self.size = size
+        self.expires_at = expires_at
+
+
+class _Speculation:
+    __slots__ = ("future", "expires_at", "owners")
+
+    def __init__(self, future: Future, expires_at: float, owner: Hashable) -> None:
+        self.future = future
+        self.expires_at = expires_at
+        self.owners = {owner}
+
+
+class ToolCache:
+    """LRU + TTL cache of successful tool results, keyed on normalized args.
+
+    Results for windows that ended in the past never change and are kept
+    until evicted by size; windows that touch "now" expire after `live_ttl`
+    seconds. Memory is bounded by entry count and by the total size of the
+    cached JSON. Every hit is re-emitted with a fresh `query_id`.
+
+    Speculative calls started before the model asks for them (see
+    `agents/Prefetcher.py`) are registered with `speculate`. A later call
+    with the same key takes over the speculative result, waiting for it if
+    it is still running, as long as it has not expired. Several owners
+    (e.g. the prefetchers of two sessions) can share one speculative call;
+    it is dropped once all of them have discarded it.
+
+    Inside a `db.read_session()` calls bypass both the cached and the
+    speculative results, which were read outside the session's snapshot.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 32 * 1024 * 1024,
+        live_ttl: float = 15.0,
+        enabled: bool = True,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.live_ttl = live_ttl
+        self.enabled = enabled
+
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._speculative: Dict[Hashable, _Speculation] = {}
+        self.claimed = 0
+        self.discarded = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry.content
+
+    def put(self, key: Hashable, content: Any, size: int, ttl: Optional[float] = None) -> None:
+        if size > self.max_bytes:
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(content, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def speculate(self, key: Hashable, start: Callable[[], Future], ttl: float, owner: Hashable) -> Tuple[Future, bool]:
+        """Make `owner` an owner of the speculative call for `key`, calling
+        `start` to begin one, usable for `ttl` seconds, unless an unexpired
+        one is registered already. `key` comes from the decorated tool's
+        `key_of`.
+
+        Returns:
+            tuple: `(future, started)`, the call's future and whether
+                `start` was called
+        """
+        with self._lock:
+            speculation = self._speculative.get(key)
+            if speculation is not None and speculation.expires_at > time.monotonic():
+                speculation.owners.add(owner)
+                return speculation.future, False
+            future = start()
+            self._speculative[key] = _Speculation(future, time.monotonic() + ttl, owner)
+        if speculation is not None:
+            speculation.future.cancel()
+        return future, True
+
+    def claim(self, key: Hashable) -> Optional[ServiceResponse]:
+        """Take over the speculative result for `key`, waiting until it
+        expires at most. Returns None when there is none, it failed, or it
+        had not started yet (it is cancelled and the caller runs the query
+        itself rather than wait behind the prefetch queue)."""
+        with self._lock:
+            speculation = self._speculative.pop(key, None)
+        if speculation is None:
+            return None
+        if speculation.future.cancel():
+            with self._lock:
+                self.discarded += 1
+            return None
+        remaining = speculation.expires_at - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise TimeoutError
+            response = speculation.future.result(timeout=remaining)
+        except Exception:
+            speculation.future.cancel()
+            with self._lock:
+                self.discarded += 1
+            return None
+        with self._lock:
+            self.claimed += 1
+        return response
+
+    def discard_speculative(self, keys: Optional[Iterable[Hashable]] = None, owner: Hashable = None) -> int:
+        """Drop unclaimed speculative results, cancelling calls that have
+        not started. Without `keys` all of them are dropped; otherwise
+        `owner` gives up those of `keys`, and each is dropped when it has
+        no other owner. Returns how many were dropped."""
+        with self._lock:
+            if keys is None:
+                speculations = list(self._speculative.values())
+                self._speculative.clear()
+            else:
+                speculations = []
+                for key in keys:
+                    speculation = self._speculative.get(key)
+                    if speculation is None or owner not in speculation.owners:
+                        continue  # claimed, or replaced after it expired
+                    speculation.owners.discard(owner)
+                    if not speculation.owners:
+                        speculations.append(self._speculative.pop(key))
+            self.discarded += len(speculations)
+        for speculation in speculations:
+            speculation.future.cancel()
+        return len(speculations)
+
+    def clear(self) -> None:
+        self.discard_speculative()
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits.clear()
+            self.misses.clear()
+            self.claimed = 0
+            self.discarded = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "speculative": {"pending": len(self._speculative), "claimed": self.claimed, "discarded": self.discarded},
+                "by_tool": {
+                    name: {"hits": self.hits.get(name, 0), "misses": self.misses.get(name, 0)}
+                    for name in sorted(set(self.hits) | set(self.misses))
+                },
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _count(self, counter: Dict[str, int], name: str) -> None:
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def cached(self, normalize: Normalizer) -> Callable:
+        """Decorate a tool function so its results are cached.
+
+        The wrapper keeps the tool's signature and docstring, which
+        `ServiceToolkit` uses to describe the tool to the model.
+        """
+
+        def decorator(func: Callable) -> Callable:
+            name = func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> ServiceResponse:
+                if not self.enabled or db.in_read_session():
+                    return func(*args, **kwargs)
+                try:
+                    key, settled_at = normalize(*args, **kwargs)
+                except Exception:
+                    # Malformed arguments; let the tool report the error
+                    return func(*args, **kwargs)
+                key = (name, key)
+
+                content = self.get(key)
+                if content is not None:
+                    self._count(self.hits, name)
+                    return ServiceResponse(status=ServiceExecStatus.SUCCESS, content=_with_fresh_id(content))
+
+                self._count(self.misses, name)
+                response = self.claim(key)
+                if response is None:
+                    response = func(*args, **kwargs)
+                if response.status == ServiceExecStatus.SUCCESS:
+                    data = json.loads(response.content)
+                    # "No data" messages (no query_type) may be answered once
+                    # the rows arrive, so they only live as long as live windows
+                    settled = settled_at is not None and settled_at < datetime.now() and "query_type" in data
+                    ttl = None if settled else self.live_ttl
+                    data.pop("query_id", None)
+                    self.put(key, data, len(response.content), ttl)
+                return response
+
+            def key_of(*args: Any, **kwargs: Any) -> Hashable:
+                return name, normalize(*args, **kwargs)[0]
+
+            # ServiceToolkit reads arguments with getfullargspec, which does
+            # not follow __wrapped__
+            wrapper.__signature__ = inspect.signature(func)
+            wrapper.key_of = key_of
+            return wrapper
+
+        return decorator
+
+
+def _with_fresh_id(data: Dict[str, Any]) -> str:
+    if "query_type" not in data:
+        # "no data" messages carry no query_id
+        return json.dumps(data, ensure_ascii=True)
+    return json.dumps({"query_id": str(uuid.uuid4())[:8], **data}, ensure_ascii=True)
+
+
+def _cache_from_env() -> ToolCache:
+    return ToolCache(
+        max_entries=int(os.getenv("TOOL_CACHE_SIZE", "512")),
+        max_bytes=int(os.getenv("TOOL_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+        live_ttl=float(os.getenv("TOOL_CACHE_LIVE_TTL", "15")),
+        enabled=os.getenv("TOOL_CACHE", "1").lower() in {"1", "true", "yes"},
+    )
+
+
+tool_cache = _cache_from_env()
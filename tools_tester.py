@@ -1,9 +1,4 @@
-from tools.InvaseAlarmEventsQuery import InvaseAlarmEventsQuery
-from tools.FlowQuery import FlowQuery
 from tools.FlowDistributeQuery import FlowDistribution
-from tools.LeaveRecordsQuery import LeaveRecordsQuery
-from tools.MultiInvaseAlarmIndexQuery import MultiInvaseAlarmPictureQuery
-from tools.InvaseAlarmIndexQuery import InvaseAlarmPictureQuery
 from connection import db
 from loguru import logger
 